@@ -4,12 +4,30 @@ import { useState, useRef, useEffect } from "react";
 import { Card } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
-import { Bot, Send, User, ChevronDown } from "lucide-react";
+import { Bot, Send, User, ChevronDown, Download } from "lucide-react";
 
 interface Message {
   role: "user" | "assistant";
   content: string;
   data?: any;
+  // Progress shown while the answer is still streaming in
+  status?: string;
+}
+
+interface ServerEvent {
+  event: string;
+  data: any;
+}
+
+// Parses one server-sent event; keepalive comments have no event and are skipped
+function parseEvent(frame: string): ServerEvent | null {
+  let event = "message";
+  const data: string[] = [];
+  for (const line of frame.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+  }
+  return data.length ? { event, data: JSON.parse(data.join("\n")) } : null;
 }
 
 export default function AIChatbot() {
@@ -22,8 +40,13 @@ export default function AIChatbot() {
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
   const [showScrollButton, setShowScrollButton] = useState(false);
+  const [conversationId, setConversationId] = useState<string | null>(null);
   const scrollContainerRef = useRef<HTMLDivElement>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const abortRef = useRef<AbortController | null>(null);
+
+  // Leaving the page disconnects the stream, which cancels the work on the server
+  useEffect(() => () => abortRef.current?.abort(), []);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -41,42 +64,89 @@ export default function AIChatbot() {
     }
   };
 
+  // Updates the assistant message that is still streaming in (always the last one)
+  const updateReply = (patch: Partial<Message>) => {
+    setMessages((prev) => [...prev.slice(0, -1), { ...prev[prev.length - 1], ...patch }]);
+  };
+
+  const handleEvent = ({ event, data }: ServerEvent, reply: { content: string }) => {
+    if (data.conversation_id) {
+      setConversationId(data.conversation_id);
+    }
+    switch (event) {
+      case "query":
+        updateReply({ status: `Query generated, searching ${data.collection}...` });
+        break;
+      case "rows":
+        updateReply({
+          status: `${data.count}${data.continuation ? "+" : ""} rows found, summarizing...`,
+          data: data.rows,
+        });
+        break;
+      case "token":
+        reply.content += data.text;
+        updateReply({ content: reply.content, status: undefined });
+        break;
+      case "done":
+      case "error":
+        updateReply({
+          content: data.response,
+          status: undefined,
+          ...(data.data !== undefined ? { data: data.data } : {}),
+        });
+        break;
+    }
+  };
+
   const sendMessage = async () => {
     if (!input.trim()) return;
 
     const userMessage: Message = { role: "user", content: input };
-    setMessages((prev) => [...prev, userMessage]);
+    setMessages((prev) => [
+      ...prev,
+      userMessage,
+      { role: "assistant", content: "", status: "Understanding your question..." },
+    ]);
     setInput("");
     setLoading(true);
 
+    const controller = new AbortController();
+    abortRef.current = controller;
     try {
       const response = await fetch("/api/py/chat", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ message: input }),
+        body: JSON.stringify({ message: input, conversation_id: conversationId, sse: true }),
+        signal: controller.signal,
       });
+      if (!response.ok || !response.body) {
+        throw new Error(`Chat request failed with status ${response.status}`);
+      }
 
-      const data = await response.json();
-
-      const assistantMessage: Message = {
-        role: "assistant",
-        content: data.response,
-        data: data.data,
-      };
-
-      setMessages((prev) => [...prev, assistantMessage]);
+      // Events arrive as each stage finishes; the summary streams in token by token
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const reply = { content: "" };
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const parsed = parseEvent(buffer.slice(0, boundary));
+          buffer = buffer.slice(boundary + 2);
+          if (parsed) handleEvent(parsed, reply);
+        }
+      }
     } catch (error) {
+      if (controller.signal.aborted) return;
       console.error("Error:", error);
-      setMessages((prev) => [
-        ...prev,
-        {
-          role: "assistant",
-          content: "Sorry, I encountered an error. Please try again.",
-        },
-      ]);
+      updateReply({ content: "Sorry, I encountered an error. Please try again.", status: undefined });
     } finally {
+      if (abortRef.current === controller) abortRef.current = null;
       setLoading(false);
     }
   };
@@ -129,7 +199,17 @@ export default function AIChatbot() {
                       : "bg-gray-100 text-gray-900"
                   }`}
                 >
-                  <p className="text-sm whitespace-pre-wrap">{message.content}</p>
+                  {message.status && (
+                    <div className="flex items-center gap-2 text-xs text-gray-500">
+                      <div className="flex gap-1">
+                        <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" />
+                        <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce [animation-delay:0.1s]" />
+                        <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce [animation-delay:0.2s]" />
+                      </div>
+                      <span>{message.status}</span>
+                    </div>
+                  )}
+                  {message.content && <p className="text-sm whitespace-pre-wrap">{message.content}</p>}
                   {message.data && (
                     <details className="mt-2">
                       <summary className="cursor-pointer text-xs font-semibold mb-1">
@@ -140,6 +220,17 @@ export default function AIChatbot() {
                       </pre>
                     </details>
                   )}
+                  {/* Exports re-run the conversation's latest query, so only the latest answer links to one */}
+                  {message.data && conversationId && index === messages.length - 1 && (
+                    <a
+                      href={`/api/py/chat/export?conversation_id=${encodeURIComponent(conversationId)}&format=csv`}
+                      download
+                      className="mt-2 inline-flex items-center gap-1 text-xs text-blue-600 hover:underline"
+                    >
+                      <Download className="h-3 w-3" />
+                      Download all rows (CSV)
+                    </a>
+                  )}
                 </div>
 
                 {message.role === "user" && (
@@ -150,20 +241,6 @@ export default function AIChatbot() {
               </div>
             ))}
 
-            {loading && (
-              <div className="flex gap-3">
-                <div className="h-8 w-8 rounded-full bg-gradient-to-br from-purple-500 to-blue-500 flex items-center justify-center">
-                  <Bot className="h-5 w-5 text-white" />
-                </div>
-                <div className="bg-gray-100 rounded-lg p-3">
-                  <div className="flex gap-1">
-                    <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" />
-                    <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce [animation-delay:0.1s]" />
-                    <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce [animation-delay:0.2s]" />
-                  </div>
-                </div>
-              </div>
-            )}
             <div ref={messagesEndRef} />
           </div>
         </div>
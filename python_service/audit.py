@@ -0,0 +1,227 @@
+import asyncio
+import fcntl
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from python_service.encoding import dumps
+from python_service.metrics import AUDIT_RECORDS, request_stages
+from python_service.result_cache import pipeline_hash
+
+current_record: ContextVar[Optional["AuditRecord"]] = ContextVar("current_record", default=None)
+
+
+class FileSink:
+    """JSON lines appended to `path`, rotated to path.1 ... path.N once it passes `max_bytes`.
+
+    Writes run in a thread so the event loop never waits on the disk, and
+    take an exclusive lock on the file so serve.py workers sharing it
+    don't interleave lines or rotate under each other.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    async def write(self, records: List[Dict[str, Any]]) -> None:
+        data = "".join(dumps(record, separators=(",", ":")) + "\n" for record in records)
+        await asyncio.to_thread(self._append, data.encode())
+
+    def _append(self, data: bytes) -> None:
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def describe(self) -> str:
+        return f"file:{self.path}"
+
+
+class MongoSink:
+    """Records inserted into a capped collection, which drops the oldest once it reaches `size_bytes`"""
+
+    def __init__(self, db, collection: str = "chat_audit", size_bytes: int = 512 * 1024 * 1024):
+        self.db = db
+        self.collection = collection
+        self.size_bytes = size_bytes
+        self._created = False
+
+    async def write(self, records: List[Dict[str, Any]]) -> None:
+        if not self._created:
+            try:
+                await self.db.create_collection(self.collection, capped=True, size=self.size_bytes)
+            except CollectionInvalid:
+                pass  # Already there
+            except OperationFailure as e:
+                if e.code != 48:  # NamespaceExists: another worker created it first
+                    raise
+            self._created = True
+        await self.db[self.collection].insert_many(records, ordered=False)
+
+    def describe(self) -> str:
+        return f"mongo:{self.collection}"
+
+
+class AuditRecord:
+    """One request's audit entry, filled in as the request goes along.
+
+    Creating it starts collecting the STAGE_SECONDS timings of the current
+    context (and of tasks started from it) into `stages`, and makes it the
+    current_record that note() adds to.
+    """
+
+    def __init__(self, log: "AuditLog", mode: str, question: Optional[str], conversation_id: Optional[str]):
+        self.log = log
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fields: Dict[str, Any] = {
+            "ts": datetime.now(timezone.utc),
+            "mode": mode,
+            "question": question,
+            "conversation_id": conversation_id,
+        }
+        request_stages.set(self.stages)
+        current_record.set(self)
+
+    def note(self, field: str, text: str) -> None:
+        """Add `text` to the list in `field`, e.g. what the optimizer changed"""
+        self.fields.setdefault(field, []).append(text)
+
+    def query(self, collection: str, pipeline: List[Dict[str, Any]], source: str) -> None:
+        """Note the query being run, as its hash and its compact text"""
+        self.fields.update(self._query_fields(collection, pipeline, source))
+
+    def question(self, question: str, status: str, collection: Optional[str] = None,
+                 pipeline: Optional[List[Dict[str, Any]]] = None, source: Optional[str] = None,
+                 rows: Optional[int] = None, error: Optional[str] = None) -> None:
+        """Note one question of a batch request"""
+        entry: Dict[str, Any] = {"question": question, "status": status, "rows": rows, "error": error}
+        if collection and pipeline:
+            entry.update(self._query_fields(collection, pipeline, source))
+        self.fields.setdefault("questions", []).append(entry)
+
+    def _query_fields(self, collection: str, pipeline: List[Dict[str, Any]], source: Optional[str]) -> Dict[str, Any]:
+        # Every record carries the pipeline, so none depends on another having been written and kept.
+        # As text: MongoDB won't store the $-prefixed stage names as field names
+        return {
+            "collection": collection,
+            "pipeline_hash": pipeline_hash(collection, pipeline),
+            "pipeline": dumps(pipeline, separators=(",", ":")),
+            "source": source,
+        }
+
+    def finish(self, status: str, rows: Optional[int] = None, error: Optional[str] = None, **extra: Any) -> None:
+        self.fields.update(
+            status=status,
+            rows=rows,
+            error=error,
+            total_ms=round((time.perf_counter() - self.started) * 1000, 1),
+            stages_ms={stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            **extra,
+        )
+        self.log.record(self.fields)
+
+
+def note(field: str, text: str) -> None:
+    """AuditRecord.note on the current request's record, if there is one"""
+    record = current_record.get()
+    if record is not None:
+        record.note(field, text)
+
+
+class AuditLog:
+    """Structured audit records, written in batches off the request path.
+
+    record() only puts the entry on a bounded queue. When the queue is full
+    the entry is dropped and counted (chat_audit_records_total{outcome=
+    "dropped"}) so a slow disk or database never holds up a request. run()
+    drains the queue, waiting `linger` seconds after the first record so
+    the next ones go in the same write, up to `batch_size` at a time.
+    """
+
+    def __init__(self, sink, maxsize: int = 10000, batch_size: int = 500, linger: float = 0.2):
+        self.sink = sink
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+
+    def start(self, mode: str, question: Optional[str] = None,
+              conversation_id: Optional[str] = None) -> AuditRecord:
+        return AuditRecord(self, mode, question, conversation_id)
+
+    def record(self, fields: Dict[str, Any]) -> None:
+        if self.sink is None:
+            return
+        try:
+            self.queue.put_nowait(fields)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            AUDIT_RECORDS.inc(outcome="dropped")
+
+    async def run(self) -> None:
+        """Write queued records until cancelled, then flush what is left"""
+        if self.sink is None:
+            return
+        batch: List[Dict[str, Any]] = []
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                await asyncio.sleep(self.linger)
+                pending, batch = self._take(batch), []
+                # A write that has started finishes even if the task is cancelled meanwhile
+                await asyncio.shield(self._write(pending))
+        finally:
+            remaining = self._take(batch)
+            while remaining:
+                await self._write(remaining)
+                remaining = self._take([])
+
+    def _take(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            await self.sink.write(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            self.last_error = str(e)
+            AUDIT_RECORDS.inc(len(batch), outcome="failed")
+            print(f"Writing {len(batch)} audit records failed: {e}")
+            return
+        self.written += len(batch)
+        AUDIT_RECORDS.inc(len(batch), outcome="written")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sink": self.sink.describe() if self.sink is not None else None,
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
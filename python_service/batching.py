@@ -0,0 +1,90 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from python_service.result_cache import canonicalize
+
+# Stages MongoDB rejects inside a $facet sub-pipeline (or that must open the pipeline)
+FACET_EXCLUDED = {
+    "$changeStream", "$collStats", "$currentOp", "$documents", "$facet", "$geoNear", "$indexStats",
+    "$listSessions", "$merge", "$out", "$planCacheStats", "$search", "$searchMeta", "$unionWith",
+}
+
+
+def facet_name(index: int) -> str:
+    return f"q{index}"
+
+
+def facet_safe(pipeline: List[Dict[str, Any]]) -> bool:
+    """Whether `pipeline` can run unchanged as one branch of a $facet"""
+    return bool(pipeline) and all(
+        isinstance(stage, dict) and len(stage) == 1 and not FACET_EXCLUDED & stage.keys()
+        for stage in pipeline
+    )
+
+
+def _key(stage: Any) -> str:
+    return json.dumps(canonicalize(stage), default=str)
+
+
+def _common_prefix(pipelines: List[List[Dict[str, Any]]]) -> int:
+    length = 0
+    for stages in zip(*pipelines):
+        if len({_key(stage) for stage in stages}) != 1:
+            break
+        length += 1
+    # Every branch needs at least one stage of its own
+    return min(length, min(len(p) for p in pipelines) - 1)
+
+
+def _leading_match(pipeline: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    match = pipeline[0].get("$match") if pipeline else None
+    # $text can't sit inside an $or next to unindexed branches
+    if not isinstance(match, dict) or "$text" in json.dumps(match, default=str):
+        return None
+    return match
+
+
+def _narrows(prefix: List[Dict[str, Any]]) -> bool:
+    """Whether hoisted stages bound what reaches the $facet: a leading non-empty $match, or a $limit"""
+    first = prefix[0].get("$match") if prefix else None
+    return (isinstance(first, dict) and bool(first)) or any("$limit" in stage for stage in prefix)
+
+
+def fuse(pipelines: List[List[Dict[str, Any]]], allow_scan: bool = False) -> Optional[List[Dict[str, Any]]]:
+    """One pipeline whose single output document holds pipeline i's rows under facet_name(i).
+
+    $facet branches can't use indexes, so the stages they all start with
+    are hoisted in front of the $facet (when they filter or limit the read;
+    a shared $sort alone doesn't). Otherwise, when every pipeline
+    opens with a $match, an $or of those matches goes in front (each branch
+    keeps its own $match), so the shared read is no wider than the
+    union of what the separate queries would have read. With neither the
+    fused query would scan the whole collection, which is only done when
+    `allow_scan` says the collection is small. Returns None when the
+    pipelines can't be fused.
+    """
+    if len(pipelines) < 2 or not all(facet_safe(p) for p in pipelines):
+        return None
+    shared = _common_prefix(pipelines)
+    prefix = list(pipelines[0][:shared])
+    branches = [p[shared:] for p in pipelines]
+    if prefix:
+        if not allow_scan and not _narrows(prefix):
+            return None
+    else:
+        matches = [_leading_match(p) for p in pipelines]
+        if all(match is not None for match in matches):
+            distinct = list({_key(match): match for match in matches}.values())
+            if not any(match == {} for match in distinct):
+                prefix = [{"$match": distinct[0] if len(distinct) == 1 else {"$or": distinct}}]
+            elif not allow_scan:
+                return None
+        elif not allow_scan:
+            return None
+    return prefix + [{"$facet": {facet_name(i): branch for i, branch in enumerate(branches)}}]
+
+
+def split(results: List[Dict[str, Any]], count: int) -> List[List[Dict[str, Any]]]:
+    """Each fused pipeline's rows, in the order they were passed to `fuse`"""
+    document = results[0] if results else {}
+    return [document.get(facet_name(i), []) for i in range(count)]
@@ -0,0 +1,77 @@
+"""Measures how long a fresh service process takes to answer its first request.
+
+Each run starts uvicorn in a new process and times from spawn until the first
+request succeeds, so it covers imports, model selection and the query itself.
+Runs from the repository root with the same .env as the service.
+
+    python python_service/bench_cold_start.py --runs 5            # warm: model cache kept
+    python python_service/bench_cold_start.py --runs 5 --cold     # cold: model cache deleted first
+    python python_service/bench_cold_start.py --path /health      # startup cost without Gemini
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def first_response_seconds(port: int, path: str, message: str, timeout: float) -> float:
+    url = f"http://127.0.0.1:{port}{path}"
+    body = json.dumps({"message": message}).encode() if path == "/chat" else None
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "python_service.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    return time.perf_counter() - started
+            except urllib.error.HTTPError as e:
+                # The server is up and answered, just not successfully
+                print(f"  {path} answered HTTP {e.code}")
+                return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        raise TimeoutError(f"No response from {url} within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/chat")
+    parser.add_argument("--message", default="Show me the total balance of all accounts")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--cold", action="store_true", help="delete the cached model choice before each run")
+    args = parser.parse_args()
+
+    cache_path = os.getenv("GEMINI_MODEL_CACHE", os.path.join(tempfile.gettempdir(), "nexbank_gemini_model.json"))
+    timings = []
+    for run in range(args.runs):
+        if args.cold and os.path.exists(cache_path):
+            os.remove(cache_path)
+        seconds = first_response_seconds(args.port, args.path, args.message, args.timeout)
+        timings.append(seconds)
+        print(f"run {run + 1}: {seconds * 1000:.0f} ms")
+
+    print(f"{'cold' if args.cold else 'warm'} start to first {args.path} response: "
+          f"median {statistics.median(timings) * 1000:.0f} ms, "
+          f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
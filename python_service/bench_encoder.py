@@ -0,0 +1,99 @@
+"""Compares the old per-field str() conversion with the BSON-aware encoder.
+
+Builds transaction-shaped documents (ObjectIds, datetimes and a nested
+profile, optionally Decimal128) and times turning them into a response
+body each way. Needs no database.
+
+    python python_service/bench_encoder.py --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any
+
+import bson
+from bson import Decimal128, ObjectId
+from bson.raw_bson import RawBSONDocument
+from pydantic import BaseModel
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service.encoding import BSONJSONResponse
+
+
+class Response(BaseModel):
+    response: str
+    data: Any = None
+
+
+def make_rows(count: int, decimal: bool = False):
+    start = datetime(2025, 1, 1)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "_id": ObjectId(),
+            "userId": f"user_{i % 500}",
+            "accountId": ObjectId(),
+            "amount": round(random.uniform(1, 5000), 2),
+            "type": random.choice(["deposit", "withdrawal", "transfer"]),
+            "status": "completed",
+            "description": "Deposit via Stripe",
+            "createdAt": start + timedelta(minutes=i),
+            "userProfile": {"_id": ObjectId(), "fullName": "Jane Doe", "createdAt": start},
+        })
+        if decimal:
+            rows[-1]["fee"] = Decimal128(Decimal("1.25"))
+    return rows
+
+
+def old_encoding(rows):
+    # What /chat used to do: str() every top-level value, then the usual JSON response
+    converted = []
+    for doc in rows:
+        doc = dict(doc)
+        for key, value in doc.items():
+            if hasattr(value, '__str__'):
+                doc[key] = str(value)
+        converted.append(doc)
+    content = Response(response="ok", data=converted).model_dump(mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def new_encoding(rows):
+    response = Response(response="ok", data=rows)
+    return BSONJSONResponse({**response.model_dump(exclude={"data"}), "data": response.data}).body
+
+
+def timed(label: str, func, rows, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = func(rows)
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<28} {best * 1000:8.0f} ms  {len(rows) / best:>12,.0f} rows/s  {len(body) / 1e6:6.1f} MB")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--decimal", action="store_true", help="add a Decimal128 field to every row")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.decimal)
+    raw_rows = [RawBSONDocument(bson.encode(row)) for row in rows]
+
+    old = timed("str() per field (old)", old_encoding, rows, args.repeat)
+    new = timed("BSON-aware encoder", new_encoding, rows, args.repeat)
+    raw = timed("encoder, RawBSONDocument", new_encoding, raw_rows, args.repeat)
+    print(f"speedup: {old / new:.1f}x (dict rows), {old / raw:.1f}x (raw rows)")
+
+
+if __name__ == "__main__":
+    main()
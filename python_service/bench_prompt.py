@@ -0,0 +1,119 @@
+"""Measures prompt size and query accuracy of few-shot prompts against the full prompt.
+
+Offline it reports, for a fixed question set, the system prompt tokens of
+the full prompt (every example) and of the per-question few-shot prompt,
+and whether retrieval picked the example that answers each question.
+With --gemini it also generates a pipeline for every question under both
+prompts and scores them against the canonical answer (the example's
+pipeline with the question's names and months filled in).
+
+    python python_service/bench_prompt.py
+    python python_service/bench_prompt.py --k 2
+    python python_service/bench_prompt.py --gemini --model gemini-2.5-flash
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service.pipeline_optimizer import decode_extended_json
+from python_service.prompt_library import PromptLibrary
+from python_service.result_cache import canonicalize
+from python_service.sessions import estimate_tokens
+from python_service.stub_llm import StubModel
+
+# (question, the example question that answers it)
+EVAL_SET = [
+    ("Total deposits this month", "Total deposits this month"),
+    ("How much was deposited this month?", "Total deposits this month"),
+    ("Total deposits last month", "Total deposits last month"),
+    ("Total deposits in September", "Total deposits last month"),
+    ("Total deposits", "Total deposits"),
+    ("Show me transaction history for John Smith", "Show me transaction history for Lavanya Kumar"),
+    ("List all transactions by Emily Davis", "Show me transaction history for Lavanya Kumar"),
+    ("What was the last transaction by Michael Chen?", "What was the last transaction by Lavanya Kumar?"),
+    ("Most recent transaction by Sarah Johnson", "What was the last transaction by Lavanya Kumar?"),
+    ("All withdrawals this month", "All withdrawals this month"),
+    ("Withdrawals in August", "All withdrawals this month"),
+    ("In which month was the last withdrawal made", "In which month was the last withdrawal made"),
+    ("Show me the total balance of all accounts", "Show me the total balance of all accounts"),
+    ("Sum of all account balances", "Show me the total balance of all accounts"),
+    ("Get phone number for Emily Davis", "Get phone number for Lavanya Kumar"),
+    ("What is the email address of John Smith?", "Get phone number for Lavanya Kumar"),
+]
+
+
+def same_query(generated, expected) -> bool:
+    if not isinstance(generated, dict) or generated.get("collection") != expected["collection"]:
+        return False
+    normalize = lambda p: json.dumps(canonicalize(decode_extended_json(p)), default=str)
+    return normalize(generated.get("pipeline", [])) == normalize(expected["pipeline"])
+
+
+async def generate(model_name: str, system_prompt: str, question: str):
+    import google.generativeai as genai
+    model = genai.GenerativeModel(model_name=model_name, system_instruction=system_prompt,
+                                  generation_config={"temperature": 0})
+    response = await model.generate_content_async(question)
+    text = response.text.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    try:
+        return json.loads(text), response.usage_metadata.prompt_token_count
+    except json.JSONDecodeError:
+        return None, response.usage_metadata.prompt_token_count
+
+
+async def score_with_gemini(library: PromptLibrary, model_name: str) -> None:
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+
+    oracle = StubModel()
+    full = library.full_prompt()
+    results = {"full": [], "few-shot": []}
+    tokens = {"full": [], "few-shot": []}
+    for question, _ in EVAL_SET:
+        expected = json.loads(oracle.reply(question))
+        for name, prompt in (("full", full), ("few-shot", library.system_prompt(question))):
+            generated, prompt_tokens = await generate(model_name, prompt, question)
+            results[name].append(same_query(generated, expected))
+            tokens[name].append(prompt_tokens)
+            print(f"  [{name:>8}] {'ok ' if results[name][-1] else 'MISS'} {question}")
+    for name in ("full", "few-shot"):
+        print(f"{name:>8}: {sum(results[name])}/{len(EVAL_SET)} canonical pipelines, "
+              f"mean {statistics.fmean(tokens[name]):.0f} prompt tokens (Gemini count)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=int(os.getenv("PROMPT_EXAMPLES", "3")))
+    parser.add_argument("--gemini", action="store_true", help="also score generated pipelines (needs GEMINI_API_KEY)")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    args = parser.parse_args()
+
+    library = PromptLibrary(k=args.k)
+    full_tokens = estimate_tokens(library.full_prompt())
+    few_shot_tokens = []
+    hits = 0
+    for question, answer in EVAL_SET:
+        selected = [example["question"] for example in library.select(question)]
+        few_shot_tokens.append(estimate_tokens(library.system_prompt(question)))
+        hit = answer in selected
+        hits += hit
+        print(f"{'hit ' if hit else 'MISS'} {few_shot_tokens[-1]:>5} tokens  {question!r} -> {selected}")
+
+    mean = statistics.fmean(few_shot_tokens)
+    print(f"\nfull prompt: ~{full_tokens} tokens; few-shot (k={args.k}): ~{mean:.0f} tokens on average "
+          f"({1 - mean / full_tokens:.0%} fewer)")
+    print(f"retrieval: answering example selected for {hits}/{len(EVAL_SET)} questions")
+
+    if args.gemini:
+        asyncio.run(score_with_gemini(library, args.model))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Replays a workload of /chat requests at a fixed concurrency and reports latency.
+
+By default starts the service itself with the stub LLM (CHAT_LLM_BACKEND=stub)
+against a benchmark database, so results don't depend on Gemini. Seed the
+database first with seed_data.py. Each workload line is a ChatRequest body;
+the file is cycled until --requests have been sent.
+
+    python python_service/seed_data.py --drop
+    python python_service/bench_replay.py --concurrency 16 --requests 2000
+    python python_service/bench_replay.py --save baseline.json
+    python python_service/bench_replay.py --compare baseline.json    # exit 1 on regression
+    python python_service/bench_replay.py --url http://localhost:8000  # an already running service
+    python python_service/bench_replay.py --workers 1 2 4    # scaling across serve.py worker counts
+
+With --workers the service is started through serve.py (pre-forked workers
+sharing a fresh SQLite store per run) and a throughput table per worker
+count is printed.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKLOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_workload.jsonl")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def load_workload(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def send(url: str, body: Dict[str, Any], timeout: float):
+    """(seconds, ok, error) for one request, reading the whole response"""
+    data = json.dumps(body).encode()
+    request = urllib.request.Request(url + "/chat", data=data, headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = response.read()
+        elapsed = time.perf_counter() - started
+        if body.get("stream"):
+            return elapsed, True, None
+        error = json.loads(payload).get("response", "")
+        if error.startswith("An error occurred"):
+            return elapsed, False, error
+        return elapsed, True, None
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        return time.perf_counter() - started, False, str(e)
+
+
+def wait_until_up(url: str, timeout: float) -> None:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url + "/health", timeout=5) as response:
+                health = json.loads(response.read())
+                if health.get("mongodb_connected"):
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Service at {url} not ready within {timeout}s")
+
+
+def start_service(port: int, uri: str, latency_ms: float, workers: Optional[int] = None,
+                  store_dir: Optional[str] = None) -> subprocess.Popen:
+    env = dict(os.environ, CHAT_LLM_BACKEND="stub", DATABASE_URL=uri, STUB_LLM_LATENCY_MS=str(latency_ms),
+               METADATA_REFRESH_SECONDS="1")
+    if workers is None:
+        command = [sys.executable, "-m", "uvicorn", "python_service.main:app", "--port", str(port),
+                   "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "python_service.serve", "--workers", str(workers), "--host", "127.0.0.1",
+                   "--port", str(port), "--store", os.path.join(store_dir, "shared.sqlite3"),
+                   "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+
+
+def replay(url: str, workload: List[Dict[str, Any]], total: int, concurrency: int, timeout: float) -> Dict[str, Any]:
+    bodies = itertools.islice(itertools.cycle(workload), total)
+    lock = threading.Lock()
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    def run(body):
+        elapsed, ok, error = send(url, body, timeout)
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors.append(error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, bodies))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "throughput_rps": len(latencies) / wall,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        if report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]:.1f} -> {report[key]:.1f}")
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput_rps: {baseline['throughput_rps']:.1f} -> {report['throughput_rps']:.1f}")
+    if report["errors"] > baseline["errors"]:
+        regressions.append(f"errors: {baseline['errors']} -> {report['errors']}")
+    return regressions
+
+
+def measure(args: argparse.Namespace, workload: List[Dict[str, Any]], workers: Optional[int]) -> Dict[str, Any]:
+    process = None
+    url = args.url
+    with tempfile.TemporaryDirectory() as store_dir:
+        if not url:
+            url = f"http://127.0.0.1:{args.port}"
+            process = start_service(args.port, args.uri, args.llm_latency_ms, workers, store_dir)
+        try:
+            wait_until_up(url, args.timeout)
+            if args.warmup:
+                replay(url, workload, args.warmup, args.concurrency, args.timeout)
+            return replay(url, workload, args.requests, args.concurrency, args.timeout)
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    parser.add_argument("--url", help="benchmark a running service instead of starting one")
+    parser.add_argument("--uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017/nexbank_bench"))
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="stub LLM delay per call")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--save", help="write the report as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--workers", type=int, nargs="+", help="serve.py worker counts to compare")
+    args = parser.parse_args()
+
+    if args.workers and len(args.workers) > 1 and (args.save or args.compare):
+        parser.error("--save and --compare take a single --workers count")
+    if args.workers and args.url:
+        parser.error("--workers starts the service itself, so it can't be combined with --url")
+
+    workload = load_workload(args.workload)
+    reports = []
+    for workers in args.workers or [None]:
+        if workers is not None:
+            print(f"--- {workers} worker{'s' if workers > 1 else ''}")
+        report = measure(args, workload, workers)
+        reports.append((workers, report))
+        print(f"{report['requests']} requests at concurrency {report['concurrency']}: "
+              f"{report['throughput_rps']:.1f} req/s, {report['errors']} errors")
+        print(f"latency ms: p50 {report['p50_ms']:.1f}, p95 {report['p95_ms']:.1f}, "
+              f"p99 {report['p99_ms']:.1f}, max {report['max_ms']:.1f}, mean {report['mean_ms']:.1f}")
+        for error in report["error_samples"]:
+            print(f"  error: {error}")
+
+    if len(reports) > 1:
+        base = reports[0][1]["throughput_rps"]
+        print(f"\n{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for workers, report in reports:
+            speedup = report["throughput_rps"] / base if base else 0.0
+            print(f"{workers:>7} {report['throughput_rps']:>9.1f} {speedup:>7.2f}x "
+                  f"{report['p50_ms']:>8.1f} {report['p95_ms']:>8.1f}")
+    report = reports[-1][1]
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import base64
+import json
+import math
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+from bson import Binary, Code, Decimal128, MaxKey, MinKey, ObjectId, Regex, Timestamp
+from bson.raw_bson import RawBSONDocument
+from fastapi.responses import JSONResponse
+
+
+def _datetime(value: datetime) -> str:
+    text = value.isoformat()
+    return text + "Z" if value.tzinfo is None else text
+
+
+def _decimal(value: Decimal) -> Optional[float]:
+    # NaN and Infinity aren't JSON numbers
+    return float(value) if value.is_finite() else None
+
+
+def _raw_document(value: RawBSONDocument) -> Dict[str, Any]:
+    # Decoded lazily one level at a time; nested raw documents come back through bson_default
+    return dict(value.items())
+
+
+# Exact-type lookups first: a dict hit is much cheaper than a chain of isinstance checks
+_ENCODERS: Dict[type, Callable[[Any], Any]] = {
+    ObjectId: str,
+    datetime: _datetime,
+    date: date.isoformat,
+    Decimal128: lambda value: _decimal(value.to_decimal()),
+    Decimal: _decimal,
+    RawBSONDocument: _raw_document,
+    uuid.UUID: str,
+    bytes: lambda value: base64.b64encode(value).decode(),
+    Binary: lambda value: base64.b64encode(value).decode(),
+    Timestamp: lambda value: _datetime(value.as_datetime()),
+    Regex: lambda value: value.pattern,
+    Code: str,
+    MinKey: str,
+    MaxKey: str,
+    set: list,
+    frozenset: list,
+}
+
+
+def bson_default(value: Any) -> Any:
+    """`json.dumps` fallback for the BSON types MongoDB hands back.
+
+    Only called for values the C encoder can't write itself, so plain
+    numbers, strings, lists and dicts never pass through Python code.
+    Numbers stay numbers (Decimal128 becomes a float, exact for amounts of
+    up to 15 significant digits; NaN and Infinity become null), ids become
+    their hex string and dates ISO 8601. Naive datetimes from pymongo are UTC.
+    """
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        # Subclasses, e.g. timezone-aware datetime types or custom document classes
+        for base, candidate in _ENCODERS.items():
+            if isinstance(value, base):
+                encoder = candidate
+                break
+        else:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return encoder(value)
+
+
+def _finite(value: Any) -> Any:
+    """`value` with NaN and infinite floats replaced by None, which JSON can represent"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def dumps(content: Any, **kwargs: Any) -> str:
+    """JSON for `content`; NaN and infinite floats are written as null.
+
+    The C encoder rejects them (allow_nan=False) and only then is the
+    content walked to replace them, so the common case costs nothing extra.
+    """
+    try:
+        return json.dumps(content, default=bson_default, ensure_ascii=False, allow_nan=False, **kwargs)
+    except ValueError:
+        return json.dumps(_finite(content), default=lambda value: _finite(bson_default(value)),
+                          ensure_ascii=False, allow_nan=False, **kwargs)
+
+
+class BSONJSONResponse(JSONResponse):
+    """JSON response that writes MongoDB documents as they come from the driver.
+
+    Replaces converting every document field to a string before returning
+    it: nested documents and arrays are handled and numeric types survive.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content, separators=(",", ":")).encode("utf-8")
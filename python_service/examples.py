@@ -0,0 +1,110 @@
+"""Canonical question -> query examples, the few-shot library the system prompt draws from.
+
+`aliases` are other phrasings of the same question; they are shown with
+the example and help retrieval find it. Month ranges are rewritten to the
+current date when the prompt is rendered (prompt_library.current_pipeline).
+"""
+from typing import Any, Dict, List
+
+DEPOSIT_FILTER = {
+    "$or": [
+        {"type": {"$regex": "deposit|credit", "$options": "i"}},
+        {"description": {"$regex": "deposit", "$options": "i"}},
+    ]
+}
+WITHDRAWAL_FILTER = {
+    "$or": [
+        {"type": {"$regex": "withdrawal", "$options": "i"}},
+        {"type": {"$regex": "debit", "$options": "i"}},
+        {"description": {"$regex": "withdrawal", "$options": "i"}},
+    ]
+}
+DECEMBER_2025 = {"createdAt": {"$gte": {"$date": "2025-12-01T00:00:00.000Z"}, "$lt": {"$date": "2026-01-01T00:00:00.000Z"}}}
+NOVEMBER_2025 = {"createdAt": {"$gte": {"$date": "2025-11-01T00:00:00.000Z"}, "$lt": {"$date": "2025-12-01T00:00:00.000Z"}}}
+TRANSACTION_FIELDS = {"amount": 1, "type": 1, "description": 1, "createdAt": 1, "status": 1}
+PROFILE_JOIN = [
+    {"$lookup": {"from": "profiles", "localField": "userId", "foreignField": "clerkId", "as": "userProfile"}},
+    {"$unwind": "$userProfile"},
+    {"$match": {"userProfile.fullName": {"$regex": "Lavanya Kumar", "$options": "i"}}},
+]
+
+EXAMPLES: List[Dict[str, Any]] = [
+    {
+        "question": "Total deposits this month",
+        "collection": "transactions",
+        "pipeline": [
+            {"$match": {"$and": [DEPOSIT_FILTER, DECEMBER_2025]}},
+            {"$sort": {"createdAt": -1}},
+            {"$project": TRANSACTION_FIELDS},
+        ],
+    },
+    {
+        "question": "Total deposits last month",
+        "aliases": ["Total deposits in <month>", "deposits in <month>"],
+        "collection": "transactions",
+        "pipeline": [
+            {"$match": {"$and": [DEPOSIT_FILTER, NOVEMBER_2025]}},
+            {"$sort": {"createdAt": -1}},
+            {"$project": TRANSACTION_FIELDS},
+        ],
+    },
+    {
+        "question": "Total deposits",
+        "aliases": ["all time deposits"],
+        "collection": "transactions",
+        "pipeline": [
+            {"$match": DEPOSIT_FILTER},
+            {"$sort": {"createdAt": -1}},
+            {"$project": TRANSACTION_FIELDS},
+        ],
+    },
+    {
+        "question": "Show me transaction history for Lavanya Kumar",
+        "collection": "transactions",
+        "pipeline": PROFILE_JOIN + [
+            {"$sort": {"createdAt": -1}},
+            {"$project": {"amount": 1, "type": 1, "status": 1, "description": 1, "createdAt": 1, "userProfile.fullName": 1}},
+        ],
+    },
+    {
+        "question": "What was the last transaction by Lavanya Kumar?",
+        "collection": "transactions",
+        "pipeline": PROFILE_JOIN + [
+            {"$sort": {"createdAt": -1}},
+            {"$limit": 1},
+            {"$project": TRANSACTION_FIELDS},
+        ],
+    },
+    {
+        "question": "All withdrawals this month",
+        "collection": "transactions",
+        "pipeline": [
+            {"$match": {"$and": [WITHDRAWAL_FILTER, DECEMBER_2025]}},
+            {"$sort": {"createdAt": -1}},
+        ],
+    },
+    {
+        "question": "In which month was the last withdrawal made",
+        "collection": "transactions",
+        "pipeline": [
+            {"$match": WITHDRAWAL_FILTER},
+            {"$sort": {"createdAt": -1}},
+            {"$limit": 1},
+            {"$project": {"amount": 1, "type": 1, "description": 1, "createdAt": 1,
+                          "month": {"$month": "$createdAt"}, "year": {"$year": "$createdAt"}}},
+        ],
+    },
+    {
+        "question": "Show me the total balance of all accounts",
+        "collection": "accounts",
+        "pipeline": [{"$group": {"_id": None, "totalBalance": {"$sum": "$balance"}}}],
+    },
+    {
+        "question": "Get phone number for Lavanya Kumar",
+        "collection": "profiles",
+        "pipeline": [
+            {"$match": {"fullName": {"$regex": "Lavanya Kumar", "$options": "i"}}},
+            {"$project": {"fullName": 1, "email": 1, "phone": 1, "address": 1}},
+        ],
+    },
+]
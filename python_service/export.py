@@ -0,0 +1,210 @@
+import csv
+import io
+from typing import Any, Dict, List, Optional
+
+from bson import Decimal128
+
+from python_service.encoding import bson_default, dumps
+from python_service.profiler import type_name
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Only CSV exports are available without it
+    pa = None
+
+FORMATS = ("csv", "arrow", "parquet")
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXTENSIONS = {"csv": "csv", "arrow": "arrows", "parquet": "parquet"}
+NUMBER_TYPES = {"int", "double", "decimal"}
+# Last column of every export: fields missing from the first batch, and values that didn't fit their column
+OVERFLOW_COLUMN = "_extra"
+
+
+def available(fmt: str) -> bool:
+    return fmt == "csv" or (fmt in FORMATS and pa is not None)
+
+
+def columns(rows: List[Dict[str, Any]]) -> List[str]:
+    """Field names in the order they first appear in `rows`"""
+    names: Dict[str, None] = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    return list(names)
+
+
+def column_kind(values: List[Any]) -> str:
+    """number, date, bool or string, from the BSON types of the non-null values"""
+    kinds = {type_name(value) for value in values} - {"null"}
+    if kinds and kinds <= NUMBER_TYPES:
+        return "number"
+    if kinds == {"date"} or kinds == {"bool"}:
+        return kinds.pop()
+    # Ids, text, nested documents and mixed types are written as text
+    return "string"
+
+
+def text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return dumps(value, separators=(",", ":"))
+    if isinstance(value, (bool, int, float)):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value)  # Exact, as stored
+    encoded = bson_default(value)
+    return None if encoded is None else str(encoded)
+
+
+def fits(value: Any, kind: str) -> bool:
+    found = type_name(value)
+    return kind == "string" or found == "null" or found == kind or (kind == "number" and found in NUMBER_TYPES)
+
+
+def typed(value: Any, kind: str) -> Any:
+    """`value` as a cell of a `kind` column; values that don't fit the column are left empty"""
+    if kind == "string":
+        return text(value)
+    if value is None or not fits(value, kind):
+        return None
+    if kind == "number":
+        return float(value.to_decimal()) if isinstance(value, Decimal128) else float(value)
+    return value
+
+
+def overflow(row: Dict[str, Any], kinds: Dict[str, str]) -> Dict[str, Any]:
+    """The fields of `row` that have no column in `kinds`, or whose value doesn't fit its column"""
+    return {name: value for name, value in row.items() if name not in kinds or not fits(value, kinds[name])}
+
+
+class Overflow:
+    """Counts the rows that needed the overflow column, and why, for the audit record"""
+
+    def __init__(self):
+        self.rows = 0
+        self.new_fields: Dict[str, None] = {}
+        self.mismatches = 0
+
+    def cell(self, row: Dict[str, Any], kinds: Dict[str, str]) -> Optional[str]:
+        extra = overflow(row, kinds)
+        if not extra:
+            return None
+        self.rows += 1
+        for name in extra:
+            if name in kinds:
+                self.mismatches += 1
+            else:
+                self.new_fields[name] = None
+        return text(extra)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"overflow_rows": self.rows, "new_fields": list(self.new_fields), "type_mismatches": self.mismatches}
+
+
+class ChunkSink(io.RawIOBase):
+    """A file for pyarrow writers whose contents are handed out and dropped as they are written.
+
+    tell() keeps counting from the start of the file, since Parquet
+    footers record absolute offsets.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class CsvExport:
+    """CSV with a header row.
+
+    The columns are those seen in the first batch, since the header has
+    been sent by the time later batches are read; fields that only appear
+    later go, as JSON, in the OVERFLOW_COLUMN at the end.
+    """
+
+    def __init__(self, first_batch: List[Dict[str, Any]]):
+        self.kinds = dict.fromkeys(columns(first_batch), "string")
+        self.overflow = Overflow()
+
+    def start(self) -> bytes:
+        return self._lines([[*self.kinds, OVERFLOW_COLUMN]])
+
+    def write(self, rows: List[Dict[str, Any]]) -> bytes:
+        return self._lines([[*(text(row.get(name)) for name in self.kinds), self.overflow.cell(row, self.kinds)]
+                            for row in rows])
+
+    def finish(self) -> bytes:
+        return b""
+
+    def _lines(self, rows: List[List[Any]]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+
+class ArrowExport:
+    """Arrow IPC stream or Parquet, with column types inferred from the first batch.
+
+    Numbers (amounts and balances included, Decimal128 too) are float64,
+    dates UTC millisecond timestamps and ObjectIds their hex string. Each
+    batch is one record batch or Parquet row group. The schema can't change
+    once the stream has started, so fields first seen in a later batch, and
+    values that don't fit their column's type (a string among numbers),
+    are kept as JSON in the OVERFLOW_COLUMN rather than dropped.
+    """
+
+    def __init__(self, first_batch: List[Dict[str, Any]], parquet: bool = False):
+        names = columns(first_batch)
+        self.kinds = {name: column_kind([row.get(name) for row in first_batch]) for name in names}
+        arrow_types = {"number": pa.float64(), "date": pa.timestamp("ms", tz="UTC"),
+                       "bool": pa.bool_(), "string": pa.string()}
+        self.schema = pa.schema([(name, arrow_types[kind]) for name, kind in self.kinds.items()]
+                                + [(OVERFLOW_COLUMN, pa.string())])
+        self.overflow = Overflow()
+        self.sink = ChunkSink()
+        if parquet:
+            self.writer = pa.parquet.ParquetWriter(self.sink, self.schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def start(self) -> bytes:
+        return self.sink.take()
+
+    def write(self, rows: List[Dict[str, Any]]) -> bytes:
+        arrays = [pa.array([typed(row.get(name), kind) for row in rows], type=field.type)
+                  for (name, kind), field in zip(self.kinds.items(), self.schema)]
+        arrays.append(pa.array([self.overflow.cell(row, self.kinds) for row in rows], type=pa.string()))
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        return self.sink.take()
+
+    def finish(self) -> bytes:
+        self.writer.close()
+        return self.sink.take()
+
+
+def exporter(fmt: str, first_batch: List[Dict[str, Any]]):
+    if fmt == "csv":
+        return CsvExport(first_batch)
+    return ArrowExport(first_batch, parquet=fmt == "parquet")
@@ -0,0 +1,118 @@
+"""Index provisioning for the collections the chatbot queries.
+
+    python -m python_service.indexes apply   # create missing indexes
+    python -m python_service.indexes check   # explain example queries, report COLLSCANs
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, IndexModel
+from pymongo.errors import PyMongoError
+
+from python_service.examples import EXAMPLES
+from python_service.pipeline_optimizer import PipelineOptimizer, plan_summary
+
+# Every filter and sort in the prompt's query patterns, per collection
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "transactions": [
+        IndexModel([("createdAt", DESCENDING)], name="createdAt_-1"),
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)], name="userId_1_createdAt_-1"),
+        IndexModel([("type", ASCENDING), ("createdAt", DESCENDING)], name="type_1_createdAt_-1"),
+    ],
+    "profiles": [
+        IndexModel([("clerkId", ASCENDING)], name="clerkId_1"),
+        IndexModel([("fullName", ASCENDING)], name="fullName_1"),
+    ],
+    "accounts": [
+        IndexModel([("userId", ASCENDING)], name="userId_1"),
+    ],
+    "loans": [
+        IndexModel([("userId", ASCENDING), ("status", ASCENDING)], name="userId_1_status_1"),
+        IndexModel([("status", ASCENDING), ("createdAt", DESCENDING)], name="status_1_createdAt_-1"),
+    ],
+    "emipayments": [
+        IndexModel([("loanId", ASCENDING), ("dueDate", ASCENDING)], name="loanId_1_dueDate_1"),
+        IndexModel([("status", ASCENDING), ("dueDate", ASCENDING)], name="status_1_dueDate_1"),
+    ],
+}
+
+# Queries not covered by EXAMPLES that should still be index-backed
+CHECK_PIPELINES: List[Dict[str, Any]] = [
+    {"question": "Pending loans", "collection": "loans",
+     "pipeline": [{"$match": {"status": "pending"}}, {"$sort": {"createdAt": -1}}]},
+    {"question": "Upcoming EMIs", "collection": "emipayments",
+     "pipeline": [{"$match": {"status": "pending"}}, {"$sort": {"dueDate": 1}}]},
+    {"question": "Accounts for a user", "collection": "accounts",
+     "pipeline": [{"$match": {"userId": "user_example"}}]},
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every index in INDEX_SPECS. Existing identical indexes are left as is."""
+    created = {}
+    for collection, indexes in INDEX_SPECS.items():
+        try:
+            created[collection] = await db[collection].create_indexes(indexes)
+        except PyMongoError as e:
+            print(f"✗ Could not create indexes on {collection}: {e}")
+    return created
+
+
+async def check_indexes(db) -> List[Dict[str, Any]]:
+    """Explain each example query as the service would run it and flag collection scans"""
+    optimizer = PipelineOptimizer(db)
+    report = []
+    for example in EXAMPLES + CHECK_PIPELINES:
+        pipeline = await optimizer.optimize(example["collection"], example["pipeline"])
+        explain = await db.command(
+            {"explain": {"aggregate": example["collection"], "pipeline": pipeline, "cursor": {}},
+             "verbosity": "queryPlanner"}
+        )
+        plan = plan_summary(explain)
+        # A pipeline with no leading $match has nothing an index could serve
+        filtered = bool(pipeline) and "$match" in pipeline[0]
+        report.append({
+            "question": example["question"],
+            "collection": example["collection"],
+            "plan": plan,
+            "collscan": "COLLSCAN" in plan and filtered,
+        })
+    return report
+
+
+async def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["apply", "check"])
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path="../.env")
+    load_dotenv()
+    uri = os.getenv("DATABASE_URL") or os.getenv("MONGODB_URI")
+    if not uri:
+        print("DATABASE_URL is not set in .env")
+        return 2
+
+    client = AsyncMongoClient(uri)
+    db = client.get_database()
+    try:
+        if args.command == "apply":
+            for collection, names in (await ensure_indexes(db)).items():
+                print(f"✓ {collection}: {', '.join(names)}")
+            return 0
+
+        failures = 0
+        for row in await check_indexes(db):
+            mark = "✗" if row["collscan"] else "✓"
+            failures += row["collscan"]
+            print(f"{mark} [{row['collection']}] {row['question']}: {row['plan']}")
+        return 1 if failures else 0
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,281 @@
+"""Compiles common admin questions to pipelines locally, without asking Gemini.
+
+The question is reduced to a template: its date phrase ("last month",
+"in November", "last 30 days", ...) becomes {period} and a capitalised
+name after a preposition becomes {name}. The template must then match
+one of the INTENTS patterns in full; anything else (extra conditions,
+unfamiliar wording, lowercase names) returns None and goes to Gemini.
+A capitalised word isn't necessarily a customer ("deposits from Stripe"),
+so callers check the {name} against profiles with ProfileNames first.
+The pipelines follow the patterns in examples.py, with dates computed
+from today rather than the date the prompt was written.
+"""
+import re
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+from python_service.cache import TTLCache
+from python_service.examples import DEPOSIT_FILTER, TRANSACTION_FIELDS, WITHDRAWAL_FILTER
+from python_service.pipeline_cache import MONTHS, NAME_PATTERN, month_range, normalize_question, today
+
+Period = Optional[Tuple[date, date]]
+
+CATEGORY_FILTERS = {"deposit": DEPOSIT_FILTER, "withdrawal": WITHDRAWAL_FILTER}
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+                "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+MAX_RECENT = 100
+
+MONTH_NAMES = "|".join(MONTHS)
+PERIOD_PATTERNS = [
+    ("rolling", re.compile(r"\b(?:(?:in|during|over|for) )?(?:the )?(?:last|past|previous) (\d+) (day|week|month)s?\b",
+                           re.IGNORECASE)),
+    ("relative", re.compile(r"\b(?:(?:in|during|for) )?(this|current|last|previous|past) (week|month|year)\b",
+                            re.IGNORECASE)),
+    ("day", re.compile(r"\b(today|yesterday)\b", re.IGNORECASE)),
+    ("month", re.compile(r"\b(?:(?:in|during|for) )?(" + MONTH_NAMES + r")(?:,? (\d{4}))?\b", re.IGNORECASE)),
+    ("year", re.compile(r"\b(?:in|during|for) (\d{4})\b", re.IGNORECASE)),
+    ("all", re.compile(r"\b(?:of )?(?:all time|ever|so far|to date)\b", re.IGNORECASE)),
+]
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(index, 12)
+    start, end = month_range(year, month + 1)
+    return date(year, month + 1, min(day.day, (end - start).days))
+
+
+def parse_period(text: str, current: date) -> Tuple[str, Period]:
+    """(text with its date phrase replaced by {period}, [start, end) or None for "all time" or no phrase)"""
+    for kind, pattern in PERIOD_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        period: Period = None
+        if kind == "rolling":
+            count, unit = int(match.group(1)), match.group(2).lower()
+            start = _add_months(current, -count) if unit == "month" else \
+                current - timedelta(days=count * (7 if unit == "week" else 1))
+            period = (start, current + timedelta(days=1))
+        elif kind == "relative":
+            which, unit = match.group(1).lower(), match.group(2).lower()
+            back = which in ("last", "previous", "past")
+            if unit == "week":
+                start = current - timedelta(days=current.weekday() + (7 if back else 0))
+                period = (start, start + timedelta(days=7))
+            elif unit == "month":
+                start = _add_months(current.replace(day=1), -1 if back else 0)
+                period = month_range(start.year, start.month)
+            else:
+                year = current.year - 1 if back else current.year
+                period = (date(year, 1, 1), date(year + 1, 1, 1))
+        elif kind == "day":
+            day = current - timedelta(days=1 if match.group(1).lower() == "yesterday" else 0)
+            period = (day, day + timedelta(days=1))
+        elif kind == "month":
+            month = MONTHS[match.group(1).lower()]
+            if match.group(2):
+                year = int(match.group(2))
+            else:
+                # Most recent occurrence of that month
+                year = current.year if month <= current.month else current.year - 1
+            period = month_range(year, month)
+        elif kind == "year":
+            year = int(match.group(1))
+            period = (date(year, 1, 1), date(year + 1, 1, 1))
+        return text[: match.start()] + "{period}" + text[match.end():], period
+    return text, None
+
+
+def _date(day: date) -> Dict[str, str]:
+    return {"$date": f"{day.isoformat()}T00:00:00.000Z"}
+
+
+def _period_filter(field: str, period: Period) -> List[Dict[str, Any]]:
+    if period is None:
+        return []
+    return [{field: {"$gte": _date(period[0]), "$lt": _date(period[1])}}]
+
+
+def _match(conditions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not conditions:
+        return []
+    return [{"$match": conditions[0] if len(conditions) == 1 else {"$and": conditions}}]
+
+
+def _literal(name: str) -> str:
+    return re.sub(r"([.^$*+?()\[\]{}|\\])", r"\\\1", name)
+
+
+def _profile_join(name: str) -> List[Dict[str, Any]]:
+    return [
+        {"$lookup": {"from": "profiles", "localField": "userId", "foreignField": "clerkId", "as": "userProfile"}},
+        {"$unwind": "$userProfile"},
+        {"$match": {"userProfile.fullName": {"$regex": _literal(name), "$options": "i"}}},
+    ]
+
+
+def _count(word: Optional[str]) -> int:
+    if not word:
+        return 1
+    return min(int(word) if word.isdigit() else NUMBER_WORDS[word], MAX_RECENT)
+
+
+# Compilers take the intent's regex groups, the {name} value and the period
+def category_transactions(groups: Dict[str, str], name: Optional[str], period: Period) -> Dict[str, Any]:
+    conditions = [CATEGORY_FILTERS[groups["category"]]] + _period_filter("createdAt", period)
+    pipeline = _match(conditions) + (_profile_join(name) if name else [])
+    return {"collection": "transactions",
+            "pipeline": pipeline + [{"$sort": {"createdAt": -1}}, {"$project": TRANSACTION_FIELDS}]}
+
+
+def transaction_history(groups: Dict[str, str], name: Optional[str], period: Period) -> Dict[str, Any]:
+    fields = {**TRANSACTION_FIELDS, "userProfile.fullName": 1}
+    return {"collection": "transactions",
+            "pipeline": _match(_period_filter("createdAt", period)) + _profile_join(name)
+            + [{"$sort": {"createdAt": -1}}, {"$project": fields}]}
+
+
+def recent_transactions(groups: Dict[str, str], name: Optional[str], period: Period) -> Dict[str, Any]:
+    pipeline = _match(_period_filter("createdAt", period)) + (_profile_join(name) if name else [])
+    return {"collection": "transactions",
+            "pipeline": pipeline + [{"$sort": {"createdAt": -1}}, {"$limit": _count(groups.get("count"))},
+                                    {"$project": TRANSACTION_FIELDS}]}
+
+
+def last_category_month(groups: Dict[str, str], name: Optional[str], period: Period) -> Dict[str, Any]:
+    return {"collection": "transactions", "pipeline": [
+        {"$match": CATEGORY_FILTERS[groups["category"]]},
+        {"$sort": {"createdAt": -1}},
+        {"$limit": 1},
+        {"$project": {"amount": 1, "type": 1, "description": 1, "createdAt": 1,
+                      "month": {"$month": "$createdAt"}, "year": {"$year": "$createdAt"}}},
+    ]}
+
+
+def total_balance(groups: Dict[str, str], name: Optional[str], period: Period) -> Dict[str, Any]:
+    return {"collection": "accounts", "pipeline": [{"$group": {"_id": None, "totalBalance": {"$sum": "$balance"}}}]}
+
+
+def account_balance(groups: Dict[str, str], name: Optional[str], period: Period) -> Dict[str, Any]:
+    return {"collection": "accounts", "pipeline": _profile_join(name) + [
+        {"$project": {"accountNumber": 1, "accountType": 1, "balance": 1, "currency": 1, "status": 1,
+                      "userProfile.fullName": 1}},
+    ]}
+
+
+def contact_details(groups: Dict[str, str], name: Optional[str], period: Period) -> Dict[str, Any]:
+    return {"collection": "profiles", "pipeline": [
+        {"$match": {"fullName": {"$regex": _literal(name), "$options": "i"}}},
+        {"$project": {"fullName": 1, "email": 1, "phone": 1, "address": 1}},
+    ]}
+
+
+PREFIX = (r"(?:(?:can you |could you |please )?(?:show|list|get|give|find|display|fetch|tell|what (?:is|are|was|were))"
+          r"(?: me| us)?(?: the| all| all the)? )?")
+CATEGORY = r"(?P<category>deposit|withdrawal)s?"
+BY_NAME = r" (?:made )?(?:by|for|of|from) \{name\}"
+COUNT = r"(?P<count>\d+|" + "|".join(NUMBER_WORDS) + r")"
+CONTACT_FIELD = r"(?:phone(?: number)?|mobile(?: number)?|email(?: address)?|address|contact(?: details| info)?|details)"
+
+# (name, pattern over the normalized template, needs a {name}, compiler)
+INTENTS: List[Tuple[str, str, Optional[bool], Callable[..., Dict[str, Any]]]] = [
+    ("category_transactions",
+     PREFIX + r"(?:(?:total|sum of|all|the|amount of|total amount of|how many) )*" + CATEGORY
+     + r"(?: transactions?)?(?: (?:were |was )?made)?(?:" + BY_NAME + r")?(?: \{period\})?(?:" + BY_NAME + r")?",
+     None, category_transactions),
+    ("category_transactions",
+     r"how much (?:money )?(?:was|has been|got) (?P<category>deposit|withdraw)(?:ed|n)(?:" + BY_NAME
+     + r")?(?: \{period\})?",
+     None, lambda groups, name, period: category_transactions(
+         {"category": "deposit" if groups["category"] == "deposit" else "withdrawal"}, name, period)),
+    ("transaction_history",
+     PREFIX + r"(?:(?:all|the) )?(?:transaction history|transactions|history|statement|account activity)"
+     + BY_NAME + r"(?: \{period\})?",
+     True, transaction_history),
+    ("recent_transactions",
+     PREFIX + r"(?:the )?(?:last|latest|most recent|recent|newest)(?: " + COUNT + r")? transactions?"
+     + r"(?:" + BY_NAME + r")?(?: \{period\})?",
+     None, recent_transactions),
+    ("last_category_month",
+     r"(?:in )?(?:which|what) month (?:was|did) (?:the )?(?:last|latest|most recent) " + CATEGORY
+     + r"(?: made| happen| occur| take place)?",
+     False, last_category_month),
+    ("last_category_month",
+     r"when (?:was|did) (?:the )?(?:last|latest|most recent) " + CATEGORY + r"(?: made| happen| occur)?",
+     False, last_category_month),
+    ("total_balance",
+     PREFIX + r"(?:(?:total|sum of|combined|overall|all|the|of) )*(?:account )?balances?"
+     + r"(?: (?:of|across|in|for) (?:all )?(?:the )?(?:bank )?accounts?)?",
+     False, total_balance),
+    ("account_balance",
+     PREFIX + r"(?:(?:account|current) )?balances?(?: of| for)? (?:the )?(?:accounts? )?(?:of|for|by) \{name\}",
+     True, account_balance),
+    ("contact_details",
+     PREFIX + r"(?:" + CONTACT_FIELD + r"(?:(?: and|,)? " + CONTACT_FIELD + r")*) (?:of|for) \{name\}",
+     True, contact_details),
+]
+COMPILED = [(name, re.compile(pattern), needs_name, compiler) for name, pattern, needs_name, compiler in INTENTS]
+
+
+class IntentParser:
+    """Turns a recognised question into the same {"collection", "pipeline"} reply Gemini gives"""
+
+    def __init__(self, clock: Callable[[], date] = today):
+        self.clock = clock
+
+    def template(self, question: str) -> Tuple[str, Optional[str], Period]:
+        """(normalized template, the {name} value, the {period} range)"""
+        text, period = parse_period(question.strip().rstrip("?.!"), self.clock())
+        names = []
+        for match in NAME_PATTERN.finditer(text):
+            words = [w.rstrip(".") for w in match.group(1).split() if w.lower() not in MONTHS]
+            if words:
+                names.append(" ".join(words))
+        if len(names) > 1:
+            return "", None, None
+        name = names[0] if names else None
+        if name:
+            text = text.replace(name, "{name}", 1)
+        return normalize_question(text), name, period
+
+    def parse(self, question: str) -> Optional[Tuple[str, Dict[str, Any], Optional[str]]]:
+        """(intent name, query, {name} value) for a question one of the INTENTS recognises, otherwise None"""
+        template, name, period = self.template(question)
+        if not template:
+            return None
+        for intent, pattern, needs_name, compiler in COMPILED:
+            match = pattern.fullmatch(template)
+            if not match or (needs_name is not None and needs_name != (name is not None)):
+                continue
+            groups = {k: v for k, v in match.groupdict().items() if v}
+            return intent, compiler(groups, name, period), name
+        return None
+
+
+class ProfileNames:
+    """Whether a {name} matches some profile's fullName, as the compiled $match on it would.
+
+    Answers are cached for `ttl` seconds; if the lookup fails the name
+    counts as unknown, so the question goes to Gemini.
+    """
+
+    def __init__(self, db, ttl: float = 300, maxsize: int = 4096):
+        self.db = db
+        self._known = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def known(self, name: str) -> bool:
+        key = name.lower()
+        known = self._known.get(key)
+        if known is None:
+            try:
+                found = await self.db.profiles.find_one(
+                    {"fullName": {"$regex": _literal(name), "$options": "i"}}, {"_id": 1})
+            except PyMongoError as e:
+                print(f"Could not look up the name {name!r} in profiles: {e}")
+                return False
+            known = found is not None
+            self._known.set(key, known)
+        return known
@@ -1,18 +1,109 @@
 import os
+import sys
 import json
-from typing import List, Dict, Any
+import asyncio
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
+from pymongo.errors import ExecutionTimeout
 import google.generativeai as genai
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 
+# Make the package importable when run directly as `python main.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service import export
+from python_service.audit import AuditLog, AuditRecord, FileSink, MongoSink, note
+from python_service.batching import facet_safe, fuse, split
+from python_service.encoding import BSONJSONResponse, dumps
+from python_service.indexes import ensure_indexes
+from python_service.intents import IntentParser, ProfileNames
+from python_service.metadata import MetadataRefresher
+from python_service.metrics import (
+    BATCH_QUERIES,
+    CANCELLED_REQUESTS,
+    EMPTY_RESULTS,
+    EXPORT_ROWS,
+    EXPORT_SECONDS,
+    LLM_TOKENS,
+    LOCAL_INTENTS,
+    PARSE_FAILURES,
+    REQUEST_SECONDS,
+    RESULT_ROWS,
+    STAGE_SECONDS,
+    WorkerMetrics,
+    registry,
+)
+from python_service.model_pool import CircuitBreaker, ModelPool, ModelUnavailable
+from python_service.model_selection import ModelSelector
+from python_service.pipeline_cache import PipelineCache, normalize_question
+from python_service.pipeline_optimizer import PipelineOptimizer, decode_extended_json
+from python_service.profiler import CollectionProfiler
+from python_service.prompt_library import PromptLibrary, schemas_summary
+from python_service.query_policy import InvalidContinuation, policy_from_env
+from python_service.result_cache import ResultCache, pipeline_hash
+from python_service.rollups import RollupMaintainer, RollupPlanner
+from python_service.sessions import SessionStore
+from python_service.shared_store import SharedStore
+from python_service.singleflight import SingleFlight
+from python_service.streaming import ndjson_line, sse_event, with_keepalive
+from python_service.summarizer import (
+    SummaryAccumulator,
+    needs_prose,
+    render_summary,
+    stats_from_facet,
+    stats_pipeline,
+    summarize_rows,
+)
+
 # Load environment variables
 load_dotenv(dotenv_path="../.env")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global LEADER
+    LEADER = is_leader()
+    watcher = None
+    if os.getenv("RESULT_CACHE_WATCH", "1") == "1" and LEADER:
+        # Under serve.py the leader's invalidations reach the other workers through the shared store
+        watcher = asyncio.create_task(result_cache.watch(db))
+    refresher = asyncio.create_task(metadata.run())
+    profiling = asyncio.create_task(profiler.run())
+    auditing = asyncio.create_task(audit_log.run())
+    publishing = asyncio.create_task(worker_metrics.run()) if worker_metrics else None
+    maintainer = None
+    if USE_ROLLUPS:
+        # One worker keeps the rollups current; the others follow its heartbeat
+        maintainer = asyncio.create_task(rollups.run() if LEADER else rollups.observe())
+    if GEMINI_API_KEY:
+        # Pick the model in the background so the first chat rarely waits for it
+        asyncio.create_task(ensure_gemini())
+    if os.getenv("ENSURE_INDEXES_ON_STARTUP", "0") == "1" and LEADER:
+        # Idempotent, so safe on every start; runs in the background
+        asyncio.create_task(ensure_indexes(db))
+    yield
+    if watcher:
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
+    refresher.cancel()
+    profiling.cancel()
+    if maintainer:
+        maintainer.cancel()
+    if publishing:
+        publishing.cancel()
+    # Let the audit writer flush what is queued, while the database is still connected
+    auditing.cancel()
+    await asyncio.gather(auditing, return_exceptions=True)
+    await client.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -28,335 +119,145 @@ MONGO_URI = os.getenv("DATABASE_URL") or os.getenv("MONGODB_URI")
 if not MONGO_URI:
     raise ValueError("DATABASE_URL is not set in .env")
 
-client = MongoClient(MONGO_URI)
+client = AsyncMongoClient(MONGO_URI)
 db = client.get_database()
 
+# Per-stage concurrency limits. Requests beyond the limit wait on the
+# semaphore instead of piling more load onto Gemini or MongoDB.
+LLM_CONCURRENCY = int(os.getenv("CHAT_LLM_CONCURRENCY", "16"))
+DB_CONCURRENCY = int(os.getenv("CHAT_DB_CONCURRENCY", "32"))
+llm_limiter = asyncio.Semaphore(LLM_CONCURRENCY)
+db_limiter = asyncio.Semaphore(DB_CONCURRENCY)
+# Exports hold a cursor open for as long as the download takes, so they get their own limit
+export_limiter = asyncio.Semaphore(int(os.getenv("CHAT_EXPORT_CONCURRENCY", "2")))
+
 # Gemini Client
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-chat_session = None
-
-# Enhanced SYSTEM_PROMPT with transaction type handling
-SYSTEM_PROMPT = """
-You are an intelligent assistant for a banking application admin. 
-Your goal is to help the admin query the MongoDB database using natural language.
-
-**CRITICAL: When querying by user name, you MUST use $lookup to join with profiles collection!**
-
-You have access to the following collections and their COMPLETE schemas:
-
-1. **profiles** (User Profile Information):
-   {
-     _id: ObjectId,
-     userId: String,           // May be Clerk user ID (legacy field, may not exist)
-     clerkId: String,          // Primary Clerk ID - USE THIS for joins
-     email: String,            // User email
-     fullName: String,         // Full name - USE FOR NAME SEARCHES
-     phone: String,            // Phone number
-     address: String,          // User address
-     kycStatus: String,        // KYC status (pending, verified, rejected)
-     isAdmin: Boolean,         // Admin flag
-     createdAt: Date,
-     updatedAt: Date
-   }
-
-2. **accounts** (Bank Accounts):
-   {
-     _id: ObjectId,
-     userId: String,           // References profiles.clerkId (or profiles.userId for legacy)
-     accountNumber: String,
-     accountType: String,
-     balance: Number,
-     currency: String,
-     status: String,
-     createdAt: Date,
-     updatedAt: Date
-   }
-
-3. **transactions** (Account Transactions):
-   {
-     _id: ObjectId,
-     userId: String,           // References profiles.clerkId - DOES NOT STORE NAME!
-     accountId: ObjectId,      // References accounts._id
-     amount: Number,
-     type: String,             // IMPORTANT: Can be "credit", "debit", "deposit", "withdrawal", "transfer"
-                               // For deposits, check for type containing "deposit" OR amount > 0 with credit type
-     status: String,           // completed, pending, failed
-     description: String,      // May contain "deposit", "Stripe deposit", etc.
-     referenceId: String,
-     recipientAccountId: ObjectId,
-     recipientUserId: String,
-     createdAt: Date
-   }
-
-4. **loans** (Loan Applications):
-   {
-     _id: ObjectId,
-     userId: String,           // References profiles.clerkId
-     loanType: String,
-     amount: Number,
-     interestRate: Number,
-     tenureMonths: Number,
-     status: String,
-     totalPayable: Number,
-     amountPaid: Number,
-     emiAmount: Number,
-     remainingAmount: Number,
-     disbursementAccountId: ObjectId,
-     approvedBy: String,
-     approvedAt: Date,
-     disbursedAt: Date,
-     nextEmiDate: Date,
-     createdAt: Date,
-     updatedAt: Date
-   }
-
-5. **emipayments** (EMI Payment Records):
-   {
-     _id: ObjectId,
-     loanId: ObjectId,
-     userId: String,           // References profiles.clerkId
-     emiNumber: Number,
-     amount: Number,
-     principalAmount: Number,
-     interestAmount: Number,
-     status: String,
-     dueDate: Date,
-     paidDate: Date,
-     stripePaymentId: String,
-     transactionId: ObjectId,
-     createdAt: Date
-   }
-
-**CRITICAL RULES:**
-
-1. **For NAME-BASED queries**: Always use $lookup to join profiles collection
-2. **For TRANSACTION TYPE queries**: 
-   - Deposits can be identified by:
-     * type field containing "deposit" (case-insensitive)
-     * type field containing "credit" (case-insensitive)  
-     * description field containing "deposit" (case-insensitive)
-     * description field containing "stripe deposit" (case-insensitive)
-   - ALWAYS use $or with multiple conditions to catch all variations
-   - DO NOT require amount > 0 as a mandatory condition - some systems store all amounts as positive
-   - Use $regex with $options: "i" for ALL text matching
-   - Example: {"$or": [{"type": {"$regex": "deposit|credit", "$options": "i"}}, {"description": {"$regex": "deposit", "$options": "i"}}]}
-3. **For DATE/TIME queries**:
-   - Current date is December 1, 2025
-   - "this month" means the CURRENT month (December 2025) = createdAt field is already a Date type
-   - Use direct date comparison: {"createdAt": {"$gte": new Date("2025-12-01"), "$lt": new Date("2026-01-01")}}
-   - IMPORTANT: createdAt is already a Date object, NOT a string - never use $dateFromString
-   - For "last month" or "November" use appropriate date ranges
-
-**CORRECT Patterns for Common Queries:**
-
-Q: "Total deposits this month"
-A: {
-  "collection": "transactions",
-  "pipeline": [
-    {
-      "$match": {
-        "$and": [
-          {
-            "$or": [
-              {"type": {"$regex": "deposit|credit", "$options": "i"}},
-              {"description": {"$regex": "deposit", "$options": "i"}}
-            ]
-          },
-          {"createdAt": {"$gte": {"$date": "2025-12-01T00:00:00.000Z"}, "$lt": {"$date": "2026-01-01T00:00:00.000Z"}}}
-        ]
-      }
-    },
-    {"$sort": {"createdAt": -1}},
-    {
-      "$project": {
-        "amount": 1,
-        "type": 1,
-        "description": 1,
-        "createdAt": 1,
-        "status": 1
-      }
-    }
-  ]
-}
+STUB_LLM = os.getenv("CHAT_LLM_BACKEND", "gemini") == "stub"
+stub_models: Dict[str, Any] = {}
+summary_models: Dict[str, Any] = {}
 
-Q: "Total deposits last month" or "Total deposits in November" or "deposits in november"
-A: {
-  "collection": "transactions",
-  "pipeline": [
-    {
-      "$match": {
-        "$and": [
-          {
-            "$or": [
-              {"type": {"$regex": "deposit|credit", "$options": "i"}},
-              {"description": {"$regex": "deposit", "$options": "i"}}
-            ]
-          },
-          {"createdAt": {"$gte": {"$date": "2025-11-01T00:00:00.000Z"}, "$lt": {"$date": "2025-12-01T00:00:00.000Z"}}}
-        ]
-      }
-    },
-    {"$sort": {"createdAt": -1}},
-    {
-      "$project": {
-        "amount": 1,
-        "type": 1,
-        "description": 1,
-        "createdAt": 1,
-        "status": 1
-      }
-    }
-  ]
-}
+# With CHAT_SHARED_STORE set (serve.py sets it for multi-worker serving),
+# conversations and the pipeline and result caches live in that SQLite file
+# so every worker process shares them. Otherwise they stay in this process.
+SHARED_STORE_PATH = os.getenv("CHAT_SHARED_STORE")
+shared_store = SharedStore(SHARED_STORE_PATH) if SHARED_STORE_PATH else None
 
-Q: "Total deposits" (all time)
-A: {
-  "collection": "transactions",
-  "pipeline": [
-    {
-      "$match": {
-        "$or": [
-          {"type": {"$regex": "deposit|credit", "$options": "i"}},
-          {"description": {"$regex": "deposit", "$options": "i"}}
-        ]
-      }
-    },
-    {"$sort": {"createdAt": -1}},
-    {
-      "$project": {
-        "amount": 1,
-        "type": 1,
-        "description": 1,
-        "createdAt": 1,
-        "status": 1
-      }
-    }
-  ]
-}
+def is_leader() -> bool:
+    """Whether this process runs the once-per-deployment background work (rollups, index builds, cache invalidation)"""
+    return shared_store is None or shared_store.lock("leader")
 
-Q: "Show me transaction history for Lavanya Kumar"
-A: {
-  "collection": "transactions",
-  "pipeline": [
-    {
-      "$lookup": {
-        "from": "profiles",
-        "localField": "userId",
-        "foreignField": "clerkId",
-        "as": "userProfile"
-      }
-    },
-    {"$unwind": "$userProfile"},
-    {
-      "$match": {
-        "userProfile.fullName": {"$regex": "Lavanya Kumar", "$options": "i"}
-      }
-    },
-    {"$sort": {"createdAt": -1}},
-    {
-      "$project": {
-        "amount": 1,
-        "type": 1,
-        "status": 1,
-        "description": 1,
-        "createdAt": 1,
-        "userProfile.fullName": 1
-      }
-    }
-  ]
-}
+LEADER = False
 
-Q: "What was the last transaction by Lavanya Kumar?"
-A: {
-  "collection": "transactions",
-  "pipeline": [
-    {
-      "$lookup": {
-        "from": "profiles",
-        "localField": "userId",
-        "foreignField": "clerkId",
-        "as": "userProfile"
-      }
-    },
-    {"$unwind": "$userProfile"},
-    {
-      "$match": {
-        "userProfile.fullName": {"$regex": "Lavanya Kumar", "$options": "i"}
-      }
-    },
-    {"$sort": {"createdAt": -1}},
-    {"$limit": 1},
-    {
-      "$project": {
-        "amount": 1,
-        "type": 1,
-        "description": 1,
-        "createdAt": 1,
-        "status": 1
-      }
-    }
-  ]
-}
+# Under serve.py each worker counts its own requests; /metrics adds them up from the store
+worker_metrics = WorkerMetrics(
+    registry, shared_store, interval=float(os.getenv("CHAT_METRICS_PUBLISH_SECONDS", "5")),
+) if shared_store else None
 
-Q: "All withdrawals this month"
-A: {
-  "collection": "transactions",
-  "pipeline": [
-    {
-      "$match": {
-        "$and": [
-          {
-            "$or": [
-              {"type": {"$regex": "withdrawal", "$options": "i"}},
-              {"type": {"$regex": "debit", "$options": "i"}},
-              {"description": {"$regex": "withdrawal", "$options": "i"}}
-            ]
-          },
-          {"createdAt": {"$gte": {"$date": "2025-12-01T00:00:00.000Z"}, "$lt": {"$date": "2026-01-01T00:00:00.000Z"}}}
-        ]
-      }
-    },
-    {"$sort": {"createdAt": -1}}
-  ]
-}
+# Conversation history, one entry per admin conversation
+sessions = SessionStore(
+    max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "1000")),
+    idle_seconds=float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "1800")),
+    max_turns=int(os.getenv("CHAT_HISTORY_MAX_TURNS", "6")),
+    max_tokens=int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "4000")),
+    shared=shared_store,
+)
 
-Q: "In which month was the last withdrawal made"
-A: {
-  "collection": "transactions",
-  "pipeline": [
-    {
-      "$match": {
-        "$or": [
-          {"type": {"$regex": "withdrawal", "$options": "i"}},
-          {"type": {"$regex": "debit", "$options": "i"}},
-          {"description": {"$regex": "withdrawal", "$options": "i"}}
-        ]
-      }
-    },
-    {"$sort": {"createdAt": -1}},
-    {"$limit": 1},
-    {
-      "$project": {
-        "amount": 1,
-        "type": 1,
-        "description": 1,
-        "createdAt": 1,
-        "month": {"$month": "$createdAt"},
-        "year": {"$year": "$createdAt"}
-      }
-    }
-  ]
-}
+# Generated queries, reused for repeat questions without asking Gemini again
+pipeline_cache = PipelineCache(
+    maxsize=int(os.getenv("PIPELINE_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("PIPELINE_CACHE_TTL_SECONDS", "3600")),
+    shared=shared_store,
+)
+
+# Aggregation results, invalidated from a change stream when one is available
+result_cache = ResultCache(
+    maxsize=int(os.getenv("RESULT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+    fallback_ttl=float(os.getenv("RESULT_CACHE_FALLBACK_TTL_SECONDS", "30")),
+    shared=shared_store,
+)
+
+# Structured audit trail: one record per request (question, collection,
+# pipeline hash, rows, stage timings), queued and written in batches by a
+# background task. CHAT_AUDIT_SINK is "file" (JSON lines, rotated),
+# "mongo" (a capped collection) or "off". Records are dropped, and
+# counted, rather than delaying requests when the queue is full.
+AUDIT_SINK = os.getenv("CHAT_AUDIT_SINK", "file")
+if AUDIT_SINK == "file":
+    audit_sink = FileSink(
+        os.getenv("CHAT_AUDIT_PATH", "chat_audit.jsonl"),
+        max_bytes=int(os.getenv("CHAT_AUDIT_MAX_MB", "50")) * 1024 * 1024,
+        backups=int(os.getenv("CHAT_AUDIT_BACKUPS", "5")),
+    )
+elif AUDIT_SINK == "mongo":
+    audit_sink = MongoSink(
+        db,
+        os.getenv("CHAT_AUDIT_COLLECTION", "chat_audit"),
+        size_bytes=int(os.getenv("CHAT_AUDIT_CAPPED_MB", "512")) * 1024 * 1024,
+    )
+else:
+    audit_sink = None
+audit_log = AuditLog(
+    audit_sink,
+    maxsize=int(os.getenv("CHAT_AUDIT_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("CHAT_AUDIT_BATCH_SIZE", "500")),
+)
+
+# Identical questions, pipelines and summaries in flight at the same time share one execution
+flights = SingleFlight(
+    max_waiters=int(os.getenv("CHAT_COALESCE_MAX_WAITERS", "100")),
+    timeout=float(os.getenv("CHAT_COALESCE_TIMEOUT_SECONDS", "60")),
+)
+
+# Rewrites generated pipelines into index-friendly equivalents
+OPTIMIZE_PIPELINES = os.getenv("PIPELINE_OPTIMIZER", "1") == "1"
+optimizer = PipelineOptimizer(db, explain=os.getenv("PIPELINE_EXPLAIN", "0") == "1")
+
+# Page size, time budget and disk-use policy for generated pipelines
+query_policy = policy_from_env()
+
+# /chat/batch: questions per request, and how many same-collection queries
+# share one $facet. A $facet that can't narrow its input with a shared
+# $match reads the whole collection, so that's only done below
+# BATCH_FUSE_SCAN_LIMIT documents.
+BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "20"))
+BATCH_FUSE_MAX = int(os.getenv("CHAT_BATCH_FUSE_MAX", "8"))
+BATCH_FUSE_SCAN_LIMIT = int(os.getenv("CHAT_BATCH_FUSE_SCAN_LIMIT", "50000"))
+
+# Collection list, counts and distinct values for /health and /debug
+metadata = MetadataRefresher(db, interval=float(os.getenv("METADATA_REFRESH_SECONDS", "30")))
+
+# Field presence, types, enum values and date ranges per collection, for
+# empty-result answers and the query prompt; new documents are folded in
+# every PROFILE_REFRESH_SECONDS, the whole profile rebuilt every PROFILE_FULL_SECONDS.
+profiler = CollectionProfiler(
+    db,
+    interval=float(os.getenv("PROFILE_REFRESH_SECONDS", "60")),
+    full_interval=float(os.getenv("PROFILE_FULL_SECONDS", "3600")),
+    sample_size=int(os.getenv("PROFILE_SAMPLE_SIZE", "1000")),
+)
 
-Q: "Show me the total balance of all accounts"
-A: {"collection": "accounts", "pipeline": [{"$group": {"_id": null, "totalBalance": {"$sum": "$balance"}}}]}
+# Daily/monthly totals kept current from a change stream (or a checkpointed
+# catch-up); totals questions read them instead of scanning the source.
+USE_ROLLUPS = os.getenv("ROLLUPS", "0") == "1"
+rollups = RollupMaintainer(
+    db,
+    interval=float(os.getenv("ROLLUP_REFRESH_SECONDS", "10")),
+    lookback_days=int(os.getenv("ROLLUP_LOOKBACK_DAYS", "2")),
+    max_lag=float(os.getenv("ROLLUP_MAX_LAG_SECONDS", "120")),
+)
+planner = RollupPlanner(rollups)
 
-Q: "Get phone number for Lavanya Kumar"
-A: {"collection": "profiles", "pipeline": [{"$match": {"fullName": {"$regex": "Lavanya Kumar", "$options": "i"}}}, {"$project": {"fullName": 1, "email": 1, "phone": 1, "address": 1}}]}
+# Schema, rules and worked examples for query generation. With
+# PROMPT_FEW_SHOT=1 each question gets only its most relevant examples.
+prompts = PromptLibrary(k=int(os.getenv("PROMPT_EXAMPLES", "3")))
+DYNAMIC_PROMPT = os.getenv("PROMPT_FEW_SHOT", "1") == "1"
 
-If the user's request is not about data query, return: 
-{"type": "conversation", "message": "Your helpful response here"}
-"""
+# Common question shapes compiled to pipelines locally; Gemini gets the rest
+USE_LOCAL_INTENTS = os.getenv("LOCAL_INTENTS", "1") == "1"
+intent_parser = IntentParser()
+profile_names = ProfileNames(db)
 
 # Model configuration
 models_to_try = [
@@ -367,190 +268,914 @@ models_to_try = [
     "gemini-pro-latest",
 ]
 GEMINI_READY = False
+generation_config = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 8192,
+}
+
+async def probe_model(model_name: str):
+    """Cheapest real call that proves a model is usable"""
+    probe = genai.GenerativeModel(model_name=model_name)
+    await probe.generate_content_async("Hello", generation_config={"max_output_tokens": 1})
+
+# Model choice happens on first use, not at import, and is cached on disk
+model_selector = ModelSelector(
+    models_to_try,
+    probe_model,
+    cache_path=os.getenv("GEMINI_MODEL_CACHE", os.path.join(tempfile.gettempdir(), "nexbank_gemini_model.json")),
+    cache_ttl=float(os.getenv("GEMINI_MODEL_CACHE_TTL_SECONDS", "86400")),
+    probe_timeout=float(os.getenv("GEMINI_PROBE_TIMEOUT_SECONDS", "10")),
+)
 
-if GEMINI_API_KEY:
+# The selected model answers first; the others in models_to_try take over
+# when it is slow (hedged requests) or failing (circuit breaker open)
+model_pool = ModelPool(
+    models_to_try,
+    timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "30")),
+    hedge_min=float(os.getenv("LLM_HEDGE_MIN_SECONDS", "1")),
+    hedge_max=float(os.getenv("LLM_HEDGE_MAX_SECONDS", "8")),
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "2")),
+    breaker=lambda: CircuitBreaker(
+        consecutive_failures=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        error_rate=float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5")),
+        open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30")),
+    ),
+)
+
+if STUB_LLM:
+    # Offline benchmarking: canned queries for the known question patterns, no Gemini calls
+    from python_service.stub_llm import StubModel
+    latency = float(os.getenv("STUB_LLM_LATENCY_MS", "0"))
+    faults = json.loads(os.getenv("STUB_LLM_FAULTS", "{}"))
+    stub_models = {
+        name: StubModel(latency=faults.get(name, {}).get("latency_ms", latency) / 1000, model_name=name,
+                        error_rate=faults.get(name, {}).get("error_rate", 0.0))
+        for name in models_to_try
+    }
+    GEMINI_READY = True
+    print("Using the stub LLM backend")
+elif GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
-    
-    for model_name in models_to_try:
-        try:
-            print(f"Attempting to configure Gemini with model: {model_name}")
-            model = genai.GenerativeModel(
-                model_name=model_name,
-                generation_config={
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                    "top_k": 64,
-                    "max_output_tokens": 8192,
-                },
-                system_instruction=SYSTEM_PROMPT,
-            )
-            chat_session = model.start_chat(history=[])
-            test_response = chat_session.send_message("Hello")
-            print(f"✓ Test response received (length: {len(test_response.text)} chars)")
-            
-            GEMINI_READY = True
-            print(f"✓✓✓ SUCCESS: Gemini API configured with model: {model_name}")
-            break
-        except Exception as e:
-            print(f"✗ FAILED to configure model {model_name}: {str(e)}")
-            chat_session = None
-            
-    if not GEMINI_READY:
-        print("=" * 80)
-        print("CRITICAL ERROR: All Gemini models failed to initialize.")
-        print("=" * 80)
 else:
     print("WARNING: GEMINI_API_KEY is not set. Chat features will not work.")
-    GEMINI_READY = False
+
+async def ensure_gemini() -> bool:
+    """Select the preferred Gemini model on first use. Returns whether chat is available."""
+    global GEMINI_READY
+    if GEMINI_READY:
+        return True
+    if not GEMINI_API_KEY:
+        return False
+    model_name = await model_selector.get()
+    if not model_name:
+        return False
+    model_pool.prefer(model_name)
+    GEMINI_READY = True
+    return True
+
+def count_tokens(call: str, response) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, call=call, direction="in")
+        LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, call=call, direction="out")
+
+def query_model(model_name: str, message: str):
+    """The query-generation model, with a system prompt dated today carrying the examples relevant to `message`"""
+    if STUB_LLM:
+        return stub_models[model_name]
+    return genai.GenerativeModel(
+        model_name=model_name,
+        generation_config=generation_config,
+        system_instruction=(prompts.system_prompt(message, profiler.prompt_text()) if DYNAMIC_PROMPT
+                            else prompts.full_prompt(profiler.prompt_text())),
+    )
+
+def summary_model(model_name: str):
+    """Summaries don't need the query-generation instructions, so one model per name is reused"""
+    if STUB_LLM:
+        return stub_models[model_name]
+    if model_name not in summary_models:
+        summary_models[model_name] = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+    return summary_models[model_name]
+
+async def send_to_llm(message: str, history: List[Dict[str, Any]]):
+    """Send a message and its conversation history to the model pool without blocking the event loop"""
+    async with llm_limiter:
+        with STAGE_SECONDS.time(stage="llm_query"):
+            response = await model_pool.run(
+                lambda name: query_model(name, message).start_chat(history=history).send_message_async(message))
+    count_tokens("query", response)
+    return response
+
+async def generate_with_llm(prompt: str):
+    """One-off generation that doesn't touch any conversation history"""
+    async with llm_limiter:
+        with STAGE_SECONDS.time(stage="llm_summary"):
+            response = await model_pool.run(lambda name: summary_model(name).generate_content_async(prompt))
+    count_tokens("summary", response)
+    return response
+
+async def run_bounded_aggregate(collection_name: str, pipeline: List[Dict[str, Any]]):
+    """Run an aggregation under the query policy's time budget.
+
+    Returns (results, truncated). Rows read before maxTimeMS expired are
+    kept and returned with truncated=True instead of failing the request.
+    """
+    results: List[Dict[str, Any]] = []
+    async with db_limiter:
+        with STAGE_SECONDS.time(stage="aggregate"):
+            try:
+                cursor = await db[collection_name].aggregate(pipeline, **query_policy.options(collection_name))
+                async for doc in cursor:
+                    results.append(doc)
+            except ExecutionTimeout:
+                print(f"Query on {collection_name} hit its time budget after {len(results)} rows")
+                return results, True
+    return results, False
 
 class ChatRequest(BaseModel):
     message: str
+    conversation_id: Optional[str] = None
+    # Stream rows back as NDJSON instead of one JSON document
+    stream: bool = False
+    # Server-sent events: each stage as it finishes, then the summary as it is generated
+    sse: bool = False
+    # Token from a previous response's `continuation`; fetches the next page
+    continuation: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
     data: Any = None
+    conversation_id: Optional[str] = None
+    # Set when the query ran out of time and `data` holds partial results
+    truncated: bool = False
+    # Pass back as ChatRequest.continuation to fetch the next page
+    continuation: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    # Independent questions: each is answered without conversation history
+    messages: List[str]
+
+class BatchAnswer(BaseModel):
+    message: str
+    response: Optional[str] = None
+    data: Any = None
+    truncated: bool = False
+    continuation: Optional[str] = None
+    # Set instead of `response` when this question failed; the others are unaffected
+    error: Optional[str] = None
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchAnswer]
+
+STREAM_BATCH_SIZE = int(os.getenv("CHAT_STREAM_BATCH_SIZE", "500"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("CHAT_SSE_KEEPALIVE_SECONDS", "5"))
+SSE_HEADERS = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+SUMMARY_SAMPLE_SIZE = 10
+EXPORT_BATCH_SIZE = int(os.getenv("CHAT_EXPORT_BATCH_SIZE", "5000"))
+EXPORT_MAX_TIME_MS = int(os.getenv("CHAT_EXPORT_MAX_TIME_MS", "300000"))
+
+def clean_model_output(text: str) -> str:
+    """Strip markdown code fences from a Gemini reply"""
+    ai_content = text.strip()
+    if ai_content.startswith("```json"):
+        ai_content = ai_content[7:]
+    if ai_content.startswith("```"):
+        ai_content = ai_content[3:]
+    if ai_content.endswith("```"):
+        ai_content = ai_content[:-3]
+    return ai_content.strip()
+
+async def generate_query(message: str, conversation=None) -> Any:
+    """Turn a question into the model's parsed reply, using the pipeline cache when possible.
+
+    Without a conversation the question is asked with no history and the
+    turn isn't recorded. Raises json.JSONDecodeError (with the raw reply in
+    `.doc`) if the reply isn't JSON.
+    """
+    history = sessions.history(conversation) if conversation else []
+    # Cached queries were generated without history, so they can't answer a follow-up
+    cached_query = None if history else await pipeline_cache.lookup(message)
+    if cached_query is not None:
+        if conversation:
+            conversation.add_turn(message, json.dumps(cached_query))
+            await sessions.save(conversation)
+        return cached_query
+
+    async def ask() -> str:
+        # Send user message to Gemini along with this conversation's recent turns
+        response = await send_to_llm(message, history)
+        return clean_model_output(response.text)
+
+    if history:
+        ai_content = await ask()
+    else:
+        # Without history the reply depends only on the question, so concurrent askers share it
+        ai_content = await flights.do(("question", normalize_question(message)), ask)
+    if conversation:
+        conversation.add_turn(message, ai_content)
+        await sessions.save(conversation)
+
+    with STAGE_SECONDS.time(stage="parse"):
+        parsed_content = json.loads(ai_content)
+    # Only cache queries generated without earlier turns: a follow-up
+    # question like "and for Bob?" depends on its conversation.
+    if not history and isinstance(parsed_content, dict) \
+            and parsed_content.get("collection") and parsed_content.get("pipeline"):
+        await pipeline_cache.store(message, parsed_content)
+    return parsed_content
+
+async def prepare_pipeline(collection_name: str, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    with STAGE_SECONDS.time(stage="optimize"):
+        if not OPTIMIZE_PIPELINES:
+            return decode_extended_json(pipeline)
+        notes: List[str] = []
+        optimized = await optimizer.optimize(collection_name, pipeline, notes)
+    for text in notes:
+        note("optimizer", text)
+    return optimized
+
+async def execute_query(collection_name: str, pipeline: List[Dict[str, Any]], offset: int = 0):
+    """Run one page of a generated pipeline, reusing results while the collections are unchanged.
+
+    Returns (raw results, truncated, continuation token or None). Cached
+    results are shared, so they must not be modified.
+    """
+    paged = query_policy.paginate(pipeline, offset)
+
+    async def fetch():
+        generation = await result_cache.generation(collection_name, paged)
+        page = await run_bounded_aggregate(collection_name, await prepare_pipeline(collection_name, paged))
+        if not page[1]:
+            await result_cache.set(collection_name, paged, page[0], generation)
+        return page
+
+    routed = planner.route(collection_name, paged) if USE_ROLLUPS else None
+    if routed:
+        note("route", f"{collection_name} totals -> {routed[0]}")
+        # Rollups lag their source by up to ROLLUP_REFRESH_SECONDS, so these aren't cached
+        results, truncated = await run_bounded_aggregate(*routed)
+    else:
+        results = await result_cache.get(collection_name, paged)
+        truncated = False
+        if results is None:
+            results, truncated = await flights.do(("aggregate", pipeline_hash(collection_name, paged)), fetch)
+    results, continuation = finish_page(collection_name, pipeline, offset, results)
+    return results, truncated, continuation
+
+def finish_page(collection_name: str, pipeline: List[Dict[str, Any]], offset: int, results: List[Dict[str, Any]]):
+    """Trim a fetched page (page_size + 1 rows) to size. Returns (rows, continuation token or None)."""
+    continuation = None
+    if len(results) > query_policy.page_size:
+        results = results[: query_policy.page_size]
+        continuation = query_policy.encode_continuation(collection_name, pipeline, offset + len(results))
+    RESULT_ROWS.inc(len(results), collection=collection_name)
+    return results, continuation
+
+async def result_statistics(collection_name: str, pipeline: List[Dict[str, Any]], results: List[Dict[str, Any]],
+                            truncated: bool, more_pages: bool) -> Dict[str, Any]:
+    """Exact statistics for everything `pipeline` matches.
+
+    A single page is summarized locally; when the rows span several pages
+    MongoDB computes the same statistics over all of them in one $facet.
+    """
+    if not more_pages:
+        with STAGE_SECONDS.time(stage="statistics"):
+            return summarize_rows(results, partial=truncated)
+    routed = planner.statistics(collection_name, pipeline) if USE_ROLLUPS else None
+    if routed:
+        note("route", f"{collection_name} statistics -> {routed[0]}")
+        facet, timed_out = await run_bounded_aggregate(*routed)
+        if facet and not timed_out:
+            return stats_from_facet(facet[0])
+    query = stats_pipeline(pipeline)
+
+    async def fetch():
+        generation = await result_cache.generation(collection_name, query)
+        facet, timed_out = await run_bounded_aggregate(collection_name, await prepare_pipeline(collection_name, query))
+        if facet and not timed_out:
+            await result_cache.set(collection_name, query, facet, generation)
+            return facet
+        return None
+
+    facet = await result_cache.get(collection_name, query)
+    if facet is None:
+        facet = await flights.do(("aggregate", pipeline_hash(collection_name, query)), fetch)
+        if facet is None:
+            return summarize_rows(results, partial=True)
+    return stats_from_facet(facet[0])
+
+def empty_result_response(collection_name: str, pipeline: List[Dict[str, Any]], truncated: bool) -> Dict[str, Any]:
+    """Explain an empty result from the collection profile, without another query.
+
+    A query stopped by its time budget before returning any rows hasn't shown
+    that there are none, so it gets its own answer instead of hints about
+    missing values.
+    """
+    if truncated:
+        return {
+            "response": "The query ran out of its time budget before returning any records, so there may well be "
+                        "matches. Try narrowing it, for example to a shorter date range.",
+            "data": {"query": pipeline},
+        }
+    EMPTY_RESULTS.inc(collection=collection_name)
+    hint = profiler.empty_result_hint(collection_name, pipeline)
+    profile = profiler.get(collection_name)
+    return {
+        "response": "No results found for your query. The database returned 0 records." + (f"\n\n{hint}" if hint else ""),
+        "data": {"query": pipeline, "sample_data": profile.samples if profile else [],
+                 "profile": profile.summary() if profile else None},
+    }
+
+async def answer_from_results(question: str, collection_name: str, pipeline: List[Dict[str, Any]],
+                              results: List[Dict[str, Any]], truncated: bool,
+                              continuation: Optional[str]) -> Dict[str, Any]:
+    """Summary and rows for one page of a query's results, as ChatResponse fields"""
+    # If no results found, provide helpful debugging info
+    if len(results) == 0:
+        return {**empty_result_response(collection_name, pipeline, truncated), "truncated": truncated}
+
+    # Summarize the results
+    stats = await result_statistics(collection_name, pipeline, results, truncated, continuation is not None)
+    summary = await summarize_results(question, results[:SUMMARY_SAMPLE_SIZE], stats)
+    return {"response": summary, "data": results, "truncated": truncated, "continuation": continuation}
+
+async def summarize_results(question: str, sample: List[Dict[str, Any]], stats: Dict[str, Any]) -> str:
+    """Answer from computed statistics, asking Gemini only when the question wants prose"""
+    if not needs_prose(question):
+        with STAGE_SECONDS.time(stage="summary"):
+            return render_summary(stats, sample)
+
+    prompt = summary_prompt(question, sample, stats)
+
+    async def ask() -> str:
+        summary_response = await generate_with_llm(prompt)
+        return summary_response.text.strip()
+
+    return await flights.do(("summary", prompt), ask)
+
+def summary_prompt(question: str, sample: List[Dict[str, Any]], stats: Dict[str, Any]) -> str:
+    total = stats["count"]
+    note = "\n            Note: the query was cut short, so these totals are lower bounds." if stats["partial"] else ""
+    return f"""
+            User Question: "{question}"
+            Database Results: {dumps(sample)} (showing first {len(sample)} items out of {total} total)
+            Exact statistics over all {total} records: {json.dumps(stats, default=str)}{note}
+            
+            Provide a clear, natural language summary. Include:
+            - Total number of records found
+            - Key details from the data (amounts, dates, types)
+            - Any important patterns or insights
+            Be specific with numbers, dates, and amounts. Format currencies properly.
+            """
+
+def chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        # A chunk with no text parts, e.g. only a finish reason
+        return ""
+
+async def stream_summary(question: str, sample: List[Dict[str, Any]], stats: Dict[str, Any]):
+    """Like summarize_results, but yields Gemini's answer piece by piece as it is generated.
+
+    The model pool races models up to the first chunk, so hedging and
+    failover cover time to first token; after that the stream stays on the
+    model that answered.
+    """
+    if not needs_prose(question):
+        with STAGE_SECONDS.time(stage="summary"):
+            yield render_summary(stats, sample)
+        return
+
+    prompt = summary_prompt(question, sample, stats)
+
+    async def open_stream(model_name: str):
+        response = await summary_model(model_name).generate_content_async(prompt, stream=True)
+        chunks = response.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return response, chunks, first
+
+    async with llm_limiter:
+        with STAGE_SECONDS.time(stage="llm_first_token"):
+            response, chunks, first = await model_pool.run(open_stream)
+        if first is None:
+            return
+        yield chunk_text(first)
+        async for chunk in chunks:
+            yield chunk_text(chunk)
+    count_tokens("summary", response)
+
+async def stream_query(question: str, collection_name: str, pipeline: List[Dict[str, Any]], conversation_id: str,
+                       audit: AuditRecord):
+    """NDJSON events for one query: the query, row batches as the cursor yields them, then a summary.
+
+    Rows are read in STREAM_BATCH_SIZE batches and each batch is written
+    before the next is fetched, so a slow client slows the cursor down rather
+    than buffering the result set in memory. A slow client doesn't hold a
+    db_limiter slot, though: that is only taken while a batch is fetched. Summary statistics are
+    accumulated batch by batch over every row.
+    """
+    yield ndjson_line({"event": "query", "collection": collection_name, "pipeline": pipeline,
+                       "conversation_id": conversation_id})
+    try:
+        executed = await prepare_pipeline(collection_name, pipeline)
+        accumulator = SummaryAccumulator()
+        sample: List[Dict[str, Any]] = []
+        truncated = False
+
+        def flush(batch):
+            accumulator.add_batch(batch)
+            sample.extend(batch[: SUMMARY_SAMPLE_SIZE - len(sample)])
+            RESULT_ROWS.inc(len(batch), collection=collection_name)
+            return ndjson_line({"event": "rows", "rows": batch})
+
+        # The limiter is held for each fetch only, not while a batch is written to the client
+        async with db_limiter:
+            cursor = await db[collection_name].aggregate(
+                executed, batchSize=STREAM_BATCH_SIZE, **query_policy.options(collection_name)
+            )
+        try:
+            while True:
+                async with db_limiter:
+                    batch = await cursor.to_list(length=STREAM_BATCH_SIZE)
+                if not batch:
+                    break
+                yield flush(batch)
+        except ExecutionTimeout:
+            truncated = True
+        finally:
+            await cursor.close()
+
+        if accumulator.count == 0:
+            empty = empty_result_response(collection_name, pipeline, truncated)
+            audit.finish("timeout" if truncated else "empty", rows=0, truncated=truncated)
+            yield ndjson_line({"event": "summary", "count": 0, "truncated": truncated, **empty})
+            return
+        summary = await summarize_results(question, sample, accumulator.result(partial=truncated))
+        audit.finish("ok", rows=accumulator.count, truncated=truncated)
+        yield ndjson_line({"event": "summary", "response": summary, "count": accumulator.count, "truncated": truncated})
+    except Exception as e:
+        print(f"Error streaming chat query: {e}")
+        audit.finish("error", error=f"{type(e).__name__}: {e}")
+        yield ndjson_line({"event": "error", "response": f"An error occurred: {str(e)}"})
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
-    if not GEMINI_READY or not chat_session:
+    mode = "page" if request.continuation else "sse" if request.sse else "stream" if request.stream else "chat"
+    with REQUEST_SECONDS.time(mode=mode):
+        if request.continuation:
+            response = await next_page(request)
+        elif request.sse:
+            response = await answer_events(request)
+        else:
+            response = await answer_chat(request)
+        if isinstance(response, ChatResponse):
+            # Rows are raw MongoDB documents; encode them in one pass while writing the body
+            with STAGE_SECONDS.time(stage="encode"):
+                return BSONJSONResponse({**response.model_dump(exclude={"data"}), "data": response.data})
+        return response
+
+async def local_query(message: str) -> Optional[Dict[str, Any]]:
+    """The compiled query when the intent parser recognises `message` (and its name is a customer's)"""
+    if not USE_LOCAL_INTENTS:
+        return None
+    with STAGE_SECONDS.time(stage="intent"):
+        parsed = intent_parser.parse(message)
+        if parsed and parsed[2] and not await profile_names.known(parsed[2]):
+            LOCAL_INTENTS.inc(intent="unknown_name")
+            return None
+    LOCAL_INTENTS.inc(intent=parsed[0] if parsed else "none")
+    return parsed[1] if parsed else None
+
+async def answer_chat(request: ChatRequest):
+    audit = audit_log.start("stream" if request.stream else "chat", request.message, request.conversation_id)
+    compiled = await local_query(request.message)
+    if compiled is None and not await ensure_gemini():
+        audit.finish("unavailable")
         raise HTTPException(status_code=503, detail="AI service is not available")
 
-    try:
-        # Send user message to Gemini
-        response = chat_session.send_message(request.message)
-        ai_content = response.text.strip()
-        
-        # Clean up markdown code blocks
-        if ai_content.startswith("```json"):
-            ai_content = ai_content[7:]
-        if ai_content.startswith("```"):
-            ai_content = ai_content[3:]
-        if ai_content.endswith("```"):
-            ai_content = ai_content[:-3]
-        
-        ai_content = ai_content.strip()
+    conversation = await sessions.get(request.conversation_id)
+    conversation_id = audit.fields["conversation_id"] = conversation.id
 
+    try:
         # Handle non-query responses
         try:
-            parsed_content = json.loads(ai_content)
+            if compiled is not None:
+                # Recorded like a Gemini reply, so follow-up questions have it as context
+                conversation.add_turn(request.message, json.dumps(compiled))
+                await sessions.save(conversation)
+                parsed_content = compiled
+            else:
+                parsed_content = await generate_query(request.message, conversation)
             if isinstance(parsed_content, dict) and parsed_content.get("type") == "conversation":
-                 return ChatResponse(response=parsed_content["message"])
+                 audit.finish("conversation")
+                 return ChatResponse(response=parsed_content["message"], conversation_id=conversation_id)
             
             collection_name = parsed_content.get("collection")
             pipeline = parsed_content.get("pipeline")
             
             if not collection_name or not pipeline:
-                return ChatResponse(response="Sorry, I couldn't understand how to query the database for that.")
+                audit.finish("no_query")
+                return ChatResponse(response="Sorry, I couldn't understand how to query the database for that.", conversation_id=conversation_id)
 
-            # Log the query being executed
-            print(f"Executing query on {collection_name}:")
-            print(f"Pipeline: {json.dumps(pipeline, indent=2, default=str)}")
+            audit.query(collection_name, pipeline, "intent" if compiled is not None else "model")
 
-            # Execute query
-            collection = db[collection_name]
-            results = list(collection.aggregate(pipeline))
-            
-            # Convert ObjectId and Date to string
-            for doc in results:
-                for key, value in doc.items():
-                    if hasattr(value, '__str__'):
-                        doc[key] = str(value)
-
-            # If no results found, provide helpful debugging info
-            if len(results) == 0:
-                # Try a simpler query to see what data exists
-                debug_query = [{"$limit": 5}, {"$project": {"type": 1, "description": 1, "amount": 1, "createdAt": 1}}]
-                debug_results = list(collection.aggregate(debug_query))
-                
-                debug_info = f"\n\nDEBUG INFO: Here are some sample {collection_name} records to help understand the data:\n{json.dumps(debug_results, indent=2, default=str)}"
-                
-                return ChatResponse(
-                    response=f"No results found for your query. The database returned 0 records.{debug_info if debug_results else ''}",
-                    data={"query": pipeline, "sample_data": debug_results}
+            if request.stream:
+                return StreamingResponse(
+                    stream_query(request.message, collection_name, pipeline, conversation_id, audit),
+                    media_type="application/x-ndjson",
                 )
 
-            # Summarize the results
-            summary_prompt = f"""
-            User Question: "{request.message}"
-            Database Results: {json.dumps(results[:10], default=str)} (showing first 10 items out of {len(results)} total)
-            
-            Provide a clear, natural language summary. Include:
-            - Total number of records found
-            - Key details from the data (amounts, dates, types)
-            - Any important patterns or insights
-            Be specific with numbers, dates, and amounts. Format currencies properly.
-            """
-            
-            summary_response = chat_session.send_message(summary_prompt)
-            summary = summary_response.text.strip()
-            
-            return ChatResponse(response=summary, data=results)
+            results, truncated, continuation = await execute_query(collection_name, pipeline)
+            answer = await answer_from_results(request.message, collection_name, pipeline,
+                                               results, truncated, continuation)
+            audit.finish("ok" if results else "timeout" if truncated else "empty", rows=len(results),
+                         truncated=truncated)
+            return ChatResponse(**answer, conversation_id=conversation_id)
 
-        except json.JSONDecodeError:
-             return ChatResponse(response=f"AI Error: Failed to parse response. Raw: {ai_content}")
+        except json.JSONDecodeError as e:
+             PARSE_FAILURES.inc()
+             audit.finish("parse_error", error=str(e))
+             return ChatResponse(response=f"AI Error: Failed to parse response. Raw: {e.doc}", conversation_id=conversation_id)
 
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
-        import traceback
-        traceback.print_exc()
-        return ChatResponse(response=f"An error occurred: {str(e)}")
+        audit.finish("error", error=f"{type(e).__name__}: {e}")
+        return ChatResponse(response=f"An error occurred: {str(e)}", conversation_id=conversation_id)
+
+async def answer_events(request: ChatRequest) -> StreamingResponse:
+    audit = audit_log.start("sse", request.message, request.conversation_id)
+    compiled = await local_query(request.message)
+    if compiled is None and not await ensure_gemini():
+        audit.finish("unavailable")
+        raise HTTPException(status_code=503, detail="AI service is not available")
+    conversation = await sessions.get(request.conversation_id)
+    audit.fields["conversation_id"] = conversation.id
+    events = chat_events(request.message, compiled, conversation, audit)
+    return StreamingResponse(with_keepalive(events, SSE_KEEPALIVE_SECONDS),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def chat_events(message: str, compiled: Optional[Dict[str, Any]], conversation, audit: AuditRecord):
+    """Server-sent events for one question, each sent as soon as its stage finishes:
+
+    query (the generated pipeline), rows (the first page), statistics (over
+    every matching row), token (summary text as Gemini generates it), then
+    done with the complete ChatResponse fields, or error. If the client goes
+    away the stage in progress is cancelled, Gemini and MongoDB calls included.
+    """
+    conversation_id = conversation.id
+    try:
+        if compiled is not None:
+            conversation.add_turn(message, json.dumps(compiled))
+            await sessions.save(conversation)
+            parsed_content = compiled
+        else:
+            parsed_content = await generate_query(message, conversation)
+        if isinstance(parsed_content, dict) and parsed_content.get("type") == "conversation":
+            audit.finish("conversation")
+            yield sse_event("done", {"response": parsed_content["message"], "conversation_id": conversation_id})
+            return
+        collection_name = parsed_content.get("collection")
+        pipeline = parsed_content.get("pipeline")
+        if not collection_name or not pipeline:
+            audit.finish("no_query")
+            yield sse_event("done", {"response": "Sorry, I couldn't understand how to query the database for that.",
+                                     "conversation_id": conversation_id})
+            return
+        source = "intent" if compiled is not None else "model"
+        audit.query(collection_name, pipeline, source)
+        yield sse_event("query", {"collection": collection_name, "pipeline": pipeline, "source": source,
+                                  "conversation_id": conversation_id})
+
+        results, truncated, continuation = await execute_query(collection_name, pipeline)
+        yield sse_event("rows", {"count": len(results), "rows": results,
+                                 "truncated": truncated, "continuation": continuation})
+        if not results:
+            empty = empty_result_response(collection_name, pipeline, truncated)
+            audit.finish("timeout" if truncated else "empty", rows=0, truncated=truncated)
+            yield sse_event("done", {**empty, "conversation_id": conversation_id, "truncated": truncated})
+            return
+
+        stats = await result_statistics(collection_name, pipeline, results, truncated, continuation is not None)
+        yield sse_event("statistics", stats)
+        parts = []
+        async for text in stream_summary(message, results[:SUMMARY_SAMPLE_SIZE], stats):
+            if text:
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        audit.finish("ok", rows=len(results), truncated=truncated)
+        yield sse_event("done", {"response": "".join(parts).strip(), "conversation_id": conversation_id,
+                                 "truncated": truncated, "continuation": continuation})
+    except json.JSONDecodeError as e:
+        PARSE_FAILURES.inc()
+        audit.finish("parse_error", error=str(e))
+        yield sse_event("error", {"response": f"AI Error: Failed to parse response. Raw: {e.doc}",
+                                  "conversation_id": conversation_id})
+    except asyncio.CancelledError:
+        CANCELLED_REQUESTS.inc(mode="sse")
+        audit.finish("cancelled")
+        raise
+    except Exception as e:
+        print(f"Error in chat event stream: {e}")
+        audit.finish("error", error=f"{type(e).__name__}: {e}")
+        yield sse_event("error", {"response": f"An error occurred: {str(e)}", "conversation_id": conversation_id})
+
+async def next_page(request: ChatRequest) -> ChatResponse:
+    """Serve the page a continuation token points at, without asking Gemini again"""
+    audit = audit_log.start("page", conversation_id=request.conversation_id)
+    try:
+        collection_name, pipeline, offset = query_policy.decode_continuation(request.continuation)
+    except InvalidContinuation as e:
+        audit.finish("invalid_continuation", error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+
+    audit.query(collection_name, pipeline, "continuation")
+    try:
+        results, truncated, continuation = await execute_query(collection_name, pipeline, offset)
+    except Exception as e:
+        print(f"Error fetching next page: {e}")
+        audit.finish("error", error=f"{type(e).__name__}: {e}", offset=offset)
+        return ChatResponse(response=f"An error occurred: {str(e)}", conversation_id=request.conversation_id)
+    audit.finish("ok" if results else "timeout" if truncated else "empty", rows=len(results),
+                 truncated=truncated, offset=offset)
+
+    if results:
+        response = f"Showing records {offset + 1}-{offset + len(results)}."
+    elif truncated:
+        response = "The query ran out of its time budget before returning the next records."
+    else:
+        response = "No more records."
+    return ChatResponse(response=response, data=results,
+                        conversation_id=request.conversation_id,
+                        truncated=truncated, continuation=continuation)
+
+@app.get("/chat/export")
+async def export_endpoint(conversation_id: str, format: str = "csv"):
+    """Download every row of a conversation's most recent query as CSV, Arrow IPC stream or Parquet"""
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    if not export.available(format):
+        raise HTTPException(status_code=400, detail=f"{format} exports need pyarrow installed")
+    conversation = await sessions.find(conversation_id)
+    query = conversation.last_query() if conversation else None
+    if query is None:
+        raise HTTPException(status_code=404, detail="No query to export in this conversation")
+    collection_name = query["collection"]
+    audit = audit_log.start("export", conversation_id=conversation_id)
+    audit.query(collection_name, query["pipeline"], "conversation")
+    filename = f"{collection_name}-{conversation_id[:8]}.{export.EXTENSIONS[format]}"
+    return StreamingResponse(export_rows(collection_name, query["pipeline"], format, audit),
+                             media_type=export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+async def export_rows(collection_name: str, pipeline: List[Dict[str, Any]], format: str, audit: AuditRecord):
+    """The pipeline's full result, unpaginated, written out EXPORT_BATCH_SIZE rows at a time.
+
+    Each batch is encoded and sent before the next is read from the cursor,
+    so memory stays bounded by one batch however large the export. A failure
+    part way through aborts the response rather than ending it cleanly, so
+    a cut-off download isn't mistaken for a complete one.
+    """
+    started = time.perf_counter()
+    rows = 0
+    # Still "aborted" at the end if the client went away and the response closed this generator
+    status, error = "aborted", None
+    writer = None
+    try:
+        async with export_limiter:
+            executed = await prepare_pipeline(collection_name, pipeline)
+            options = {**query_policy.options(collection_name), "maxTimeMS": EXPORT_MAX_TIME_MS}
+            cursor = await db[collection_name].aggregate(executed, batchSize=EXPORT_BATCH_SIZE, **options)
+            batch: List[Dict[str, Any]] = []
+            async for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    if writer is None:
+                        writer = export.exporter(format, batch)
+                        yield writer.start()
+                    yield writer.write(batch)
+                    rows += len(batch)
+                    batch = []
+            if writer is None:
+                writer = export.exporter(format, batch)
+                yield writer.start()
+            if batch:
+                yield writer.write(batch)
+                rows += len(batch)
+            yield writer.finish()
+            status = "ok"
+    except asyncio.CancelledError:
+        CANCELLED_REQUESTS.inc(mode="export")
+        status = "cancelled"
+        raise
+    except Exception as e:
+        print(f"Export of {collection_name} failed after {rows} rows: {e}")
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        EXPORT_ROWS.inc(rows, format=format)
+        EXPORT_SECONDS.observe(elapsed, format=format)
+        audit.finish(status, rows=rows, error=error, format=format,
+                     rows_per_second=round(rows / elapsed) if elapsed else None,
+                     **(writer.overflow.stats() if writer is not None else {}))
+
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(request: BatchChatRequest):
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="messages must not be empty")
+    if len(request.messages) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    with REQUEST_SECONDS.time(mode="batch"):
+        audit = audit_log.start("batch")
+        answers = await answer_batch(request.messages, audit)
+        with STAGE_SECONDS.time(stage="encode"):
+            return BSONJSONResponse({"results": answers})
+
+async def answer_batch(messages: List[str], audit: AuditRecord) -> List[Dict[str, Any]]:
+    """Answer several independent questions in one go, as BatchAnswer fields.
+
+    Queries are generated concurrently, then run together by
+    execute_batch. A failure is reported on its own question only.
+    """
+    answers = [BatchAnswer(message=message).model_dump() for message in messages]
+    compiled = await asyncio.gather(*(local_query(message) for message in messages))
+    gemini_ready = all(query is not None for query in compiled) or await ensure_gemini()
+
+    async def generate(message: str, query: Optional[Dict[str, Any]]) -> Any:
+        if query is not None:
+            return query
+        if not gemini_ready:
+            raise ModelUnavailable("AI service is not available")
+        return await generate_query(message)
+
+    generated = await asyncio.gather(*(generate(m, q) for m, q in zip(messages, compiled)), return_exceptions=True)
+    queries: Dict[int, Tuple[str, List[Dict[str, Any]]]] = {}
+    statuses: Dict[int, str] = {}
+    for i, parsed in enumerate(generated):
+        if isinstance(parsed, json.JSONDecodeError):
+            PARSE_FAILURES.inc()
+            answers[i]["error"] = f"AI Error: Failed to parse response. Raw: {parsed.doc}"
+            statuses[i] = "parse_error"
+        elif isinstance(parsed, Exception):
+            answers[i]["error"] = f"An error occurred: {str(parsed) or type(parsed).__name__}"
+            statuses[i] = "error"
+        elif isinstance(parsed, dict) and parsed.get("type") == "conversation":
+            answers[i]["response"] = parsed["message"]
+            statuses[i] = "conversation"
+        elif not isinstance(parsed, dict) or not parsed.get("collection") or not parsed.get("pipeline"):
+            answers[i]["response"] = "Sorry, I couldn't understand how to query the database for that."
+            statuses[i] = "no_query"
+        else:
+            queries[i] = (parsed["collection"], parsed["pipeline"])
+
+    pages = await execute_batch(queries)
+
+    async def finish(i: int) -> None:
+        if isinstance(pages[i], Exception):
+            raise pages[i]
+        collection_name, pipeline = queries[i]
+        answers[i].update(await answer_from_results(messages[i], collection_name, pipeline, *pages[i]))
+
+    finished = await asyncio.gather(*(finish(i) for i in queries), return_exceptions=True)
+    for i, outcome in zip(queries, finished):
+        if isinstance(outcome, Exception):
+            print(f"Error answering batch question {messages[i]!r}: {outcome}")
+            answers[i]["error"] = f"An error occurred: {str(outcome)}"
+            statuses[i] = "error"
+        else:
+            statuses[i] = "ok" if pages[i][0] else "timeout" if pages[i][1] else "empty"
+
+    for i, message in enumerate(messages):
+        collection_name, pipeline = queries.get(i, (None, None))
+        rows = len(pages[i][0]) if statuses[i] in ("ok", "empty", "timeout") else None
+        audit.question(message, statuses[i], collection_name, pipeline,
+                       "intent" if compiled[i] is not None else "model", rows=rows, error=answers[i]["error"])
+    audit.finish("ok", rows=sum(len(pages[i][0]) for i in queries if statuses[i] in ("ok", "empty", "timeout")))
+    return answers
+
+async def execute_batch(queries: Dict[int, Tuple[str, List[Dict[str, Any]]]]) -> Dict[int, Any]:
+    """First page of each query, as execute_query returns it (or the exception it raised).
+
+    Uncached queries on the same collection run as one $facet aggregation,
+    BATCH_FUSE_MAX at a time, when batching.fuse finds a safe way to
+    combine them. Queries the rollups answer, cached ones, and any group
+    whose fused query fails or runs out of time run on their own.
+    """
+    pages: Dict[int, Any] = {}
+
+    async def run_single(i: int, execution: str = "single") -> None:
+        BATCH_QUERIES.inc(execution=execution)
+        try:
+            pages[i] = await execute_query(*queries[i])
+        except Exception as e:
+            pages[i] = e
+
+    async def run_routed(i: int, routed) -> None:
+        BATCH_QUERIES.inc(execution="rollup")
+        collection_name, pipeline = queries[i]
+        try:
+            results, truncated = await run_bounded_aggregate(*routed)
+            results, continuation = finish_page(collection_name, pipeline, 0, results)
+            pages[i] = (results, truncated, continuation)
+        except Exception as e:
+            pages[i] = e
+
+    async def run_fused(collection_name: str, members: List[int]) -> None:
+        paged = [query_policy.paginate(queries[i][1]) for i in members]
+        generations = await asyncio.gather(*(result_cache.generation(collection_name, p) for p in paged))
+        try:
+            prepared = await asyncio.gather(*(prepare_pipeline(collection_name, p) for p in paged))
+            count = metadata.count(collection_name)
+            fused = fuse(prepared, allow_scan=count is not None and count <= BATCH_FUSE_SCAN_LIMIT)
+            if fused is not None:
+                results, timed_out = await run_bounded_aggregate(collection_name, fused)
+                if not timed_out:
+                    BATCH_QUERIES.inc(len(members), execution="fused")
+                    for i, rows, page_pipeline, generation in zip(members, split(results, len(members)),
+                                                                  paged, generations):
+                        await result_cache.set(collection_name, page_pipeline, rows, generation)
+                        rows, continuation = finish_page(collection_name, queries[i][1], 0, rows)
+                        pages[i] = (rows, False, continuation)
+                    return
+                print(f"Fused query on {collection_name} hit its time budget, running its queries separately")
+        except Exception as e:
+            # e.g. the combined rows outgrew MongoDB's 16MB document limit
+            print(f"Fused query on {collection_name} failed, running its queries separately: {e}")
+        await asyncio.gather(*(run_single(i) for i in members))
+
+    tasks = []
+    groups: Dict[str, List[int]] = {}
+    for i, (collection_name, pipeline) in queries.items():
+        paged = query_policy.paginate(pipeline)
+        routed = planner.route(collection_name, paged) if USE_ROLLUPS else None
+        if routed:
+            note("route", f"{collection_name} totals -> {routed[0]}")
+            tasks.append(run_routed(i, routed))
+        elif await result_cache.get(collection_name, paged) is not None:
+            tasks.append(run_single(i, execution="cached"))
+        elif not facet_safe(pipeline):
+            tasks.append(run_single(i))
+        else:
+            groups.setdefault(collection_name, []).append(i)
+    for collection_name, members in groups.items():
+        if len(members) == 1:
+            tasks.append(run_single(members[0]))
+            continue
+        for start in range(0, len(members), BATCH_FUSE_MAX):
+            chunk = members[start:start + BATCH_FUSE_MAX]
+            tasks.append(run_fused(collection_name, chunk) if len(chunk) > 1 else run_single(chunk[0]))
+    await asyncio.gather(*tasks)
+    return pages
 
 @app.get("/health")
 async def health_check():
+    """Served from in-process state only, so it is safe to poll under load"""
     return {
         "status": "ok",
+        "worker": {"pid": os.getpid(), "leader": LEADER, "shared_store": SHARED_STORE_PATH},
         "gemini_ready": GEMINI_READY,
-        "mongodb_connected": client is not None,
-        "available_collections": db.list_collection_names() if client else []
+        "gemini_model": model_pool.preferred if GEMINI_READY else None,
+        "models": model_pool.stats(),
+        "chat_sessions": sessions.stats(),
+        "pipeline_cache": pipeline_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "coalescing": flights.stats(),
+        "profiler": profiler.stats(),
+        "audit": audit_log.stats(),
+        "rollups": {**rollups.stats(), "routed": planner.routed} if USE_ROLLUPS else None,
+        "mongodb_connected": metadata.healthy,
+        "mongodb_error": metadata.error,
+        "available_collections": metadata.collections(),
+        "snapshot_age_seconds": metadata.age(),
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of request stage latencies and counters, summed over every worker"""
+    text = await worker_metrics.render() if worker_metrics else registry.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/debug/transactions")
 async def debug_transactions():
-    """Debug endpoint to see what transaction types exist"""
-    try:
-        # Get distinct transaction types
-        types = db.transactions.distinct("type")
-        
-        # Get sample transactions
-        samples = list(db.transactions.find().limit(5))
-        for doc in samples:
-            doc["_id"] = str(doc["_id"])
-            if "createdAt" in doc:
-                doc["createdAt"] = str(doc["createdAt"])
-        
-        return {
-            "distinct_types": types,
-            "sample_transactions": samples,
-            "total_count": db.transactions.count_documents({})
-        }
-    except Exception as e:
-        return {"error": str(e)}
+    """Debug endpoint to see what transaction types exist, from the metadata snapshot"""
+    return BSONJSONResponse({
+        "distinct_types": metadata.distinct("transactions", "type"),
+        "sample_transactions": metadata.samples(),
+        "total_count": metadata.count("transactions"),
+        "snapshot_age_seconds": metadata.age(),
+    })
 
 @app.get("/schemas")
 async def get_schemas():
     """Endpoint to view all available schemas"""
-    return {
-        "profiles": {
-            "fields": ["clerkId", "userId", "email", "fullName", "phone", "address", "kycStatus", "isAdmin", "createdAt", "updatedAt"],
-            "description": "User profile information - JOIN KEY: clerkId"
-        },
-        "accounts": {
-            "fields": ["userId", "accountNumber", "accountType", "balance", "currency", "status", "createdAt", "updatedAt"],
-            "description": "Bank accounts - userId references profiles.clerkId"
-        },
-        "transactions": {
-            "fields": ["userId", "accountId", "amount", "type", "status", "description", "referenceId", "createdAt"],
-            "description": "Transactions - userId references profiles.clerkId (NO NAME FIELD!)"
-        },
-        "loans": {
-            "fields": ["userId", "loanType", "amount", "interestRate", "tenureMonths", "status", "totalPayable", "amountPaid", "emiAmount", "createdAt"],
-            "description": "Loans - userId references profiles.clerkId"
-        },
-        "emipayments": {
-            "fields": ["loanId", "userId", "emiNumber", "amount", "status", "dueDate", "paidDate", "createdAt"],
-            "description": "EMI payments - userId references profiles.clerkId"
-        }
-    }
+    return schemas_summary()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from python_service.pipeline_optimizer import ENUM_FIELDS
+
+
+class MetadataRefresher:
+    """Collection metadata for /health and /debug, refreshed in the background.
+
+    Every `interval` seconds one refresh reads the collection list, each
+    collection's estimated document count (from collection metadata, not a
+    scan), the distinct values of the enum-like fields and a few sample
+    documents. Endpoints read the last snapshot and report how old it is,
+    so polling them costs no database work at all. A snapshot older than
+    `stale_after` (three intervals by default) counts as unhealthy, in case
+    refreshes stop without failing.
+    """
+
+    def __init__(self, db, interval: float = 30, distinct_fields: Optional[Dict[str, List[str]]] = None,
+                 sample_collection: str = "transactions", sample_size: int = 5,
+                 stale_after: Optional[float] = None):
+        self.db = db
+        self.interval = interval
+        self.stale_after = 3 * interval if stale_after is None else stale_after
+        self.distinct_fields = ENUM_FIELDS if distinct_fields is None else distinct_fields
+        self.sample_collection = sample_collection
+        self.sample_size = sample_size
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.refreshed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def refresh(self) -> None:
+        collections = sorted(await self.db.list_collection_names())
+        counts = await asyncio.gather(*(self.db[name].estimated_document_count() for name in collections))
+        distinct: Dict[str, Dict[str, List[Any]]] = {}
+        for collection, fields in self.distinct_fields.items():
+            if collection in collections:
+                values = await asyncio.gather(*(self.db[collection].distinct(field) for field in fields))
+                distinct[collection] = dict(zip(fields, values))
+        samples = []
+        if self.sample_collection in collections:
+            samples = await self.db[self.sample_collection].find().limit(self.sample_size).to_list()
+
+        self.snapshot = {
+            "collections": collections,
+            "counts": dict(zip(collections, counts)),
+            "distinct": distinct,
+            "samples": samples,
+        }
+        self.refreshed_at = time.time()
+        self.last_error = None
+
+    async def run(self) -> None:
+        """Refresh every `interval` seconds until cancelled"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Not only database errors: anything that escaped would end the loop for good
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Metadata refresh failed: {self.last_error}")
+            await asyncio.sleep(self.interval)
+
+    def age(self) -> Optional[float]:
+        """Seconds since the last successful refresh"""
+        return round(time.time() - self.refreshed_at, 3) if self.refreshed_at else None
+
+    @property
+    def healthy(self) -> bool:
+        return self.snapshot is not None and self.error is None
+
+    @property
+    def error(self) -> Optional[str]:
+        """Why the snapshot can't be trusted: the last refresh failed, or none has succeeded for too long"""
+        if self.last_error is not None:
+            return self.last_error
+        if self.refreshed_at is not None and time.time() - self.refreshed_at > self.stale_after:
+            return f"No successful refresh for {time.time() - self.refreshed_at:.0f}s"
+        return None
+
+    def collections(self) -> List[str]:
+        return self.snapshot["collections"] if self.snapshot else []
+
+    def count(self, collection: str) -> Optional[int]:
+        return self.snapshot["counts"].get(collection) if self.snapshot else None
+
+    def distinct(self, collection: str, field: str) -> Optional[List[Any]]:
+        if not self.snapshot:
+            return None
+        return self.snapshot["distinct"].get(collection, {}).get(field)
+
+    def samples(self) -> List[Dict[str, Any]]:
+        return self.snapshot["samples"] if self.snapshot else []
@@ -0,0 +1,233 @@
+import asyncio
+import bisect
+import copy
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans a cached lookup up to a slow Gemini call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> list:
+        return [[list(key), value] for key, value in self._values.items()]
+
+    def combined(self, snapshots: Iterable[list]) -> "Counter":
+        """A counter of the same name holding the sum of `snapshots`"""
+        total = copy.copy(self)
+        total._values = {}
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                total._values[tuple(key)] = total._values.get(tuple(key), 0) + value
+        return total
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing is a bisect and two additions"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> list:
+        # Copies, since the snapshot may be encoded on another thread while observations go on
+        return [[list(key), list(counts), total] for key, (counts, total) in self._series.items()]
+
+    def combined(self, snapshots: Iterable[list]) -> "Histogram":
+        """A histogram of the same name holding the sum of `snapshots`"""
+        total = copy.copy(self)
+        total._series = {}
+        for snapshot in snapshots:
+            for key, counts, value in snapshot:
+                if len(counts) != len(self.buckets) + 1:
+                    continue  # From a worker running other buckets
+                series = total._series.setdefault(tuple(key), [[0] * len(counts), 0.0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += value
+        return total
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# Seconds per stage for the request being handled, when it collects them (the audit log does)
+request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+
+class StageHistogram(Histogram):
+    """Histogram by stage that also adds each observation to the current request's `request_stages`"""
+
+    def observe(self, value: float, **labels: str) -> None:
+        super().observe(value, **labels)
+        stages = request_stages.get()
+        if stages is not None:
+            stage = labels.get("stage", "")
+            stages[stage] = stages.get(stage, 0.0) + value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.add(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, list]:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots: Optional[Sequence[Dict[str, list]]] = None) -> str:
+        """All metrics in the Prometheus text exposition format; with `snapshots`, their sum instead"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            if snapshots is not None:
+                metric = metric.combined(snapshot.get(metric.name, []) for snapshot in snapshots)
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class WorkerMetrics:
+    """Every serve.py worker's metrics added up, through a SharedStore.
+
+    Each worker writes a snapshot of its registry to the store every
+    `interval` seconds and before rendering, so /metrics gives the same
+    totals whichever worker answers, at most `interval` seconds behind.
+    Snapshots of workers that have exited are kept, since dropping them
+    would make counters go backwards; serve.py clears them on startup.
+    """
+
+    def __init__(self, registry: Registry, shared, interval: float = 5):
+        self.registry = registry
+        self.interval = interval
+        self._snapshots = shared.cache("metrics", maxsize=100000)
+        self._key: Optional[Tuple[int, float]] = None
+
+    @property
+    def key(self) -> Tuple[int, float]:
+        # With the start time, a worker that reuses an exited one's pid doesn't overwrite its counts
+        if self._key is None or self._key[0] != os.getpid():
+            self._key = (os.getpid(), time.time())
+        return self._key
+
+    def publish(self, snapshot: Optional[Dict[str, list]] = None) -> None:
+        self._snapshots.set(self.key, snapshot or self.registry.snapshot())
+
+    async def render(self) -> str:
+        # Snapshots are taken on the event loop, which is what updates the metrics; only store I/O goes to a thread
+        await asyncio.to_thread(self.publish, self.registry.snapshot())
+        return self.registry.render(await asyncio.to_thread(self._snapshots.values))
+
+    def reset(self) -> None:
+        self._snapshots.clear()
+
+    async def run(self) -> None:
+        """Publish every `interval` seconds until cancelled, and once more then"""
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await asyncio.to_thread(self.publish, self.registry.snapshot())
+        finally:
+            self.publish()
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "chat_request_seconds", "Time to answer a /chat request (to the first byte for streams)", ["mode"])
+STAGE_SECONDS = registry.add(StageHistogram(
+    "chat_stage_seconds", "Time spent in each stage of a /chat request", ["stage"]))
+LLM_TOKENS = registry.counter(
+    "chat_llm_tokens_total", "Gemini tokens by call and direction", ["call", "direction"])
+RESULT_ROWS = registry.counter(
+    "chat_result_rows_total", "Rows returned to clients", ["collection"])
+EMPTY_RESULTS = registry.counter(
+    "chat_empty_results_total", "Queries that matched nothing and fell back to sample data", ["collection"])
+LOCAL_INTENTS = registry.counter(
+    "chat_local_intents_total", "Questions by the local intent that answered them (none: sent to Gemini)", ["intent"])
+PARSE_FAILURES = registry.counter(
+    "chat_parse_failures_total", "Gemini replies that were not valid JSON")
+BATCH_QUERIES = registry.counter(
+    "chat_batch_queries_total", "Queries answered in /chat/batch, by how they were executed", ["execution"])
+CANCELLED_REQUESTS = registry.counter(
+    "chat_cancelled_requests_total", "Streamed requests whose client disconnected before they finished", ["mode"])
+EXPORT_ROWS = registry.counter(
+    "chat_export_rows_total", "Rows written by /chat/export", ["format"])
+EXPORT_SECONDS = registry.histogram(
+    "chat_export_seconds", "Time to stream a whole /chat/export; rows per second is rows_total / seconds_sum",
+    ["format"], buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600))
+AUDIT_RECORDS = registry.counter(
+    "chat_audit_records_total", "Audit log records by outcome (written, dropped when the queue was full, failed)",
+    ["outcome"])
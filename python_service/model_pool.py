@@ -0,0 +1,218 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class ModelUnavailable(RuntimeError):
+    pass
+
+
+class RollingStats:
+    """Latency and outcome of a model's last `window` calls"""
+
+    def __init__(self, window: int = 100, min_samples: int = 20):
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.samples.append((latency, ok))
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def summary(self) -> Dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "calls": len(self.samples),
+            "error_rate": round(self.error_rate(), 3),
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class CircuitBreaker:
+    """Stops sending calls to a failing model for `open_seconds`, then lets one trial call through.
+
+    Opens after `consecutive_failures` failures in a row, or once the
+    rolling error rate reaches `error_rate` over at least `min_calls` calls.
+    """
+
+    def __init__(self, consecutive_failures: int = 5, error_rate: float = 0.5, min_calls: int = 10,
+                 open_seconds: float = 30):
+        self.consecutive_failures = consecutive_failures
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+        return self.state != OPEN
+
+    def record(self, ok: bool, stats: RollingStats) -> bool:
+        """Note a call's outcome. Returns whether this opened the breaker."""
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = False
+        if ok:
+            self.failures = 0
+            self.state = CLOSED
+            return False
+        self.failures += 1
+        tripped = self.failures >= self.consecutive_failures or (
+            len(stats.samples) >= self.min_calls and stats.error_rate() >= self.error_rate)
+        if self.state == HALF_OPEN or (self.state == CLOSED and tripped):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class ModelPool:
+    """Runs each LLM call on the preferred model, hedging to a backup when it is slow.
+
+    `run(func)` calls `func(model_name)` on the first available model in
+    preference order. If no answer arrives within that model's hedge delay
+    (its rolling p95 latency, clamped to [hedge_min, hedge_max]) the call
+    is also started on the next model, up to `max_in_flight` at once, and
+    the first success wins. A failure moves straight on to the next model.
+    Models whose circuit breaker is open are skipped. The whole call gives
+    up after `timeout` seconds.
+    """
+
+    def __init__(self, models: List[str], timeout: float = 30, hedge_min: float = 1, hedge_max: float = 8,
+                 hedge_quantile: float = 0.95, max_in_flight: int = 2, window: int = 100,
+                 breaker: Optional[Callable[[], CircuitBreaker]] = None):
+        self.models = list(models)
+        self.timeout = timeout
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.hedge_quantile = hedge_quantile
+        self.max_in_flight = max_in_flight
+        self.preferred: Optional[str] = self.models[0] if self.models else None
+        self.rolling = {name: RollingStats(window) for name in self.models}
+        self.breakers = {name: (breaker or CircuitBreaker)() for name in self.models}
+        self.calls = 0
+        self.hedged = 0
+        self.backup_answers = 0
+        self.failovers = 0
+
+    def prefer(self, model_name: str) -> None:
+        if model_name in self.rolling:
+            self.preferred = model_name
+
+    def order(self) -> List[str]:
+        return sorted(self.models, key=lambda name: name != self.preferred)
+
+    def hedge_delay(self, model_name: str) -> float:
+        latency = self.rolling[model_name].quantile(self.hedge_quantile)
+        if latency is None:
+            return self.hedge_max
+        return min(max(latency, self.hedge_min), self.hedge_max)
+
+    def _record(self, model_name: str, latency: float, ok: bool) -> None:
+        stats = self.rolling[model_name]
+        stats.record(latency, ok)
+        if self.breakers[model_name].record(ok, stats):
+            print(f"Circuit breaker opened for {model_name} "
+                  f"(error rate {stats.error_rate():.0%}), retrying it in {self.breakers[model_name].open_seconds}s")
+
+    async def run(self, func: Callable[[str], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        candidates = iter(self.order())
+        pending: Dict[asyncio.Future, Tuple[str, float]] = {}
+        last_error: Optional[BaseException] = None
+        # The model most recently started and when; its hedge delay decides when to start another
+        newest: Optional[str] = None
+        newest_at = 0.0
+
+        def launch() -> bool:
+            nonlocal newest, newest_at
+            for name in candidates:
+                if self.breakers[name].allow():
+                    newest, newest_at = name, time.monotonic()
+                    pending[asyncio.ensure_future(func(name))] = (name, newest_at)
+                    return True
+            newest = None
+            return False
+
+        if not launch():
+            raise ModelUnavailable("Every model's circuit breaker is open")
+        first = newest
+        answered = False
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    for task, (name, started) in pending.items():
+                        task.cancel()
+                        self._record(name, time.monotonic() - started, ok=False)
+                    pending.clear()
+                    raise TimeoutError(f"No model answered within {self.timeout}s")
+                can_hedge = newest is not None and len(pending) < self.max_in_flight
+                wait = remaining
+                if can_hedge:
+                    wait = min(remaining, max(0.0, self.hedge_delay(newest) - (time.monotonic() - newest_at)))
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if can_hedge and launch():
+                        self.hedged += 1
+                    continue
+                for task in done:
+                    name, started = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self._record(name, time.monotonic() - started, ok=True)
+                        if name != first:
+                            self.backup_answers += 1
+                        answered = True
+                        return task.result()
+                    last_error = error
+                    self._record(name, time.monotonic() - started, ok=False)
+                    print(f"Model {name} failed: {str(error) or type(error).__name__}")
+                    # Fail over right away rather than waiting for a hedge delay
+                    if newest is not None and len(pending) < self.max_in_flight and launch():
+                        self.failovers += 1
+            raise last_error or ModelUnavailable("No model available")
+        finally:
+            for task, (name, started) in pending.items():
+                task.cancel()
+                if answered:
+                    # Lost the race: at least this slow, so it still counts towards its latency
+                    self.rolling[name].record(time.monotonic() - started, True)
+                if self.breakers[name].state == HALF_OPEN:
+                    self.breakers[name].trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "preferred": self.preferred,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "backup_answers": self.backup_answers,
+            "failovers": self.failovers,
+            "models": {
+                name: {**self.rolling[name].summary(), "breaker": self.breakers[name].state,
+                       "hedge_after_seconds": round(self.hedge_delay(name), 3)}
+                for name in self.models
+            },
+        }
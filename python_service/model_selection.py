@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ModelSelector:
+    """Picks the first working Gemini model, lazily and at most once at a time.
+
+    All candidates are probed concurrently with a timeout and the most
+    preferred one that answered wins. The choice is written to `cache_path`
+    so restarts within `cache_ttl` skip probing altogether. After a failed
+    selection, probing is retried no sooner than `retry_seconds` later.
+    """
+
+    def __init__(self, models_to_try: List[str], probe: Callable[[str], Any], cache_path: str,
+                 cache_ttl: float = 86400, probe_timeout: float = 10, retry_seconds: float = 60):
+        self.models_to_try = models_to_try
+        self.probe = probe
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.probe_timeout = probe_timeout
+        self.retry_seconds = retry_seconds
+        self.selected: Optional[str] = None
+        self.last_failure: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> Optional[str]:
+        if self.selected:
+            return self.selected
+        async with self._lock:
+            if self.selected:
+                return self.selected
+            if self.last_failure and time.monotonic() - self.last_failure < self.retry_seconds:
+                return None
+
+            cached = self._read_cache()
+            if cached:
+                print(f"✓ Using cached Gemini model selection: {cached}")
+                self.selected = cached
+                return cached
+
+            self.selected = await self._probe_all()
+            if self.selected:
+                self._write_cache(self.selected)
+            else:
+                self.last_failure = time.monotonic()
+            return self.selected
+
+    def forget(self) -> None:
+        """Drop the current choice (e.g. after the model stops working)"""
+        self.selected = None
+        try:
+            os.remove(self.cache_path)
+        except OSError:
+            pass
+
+    async def _probe_one(self, model_name: str) -> bool:
+        try:
+            await asyncio.wait_for(self.probe(model_name), timeout=self.probe_timeout)
+            print(f"✓ Gemini model {model_name} responded")
+            return True
+        except Exception as e:
+            print(f"✗ FAILED to configure model {model_name}: {str(e) or type(e).__name__}")
+            return False
+
+    async def _probe_all(self) -> Optional[str]:
+        results = await asyncio.gather(*(self._probe_one(name) for name in self.models_to_try))
+        for model_name, ok in zip(self.models_to_try, results):
+            if ok:
+                print(f"✓✓✓ SUCCESS: Gemini API configured with model: {model_name}")
+                return model_name
+        print("=" * 80)
+        print("CRITICAL ERROR: All Gemini models failed to initialize.")
+        print("=" * 80)
+        return None
+
+    def _read_cache(self) -> Optional[str]:
+        try:
+            with open(self.cache_path) as f:
+                cached: Dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            return None
+        fresh = time.time() - cached.get("selected_at", 0) < self.cache_ttl
+        if fresh and cached.get("model") in self.models_to_try:
+            return cached["model"]
+        return None
+
+    def _write_cache(self, model_name: str) -> None:
+        try:
+            with open(self.cache_path, "w") as f:
+                json.dump({"model": model_name, "selected_at": time.time()}, f)
+        except OSError as e:
+            print(f"Could not cache Gemini model selection: {e}")
@@ -0,0 +1,204 @@
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from python_service.cache import TTLCache
+from python_service.shared_store import off_loop
+
+MONTHS = {
+    name: index
+    for index, name in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"],
+        start=1,
+    )
+}
+
+# Capitalised word runs after a preposition: "transactions for Alice Smith"
+NAME_PATTERN = re.compile(
+    r"\b(?:for|by|of|named|called|about|from|to)\s+([A-Z][\w'.-]*(?:\s+[A-Z][\w'.-]*)*)"
+)
+RELATIVE_MONTH_PATTERN = re.compile(r"\b(this|current|last|previous)\s+month\b", re.IGNORECASE)
+NAMED_MONTH_PATTERN = re.compile(
+    r"\b(?:in\s+|for\s+|during\s+)?(" + "|".join(MONTHS) + r")(?:\s+(\d{4}))?\b",
+    re.IGNORECASE,
+)
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def month_range(year: int, month: int) -> Tuple[date, date]:
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+# Symbols that change a question's meaning, kept as words before punctuation is stripped
+# (longest first, so ">=" isn't read as ">" then "=")
+SYMBOL_WORDS = [
+    (">=", " gte "), ("<=", " lte "), ("!=", " ne "), ("=>", " gte "), ("=<", " lte "),
+    (">", " gt "), ("<", " lt "), ("=", " eq "), ("%", " percent "), ("$", " dollar "),
+    ("+", " plus "), ("&", " and "), ("#", " number "),
+]
+NEGATIVE_NUMBER_PATTERN = re.compile(r"(?<![\w])-(?=\d)")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercased words of `question`: the cache and in-flight key for the question as asked"""
+    text = NEGATIVE_NUMBER_PATTERN.sub(" minus ", question.lower())
+    for symbol, word in SYMBOL_WORDS:
+        text = text.replace(symbol, word)
+    text = re.sub(r"[^\w\s{}]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def extract_parameters(question: str) -> Tuple[str, Dict[str, Any]]:
+    """Split a question into a template and its parameters.
+
+    "Transactions for Alice in November" becomes
+    ("transactions for {name_0} {month}", {"name_0": "Alice", "month": (2025-11-01, 2025-12-01)}).
+    """
+    params: Dict[str, Any] = {}
+    template = question
+
+    current = today()
+    match = RELATIVE_MONTH_PATTERN.search(template)
+    if match:
+        year, month = current.year, current.month
+        if match.group(1).lower() in ("last", "previous"):
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        params["month"] = month_range(year, month)
+        template = template[: match.start()] + "{month}" + template[match.end():]
+    else:
+        match = NAMED_MONTH_PATTERN.search(template)
+        if match:
+            month = MONTHS[match.group(1).lower()]
+            if match.group(2):
+                year = int(match.group(2))
+            else:
+                # Most recent occurrence of that month
+                year = current.year if month <= current.month else current.year - 1
+            params["month"] = month_range(year, month)
+            template = template[: match.start()] + "{month}" + template[match.end():]
+
+    names: List[str] = []
+    for match in NAME_PATTERN.finditer(template):
+        words = [w.rstrip(".") for w in match.group(1).split() if w.lower() not in MONTHS]
+        if words:
+            names.append(" ".join(words))
+    for index, name in enumerate(names):
+        params[f"name_{index}"] = name
+        template = template.replace(name, "{" + f"name_{index}" + "}", 1)
+
+    return normalize_question(template), params
+
+
+def _word_pattern(text: str) -> "re.Pattern[str]":
+    """`text` as a whole word, in any case: matches "Al" in "^Al$" but not the "al" of withdrawal"""
+    return re.compile(r"(?<!\w)" + re.escape(text) + r"(?!\w)", re.IGNORECASE)
+
+
+def _replace_strings(value: Any, replacements: List[Tuple[str, str]], words: bool = False) -> Any:
+    """Copy of `value` with each old text replaced by its new one; with `words`, only where _word_pattern matches"""
+    if isinstance(value, str):
+        for old, new in replacements:
+            if words:
+                value = _word_pattern(old).sub(lambda _: new, value)
+            else:
+                value = value.replace(old, new)
+        return value
+    if isinstance(value, dict):
+        return {k: _replace_strings(v, replacements, words) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_replace_strings(v, replacements, words) for v in value]
+    return value
+
+
+def _slot_values(params: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(concrete text, placeholder) pairs for every parameter"""
+    pairs = []
+    for key, value in params.items():
+        if key == "month":
+            start, end = value
+            pairs.append((start.isoformat(), "{{month_start}}"))
+            pairs.append((end.isoformat(), "{{month_end}}"))
+        else:
+            pairs.append((value, "{{" + key + "}}"))
+    return pairs
+
+
+def _strings(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return [text for item in value for text in _strings(item)]
+    return []
+
+
+def _contains(value: Any, needle: str) -> bool:
+    return any(needle.lower() in text.lower() for text in _strings(value))
+
+
+def _only_as_word(value: Any, name: str) -> bool:
+    """Whether `name` appears in `value`'s strings, and every time as a whole word.
+
+    Otherwise templating it would also rewrite other words: the "al" of
+    "withdrawal" for a customer called Al.
+    """
+    pattern = _word_pattern(name)
+    counts = [(text.lower().count(name.lower()), len(pattern.findall(text))) for text in _strings(value)]
+    return all(anywhere == as_word for anywhere, as_word in counts) and any(as_word for _, as_word in counts)
+
+
+class PipelineCache:
+    """Caches generated queries so repeat questions skip the Gemini round-trip.
+
+    Queries are stored as templates: the names and month ranges pulled out of
+    the question are swapped for placeholders, so "transactions for Alice" and
+    "transactions for Bob" share one entry. When a parameter can't be located
+    in the generated pipeline, or a name also appears inside other words
+    there, the query is cached for the literal question only.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600, shared=None):
+        # A SharedStore lets every worker process reuse the others' queries
+        self.shared = shared is not None
+        if self.shared:
+            self._cache = shared.cache("pipelines", maxsize=maxsize, ttl=ttl)
+        else:
+            self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        return await off_loop(self.shared, self._lookup, question)
+
+    async def store(self, question: str, query: Dict[str, Any]) -> None:
+        await off_loop(self.shared, self._store, question, query)
+
+    def _lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        template, params = extract_parameters(question)
+        if params and ("template", template) in self._cache:
+            cached = self._cache.get(("template", template))
+            placeholders = [(placeholder, text) for text, placeholder in _slot_values(params)]
+            return _replace_strings(cached, placeholders)
+        return self._cache.get(("literal", normalize_question(question)))
+
+    def _store(self, question: str, query: Dict[str, Any]) -> None:
+        template, params = extract_parameters(question)
+        pairs = _slot_values(params)
+        months = [p for p in pairs if p[1].startswith("{{month")]
+        names = [p for p in pairs if p not in months]
+        if params and all(_only_as_word(query, text) for text, _ in names) \
+                and all(_contains(query, text) for text, _ in months):
+            # Names are matched case-insensitively since the model may re-case them
+            templated = _replace_strings(query, names, words=True)
+            templated = _replace_strings(templated, months)
+            self._cache.set(("template", template), templated)
+        else:
+            self._cache.set(("literal", normalize_question(question)), query)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
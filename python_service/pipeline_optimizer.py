@@ -0,0 +1,306 @@
+import copy
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+# Fields with a small, fixed set of values. Case-insensitive regexes on these
+# can be answered with an exact-value $in, which an index can serve.
+ENUM_FIELDS = {
+    "transactions": ["type", "status"],
+    "accounts": ["accountType", "status", "currency"],
+    "profiles": ["kycStatus"],
+    "loans": ["loanType", "status"],
+    "emipayments": ["status"],
+}
+
+# Name resolution gives up (keeping the join) beyond this many matching users
+MAX_RESOLVED_IDS = 1000
+
+
+def decode_extended_json(value: Any) -> Any:
+    """Turn {"$date": ...} / {"$oid": ...} wrappers from the model into BSON values"""
+    if isinstance(value, dict):
+        if len(value) == 1 and "$date" in value:
+            raw = value["$date"]
+            if isinstance(raw, (int, float)):
+                return datetime.fromtimestamp(raw / 1000, tz=timezone.utc)
+            if isinstance(raw, str):
+                try:
+                    parsed = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+                except ValueError:
+                    return value
+                return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        if len(value) == 1 and "$oid" in value and ObjectId.is_valid(value["$oid"]):
+            return ObjectId(value["$oid"])
+        return {k: decode_extended_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_extended_json(v) for v in value]
+    return value
+
+
+def _references(value: Any, name: str) -> bool:
+    """Whether any key or string in `value` refers to field `name`"""
+    if isinstance(value, str):
+        return value == "$" + name or value.startswith("$" + name + ".")
+    if isinstance(value, dict):
+        return any(
+            k == name or k.startswith(name + ".") or _references(v, name)
+            for k, v in value.items()
+        )
+    if isinstance(value, list):
+        return any(_references(v, name) for v in value)
+    return False
+
+
+def _unwind_path(stage: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+    """(`as` field, preserveNullAndEmptyArrays) of an $unwind stage"""
+    spec = stage.get("$unwind")
+    if isinstance(spec, str):
+        return spec.lstrip("$"), False
+    if isinstance(spec, dict):
+        return spec.get("path", "").lstrip("$"), bool(spec.get("preserveNullAndEmptyArrays"))
+    return None, False
+
+
+def _match_conditions(stage: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split a $match into independent conditions (top-level keys and $and items)"""
+    conditions = []
+    for key, value in stage["$match"].items():
+        if key == "$and" and isinstance(value, list):
+            conditions.extend(value)
+        else:
+            conditions.append({key: value})
+    return conditions
+
+
+def _build_match(conditions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if len(conditions) == 1:
+        return {"$match": conditions[0]}
+    return {"$match": {"$and": conditions}}
+
+
+def plan_summary(explain: Dict[str, Any]) -> str:
+    """Compact winning-plan description, e.g. 'FETCH>IXSCAN(createdAt_1)'"""
+    plans = []
+
+    def walk(node: Any) -> None:
+        if isinstance(node, dict):
+            if "winningPlan" in node:
+                plans.append(_plan_stages(node["winningPlan"]))
+                return
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(explain)
+    return " | ".join(plans) or "unknown"
+
+
+def _plan_stages(plan: Dict[str, Any]) -> str:
+    plan = plan.get("queryPlan", plan)
+    stage = plan.get("stage", "?")
+    if plan.get("indexName"):
+        stage += f"({plan['indexName']})"
+    children = plan.get("inputStages") or ([plan["inputStage"]] if "inputStage" in plan else [])
+    if children:
+        stage += ">" + ",".join(_plan_stages(child) for child in children)
+    return stage
+
+
+class PipelineOptimizer:
+    """Rewrites generated pipelines into cheaper equivalents before execution.
+
+    - Extended JSON ({"$date": ...}) becomes real BSON values, so date ranges
+      actually compare against Date fields.
+    - A $lookup/$unwind joined only to filter on the joined document (the
+      "transactions for <name>" pattern) becomes a {localField: {$in: [...]}}
+      match against the ids resolved from the joined collection. The join is
+      kept, after $match/$sort/$limit, only if later stages read its fields.
+    - $match conditions that don't touch a join's output move ahead of it, as
+      do $sort/$limit/$skip when the join is one-to-one (no $unwind).
+    - Case-insensitive regexes on enum-like fields (ENUM_FIELDS) become $in
+      over the values actually present in the collection.
+    """
+
+    def __init__(self, db, explain: bool = False, values_ttl: float = 300):
+        self.db = db
+        self.explain = explain
+        self.values_ttl = values_ttl
+        self._values: Dict[Tuple[str, str], Tuple[float, List[Any]]] = {}
+
+    async def known_values(self, collection: str, field: str) -> Optional[List[Any]]:
+        cached = self._values.get((collection, field))
+        if cached and time.monotonic() - cached[0] < self.values_ttl:
+            return cached[1]
+        values = await self.db[collection].distinct(field)
+        self._values[(collection, field)] = (time.monotonic(), values)
+        return values
+
+    async def optimize(self, collection: str, pipeline: List[Dict[str, Any]],
+                       notes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """The rewritten pipeline; what was changed (and, with `explain`, the plans) is appended to `notes`"""
+        original = decode_extended_json(pipeline)
+        optimized = copy.deepcopy(original)
+        changes: List[str] = []
+
+        optimized = await self._resolve_joins(optimized, changes)
+        optimized = self._push_down(optimized, changes)
+        optimized = await self._exact_enum_matches(collection, optimized, changes)
+
+        if changes and notes is not None:
+            notes.extend(f"{collection}: {change}" for change in changes)
+            if self.explain:
+                notes.append(f"{collection}: plan before {await self._explain(collection, original)}")
+                notes.append(f"{collection}: plan after {await self._explain(collection, optimized)}")
+        return optimized
+
+    async def _explain(self, collection: str, pipeline: List[Dict[str, Any]]) -> str:
+        try:
+            result = await self.db.command(
+                {"explain": {"aggregate": collection, "pipeline": pipeline, "cursor": {}}, "verbosity": "queryPlanner"}
+            )
+            return plan_summary(result)
+        except Exception as e:
+            return f"explain failed: {e}"
+
+    async def _resolve_joins(self, pipeline: List[Dict[str, Any]], notes: List[str]) -> List[Dict[str, Any]]:
+        i = 0
+        while i < len(pipeline) - 2:
+            lookup = pipeline[i].get("$lookup")
+            if not isinstance(lookup, dict) or "localField" not in lookup or "pipeline" in lookup:
+                i += 1
+                continue
+            joined = lookup["as"]
+            unwound, preserve = _unwind_path(pipeline[i + 1])
+            if unwound != joined or preserve or "$match" not in pipeline[i + 2]:
+                i += 1
+                continue
+
+            conditions = _match_conditions(pipeline[i + 2])
+            on_joined = [c for c in conditions if all(k.startswith(joined + ".") for k in c)]
+            # Conditions that read the join some other way (a $or mixing joined and source
+            # fields) can't run before it: they stay in a $match after the join stages
+            others = [c for c in conditions if c not in on_joined and not _references(c, joined)]
+            after_join = [c for c in conditions if c not in on_joined and c not in others]
+            if not on_joined:
+                i += 1
+                continue
+
+            # Run the joined-field filter against the joined collection itself
+            prefix = len(joined) + 1
+            foreign_filter = {"$and": [{k[prefix:]: v for k, v in c.items()} for c in on_joined]}
+            foreign_field = lookup["foreignField"]
+            cursor = self.db[lookup["from"]].find(foreign_filter, {foreign_field: 1, "_id": 0})
+            docs = await cursor.to_list(length=MAX_RESOLVED_IDS + 1)
+            if len(docs) > MAX_RESOLVED_IDS:
+                i += 1
+                continue
+            ids = sorted({d[foreign_field] for d in docs if d.get(foreign_field) is not None}, key=str)
+
+            join_stages = pipeline[i : i + 2]
+            rest = pipeline[i + 3 :]
+            filtered = [_build_match([{lookup["localField"]: {"$in": ids}}] + others)]
+            if after_join:
+                pipeline = pipeline[:i] + filtered + join_stages + [_build_match(after_join)] + rest
+                notes.append(f"resolved {joined} filter to {len(ids)} {foreign_field} values, "
+                             f"{len(after_join)} condition(s) on the join kept after it")
+                i += len(filtered)
+                continue
+            # Every remaining document now has a join partner, so the join can
+            # run after the stages that only narrow or reorder the documents
+            while rest and any(op in rest[0] for op in ("$match", "$sort", "$limit", "$skip")) \
+                    and not _references(rest[0], joined):
+                filtered.append(rest.pop(0))
+            if _references(rest, joined):
+                pipeline = pipeline[:i] + filtered + join_stages + rest
+                notes.append(f"resolved {joined} filter to {len(ids)} {foreign_field} values, join moved after filtering")
+            else:
+                pipeline = pipeline[:i] + filtered + rest
+                notes.append(f"resolved {joined} filter to {len(ids)} {foreign_field} values, join removed")
+            i += len(filtered)
+        return pipeline
+
+    def _push_down(self, pipeline: List[Dict[str, Any]], notes: List[str]) -> List[Dict[str, Any]]:
+        moved = True
+        while moved:
+            moved = False
+            for i in range(1, len(pipeline)):
+                stage = pipeline[i]
+                previous = pipeline[i - 1]
+                join = previous.get("$lookup")
+                unwound, _ = _unwind_path(previous)
+                if join and isinstance(join, dict):
+                    blocked_by = join.get("as")
+                    movable = ("$match", "$sort", "$limit", "$skip")
+                elif unwound and i >= 2 and isinstance(pipeline[i - 2].get("$lookup"), dict) \
+                        and pipeline[i - 2]["$lookup"].get("as") == unwound:
+                    # $unwind can drop or duplicate documents: only filters may pass it
+                    blocked_by = unwound
+                    movable = ("$match",)
+                else:
+                    continue
+                if any(op in stage for op in movable) and not _references(stage, blocked_by):
+                    pipeline[i - 1], pipeline[i] = stage, previous
+                    notes.append(f"moved {next(iter(stage))} ahead of {next(iter(previous))}")
+                    moved = True
+                    break
+        return pipeline
+
+    async def _exact_enum_matches(self, collection: str, pipeline: List[Dict[str, Any]], notes: List[str]) -> List[Dict[str, Any]]:
+        fields = ENUM_FIELDS.get(collection)
+        if not fields:
+            return pipeline
+        for stage in pipeline:
+            if "$match" in stage:
+                stage["$match"] = await self._rewrite_condition(collection, fields, stage["$match"], notes)
+            else:
+                # Only leading $match stages see the collection's own fields
+                break
+        return pipeline
+
+    async def _rewrite_condition(self, collection: str, fields: List[str], condition: Any, notes: List[str]) -> Any:
+        if isinstance(condition, list):
+            return [await self._rewrite_condition(collection, fields, c, notes) for c in condition]
+        if not isinstance(condition, dict):
+            return condition
+
+        rewritten = {}
+        for key, value in condition.items():
+            if key in ("$and", "$or", "$nor"):
+                value = await self._rewrite_condition(collection, fields, value, notes)
+                if key == "$or":
+                    value = self._merge_in_branches(value)
+            elif key in fields and isinstance(value, dict) and set(value) <= {"$regex", "$options"} \
+                    and isinstance(value.get("$regex"), str) and set(value.get("$options", "")) <= {"i"}:
+                values = await self.known_values(collection, key)
+                flags = re.IGNORECASE if "i" in value.get("$options", "") else 0
+                try:
+                    matching = [v for v in values if isinstance(v, str) and re.search(value["$regex"], v, flags)]
+                except re.error:
+                    rewritten[key] = value
+                    continue
+                notes.append(f"{key} regex /{value['$regex']}/ -> $in {matching}")
+                value = {"$in": matching}
+            rewritten[key] = value
+        return rewritten
+
+    def _merge_in_branches(self, branches: List[Any]) -> List[Any]:
+        """Fold {field: {$in: a}} or {field: {$in: b}} into one $in branch"""
+        merged: List[Any] = []
+        seen: Dict[str, Dict[str, Any]] = {}
+        for branch in branches:
+            if isinstance(branch, dict) and len(branch) == 1:
+                field, value = next(iter(branch.items()))
+                if isinstance(value, dict) and list(value) == ["$in"]:
+                    if field in seen:
+                        existing = seen[field]["$in"]
+                        existing.extend(v for v in value["$in"] if v not in existing)
+                        continue
+                    seen[field] = value
+            merged.append(branch)
+        return merged
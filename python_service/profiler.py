@@ -0,0 +1,252 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import Decimal128, ObjectId
+
+from python_service.pipeline_optimizer import ENUM_FIELDS, _references
+from python_service.prompt_library import SCHEMAS
+
+TYPE_NAMES = [
+    (bool, "bool"), (int, "int"), (float, "double"), (str, "string"), (datetime, "date"),
+    (ObjectId, "objectId"), (Decimal128, "decimal"), (dict, "object"), (list, "array"),
+]
+
+
+def type_name(value: Any) -> str:
+    """The BSON type name of a decoded value ($type spelling)"""
+    if value is None:
+        return "null"
+    for kind, name in TYPE_NAMES:
+        if isinstance(value, kind):
+            return name
+    return type(value).__name__
+
+
+def _day(value: Optional[datetime]) -> str:
+    return value.date().isoformat() if value else "?"
+
+
+class FieldProfile:
+    """Presence, types, values and date range of one top-level field"""
+
+    def __init__(self):
+        self.present = 0
+        self.types: Counter = Counter()
+        # None once the field has too many distinct values to list
+        self.values: Optional[set] = set()
+        # Set by a full profile from `distinct`, rather than inferred from the documents seen
+        self.exact_values = False
+        self.earliest: Optional[datetime] = None
+        self.latest: Optional[datetime] = None
+
+    def add(self, value: Any, max_distinct: int) -> None:
+        self.present += 1
+        kind = type_name(value)
+        self.types[kind] += 1
+        if kind in ("string", "bool") and self.values is not None:
+            self.values.add(value)
+            if len(self.values) > max_distinct and not self.exact_values:
+                self.values = None
+        elif kind == "date":
+            self.earliest = value if self.earliest is None else min(self.earliest, value)
+            self.latest = value if self.latest is None else max(self.latest, value)
+
+    def listed_values(self) -> Optional[List[Any]]:
+        """Distinct values when the field looks enum-like: mostly strings, each value seen twice or more on average"""
+        if not self.values:
+            return None
+        textual = self.types["string"] + self.types["bool"]
+        if not self.exact_values and (len(self.values) * 2 > self.present or textual * 2 < self.present):
+            return None
+        return sorted(self.values, key=str)
+
+    def summary(self, documents: int) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "presence": round(self.present / documents, 3) if documents else 0.0,
+            "types": dict(self.types.most_common()),
+        }
+        values = self.listed_values()
+        if values is not None:
+            result["values"] = values
+        if self.earliest is not None:
+            result["earliest"] = self.earliest
+            result["latest"] = self.latest
+        return result
+
+    def describe(self, name: str, documents: int) -> Optional[str]:
+        """One line about anything a query writer should know, or None if there is nothing notable"""
+        notes = []
+        values = self.listed_values()
+        if values is not None:
+            notes.append(" | ".join(str(v) for v in values))
+        if self.earliest is not None:
+            notes.append(f"{_day(self.earliest)} to {_day(self.latest)}")
+        kinds = [kind for kind in self.types if kind != "null"]
+        if len(kinds) > 1:
+            notes.append("stored as " + ", ".join(kinds))
+        if documents and self.present < documents * 0.95:
+            notes.append(f"in {self.present / documents:.0%} of documents")
+        return f"{name}: " + "; ".join(notes) if notes else None
+
+
+class CollectionProfile:
+    def __init__(self, name: str):
+        self.name = name
+        self.documents = 0
+        self.count: Optional[int] = None
+        self.fields: Dict[str, FieldProfile] = {}
+        self.samples: List[Dict[str, Any]] = []
+        self.last_id: Any = None
+        self.profiled_at = time.time()
+        self.updated_at = self.profiled_at
+
+    def add(self, document: Dict[str, Any], max_distinct: int) -> None:
+        self.documents += 1
+        for field, value in document.items():
+            if field != "_id":
+                self.fields.setdefault(field, FieldProfile()).add(value, max_distinct)
+
+    def describe(self, fields: Optional[List[str]] = None) -> List[str]:
+        names = fields if fields is not None else sorted(self.fields)
+        lines = (self.fields[name].describe(name, self.documents) for name in names if name in self.fields)
+        return [line for line in lines if line]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "documents_profiled": self.documents,
+            "fields": {name: field.summary(self.documents) for name, field in sorted(self.fields.items())},
+        }
+
+
+class CollectionProfiler:
+    """Field presence, types, enum-like values and date ranges per collection, kept in memory.
+
+    A full profile reads a `$sample` of `sample_size` documents, the exact
+    distinct values of the known enum fields and the exact range of each
+    date field that leads an index (other date fields keep the sample's
+    range, since finding theirs would sort the whole collection). Every `interval` seconds documents inserted since (by _id)
+    are folded in; every `full_interval` seconds the profile is rebuilt so
+    updates and deletes are reflected. Readers never touch the database.
+    """
+
+    def __init__(self, db, collections: Optional[List[str]] = None, interval: float = 60,
+                 full_interval: float = 3600, sample_size: int = 1000, max_distinct: int = 20,
+                 exact_values: Optional[Dict[str, List[str]]] = None, sample_rows: int = 5):
+        self.db = db
+        self.names = list(SCHEMAS) if collections is None else collections
+        self.interval = interval
+        self.full_interval = full_interval
+        self.sample_size = sample_size
+        self.max_distinct = max_distinct
+        self.exact_values = ENUM_FIELDS if exact_values is None else exact_values
+        self.sample_rows = sample_rows
+        self.profiles: Dict[str, CollectionProfile] = {}
+        self._prompt_text = ""
+        self.last_error: Optional[str] = None
+
+    async def profile(self, name: str) -> CollectionProfile:
+        collection = self.db[name]
+        profile = CollectionProfile(name)
+        documents = await (await collection.aggregate([{"$sample": {"size": self.sample_size}}])).to_list()
+        for document in documents:
+            profile.add(document, self.max_distinct)
+        profile.samples = documents[: self.sample_rows]
+
+        for field in self.exact_values.get(name, []):
+            if field in profile.fields:
+                profile.fields[field].values = set(await collection.distinct(field))
+                profile.fields[field].exact_values = True
+        indexed = {spec["key"][0][0] for spec in (await collection.index_information()).values()}
+        for field, stats in profile.fields.items():
+            if "date" in stats.types and field in indexed:
+                dated = {field: {"$type": "date"}}
+                first = await collection.find(dated, {field: 1}).sort(field, 1).limit(1).to_list()
+                last = await collection.find(dated, {field: 1}).sort(field, -1).limit(1).to_list()
+                if first and last:
+                    stats.earliest, stats.latest = first[0][field], last[0][field]
+        newest = await collection.find({}, {"_id": 1}).sort("_id", -1).limit(1).to_list()
+        profile.last_id = newest[0]["_id"] if newest else None
+        profile.count = await collection.estimated_document_count()
+        return profile
+
+    async def update(self, profile: CollectionProfile) -> None:
+        """Fold in documents inserted since the last refresh"""
+        collection = self.db[profile.name]
+        query = {"_id": {"$gt": profile.last_id}} if profile.last_id is not None else {}
+        documents = await collection.find(query).sort("_id", 1).limit(self.sample_size).to_list()
+        for document in documents:
+            profile.add(document, self.max_distinct)
+        if documents:
+            profile.last_id = documents[-1]["_id"]
+        profile.count = await collection.estimated_document_count()
+        profile.updated_at = time.time()
+
+    async def refresh_collection(self, name: str) -> None:
+        current = self.profiles.get(name)
+        if current is None or time.time() - current.profiled_at >= self.full_interval:
+            self.profiles[name] = await self.profile(name)
+        else:
+            await self.update(current)
+
+    async def refresh(self) -> None:
+        existing = set(await self.db.list_collection_names())
+        await asyncio.gather(*(self.refresh_collection(name) for name in self.names if name in existing))
+        self._prompt_text = self.render_prompt()
+        self.last_error = None
+
+    async def run(self) -> None:
+        """Refresh every `interval` seconds until cancelled"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Not only database errors: anything that escaped would end the loop for good
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Collection profiling failed: {self.last_error}")
+            await asyncio.sleep(self.interval)
+
+    def get(self, name: str) -> Optional[CollectionProfile]:
+        return self.profiles.get(name)
+
+    def render_prompt(self) -> str:
+        blocks = []
+        for name in self.names:
+            profile = self.profiles.get(name)
+            if profile is None or not profile.documents:
+                continue
+            lines = "\n".join(f"   - {line}" for line in profile.describe())
+            blocks.append(f"- {name} (~{profile.count or profile.documents} documents):\n{lines}")
+        if not blocks:
+            return ""
+        return "\n**CURRENT DATA (values and date ranges actually present):**\n" + "\n".join(blocks) + "\n"
+
+    def prompt_text(self) -> str:
+        """Profile section for the query-generation prompt, empty until the first refresh"""
+        return self._prompt_text
+
+    def empty_result_hint(self, collection: str, pipeline: List[Dict[str, Any]]) -> Optional[str]:
+        """What the collection holds for the fields `pipeline` uses (all fields if it names none)"""
+        profile = self.profiles.get(collection)
+        if profile is None:
+            return None
+        used = [name for name in sorted(profile.fields) if _references(pipeline, name)]
+        lines = profile.describe(used or None)
+        if not lines:
+            return None
+        age = round(time.time() - profile.updated_at)
+        header = f"What {collection} holds (~{profile.count or profile.documents} documents, profiled {age}s ago):"
+        return "\n".join([header] + [f"- {line}" for line in lines])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "collections": {
+                name: {"documents_profiled": profile.documents, "count": profile.count,
+                       "age_seconds": round(time.time() - profile.updated_at, 3)}
+                for name, profile in self.profiles.items()
+            },
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,284 @@
+"""The query-generation prompt, assembled from structured parts.
+
+The collection schemas (also served by /schemas), the query rules and the
+worked examples (examples.py) live here as data. `system_prompt(question)`
+renders the schema and rules with only the examples most relevant to the
+question, picked by a small BM25 index, instead of every example on every
+request. The current date in the rules and the month ranges in the
+examples are filled in when the prompt is rendered, along with the
+collection profile (profiler.py) when one is passed.
+"""
+import json
+import math
+import re
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from python_service.examples import EXAMPLES
+from python_service.pipeline_cache import extract_parameters, month_range, today
+
+# (field, type, comment) per collection, in the order the prompt lists them
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "profiles": {
+        "title": "User Profile Information",
+        "description": "User profile information - JOIN KEY: clerkId",
+        "fields": [
+            ("_id", "ObjectId", ""),
+            ("userId", "String", "May be Clerk user ID (legacy field, may not exist)"),
+            ("clerkId", "String", "Primary Clerk ID - USE THIS for joins"),
+            ("email", "String", "User email"),
+            ("fullName", "String", "Full name - USE FOR NAME SEARCHES"),
+            ("phone", "String", "Phone number"),
+            ("address", "String", "User address"),
+            ("kycStatus", "String", "KYC status (pending, verified, rejected)"),
+            ("isAdmin", "Boolean", "Admin flag"),
+            ("createdAt", "Date", ""),
+            ("updatedAt", "Date", ""),
+        ],
+    },
+    "accounts": {
+        "title": "Bank Accounts",
+        "description": "Bank accounts - userId references profiles.clerkId",
+        "fields": [
+            ("_id", "ObjectId", ""),
+            ("userId", "String", "References profiles.clerkId (or profiles.userId for legacy)"),
+            ("accountNumber", "String", ""),
+            ("accountType", "String", ""),
+            ("balance", "Number", ""),
+            ("currency", "String", ""),
+            ("status", "String", ""),
+            ("createdAt", "Date", ""),
+            ("updatedAt", "Date", ""),
+        ],
+    },
+    "transactions": {
+        "title": "Account Transactions",
+        "description": "Transactions - userId references profiles.clerkId (NO NAME FIELD!)",
+        "fields": [
+            ("_id", "ObjectId", ""),
+            ("userId", "String", "References profiles.clerkId - DOES NOT STORE NAME!"),
+            ("accountId", "ObjectId", "References accounts._id"),
+            ("amount", "Number", ""),
+            ("type", "String", 'IMPORTANT: Can be "credit", "debit", "deposit", "withdrawal", "transfer"\n'
+                               'For deposits, check for type containing "deposit" OR amount > 0 with credit type'),
+            ("status", "String", "completed, pending, failed"),
+            ("description", "String", 'May contain "deposit", "Stripe deposit", etc.'),
+            ("referenceId", "String", ""),
+            ("recipientAccountId", "ObjectId", ""),
+            ("recipientUserId", "String", ""),
+            ("createdAt", "Date", ""),
+        ],
+    },
+    "loans": {
+        "title": "Loan Applications",
+        "description": "Loans - userId references profiles.clerkId",
+        "fields": [
+            ("_id", "ObjectId", ""),
+            ("userId", "String", "References profiles.clerkId"),
+            ("loanType", "String", ""),
+            ("amount", "Number", ""),
+            ("interestRate", "Number", ""),
+            ("tenureMonths", "Number", ""),
+            ("status", "String", ""),
+            ("totalPayable", "Number", ""),
+            ("amountPaid", "Number", ""),
+            ("emiAmount", "Number", ""),
+            ("remainingAmount", "Number", ""),
+            ("disbursementAccountId", "ObjectId", ""),
+            ("approvedBy", "String", ""),
+            ("approvedAt", "Date", ""),
+            ("disbursedAt", "Date", ""),
+            ("nextEmiDate", "Date", ""),
+            ("createdAt", "Date", ""),
+            ("updatedAt", "Date", ""),
+        ],
+    },
+    "emipayments": {
+        "title": "EMI Payment Records",
+        "description": "EMI payments - userId references profiles.clerkId",
+        "fields": [
+            ("_id", "ObjectId", ""),
+            ("loanId", "ObjectId", ""),
+            ("userId", "String", "References profiles.clerkId"),
+            ("emiNumber", "Number", ""),
+            ("amount", "Number", ""),
+            ("principalAmount", "Number", ""),
+            ("interestAmount", "Number", ""),
+            ("status", "String", ""),
+            ("dueDate", "Date", ""),
+            ("paidDate", "Date", ""),
+            ("stripePaymentId", "String", ""),
+            ("transactionId", "ObjectId", ""),
+            ("createdAt", "Date", ""),
+        ],
+    },
+}
+
+INTRO = """
+You are an intelligent assistant for a banking application admin.
+Your goal is to help the admin query the MongoDB database using natural language.
+
+**CRITICAL: When querying by user name, you MUST use $lookup to join with profiles collection!**
+
+You have access to the following collections and their COMPLETE schemas:
+"""
+
+# Formatted with the current date by rules_text
+RULES = """
+**CRITICAL RULES:**
+
+1. **For NAME-BASED queries**: Always use $lookup to join profiles collection
+2. **For TRANSACTION TYPE queries**:
+   - Deposits can be identified by:
+     * type field containing "deposit" (case-insensitive)
+     * type field containing "credit" (case-insensitive)
+     * description field containing "deposit" (case-insensitive)
+     * description field containing "stripe deposit" (case-insensitive)
+   - ALWAYS use $or with multiple conditions to catch all variations
+   - DO NOT require amount > 0 as a mandatory condition - some systems store all amounts as positive
+   - Use $regex with $options: "i" for ALL text matching
+   - Example: {{"$or": [{{"type": {{"$regex": "deposit|credit", "$options": "i"}}}}, {{"description": {{"$regex": "deposit", "$options": "i"}}}}]}}
+3. **For DATE/TIME queries**:
+   - Current date is {today:%B} {today.day}, {today.year}
+   - "this month" means the CURRENT month ({month_start:%B %Y}) = createdAt field is already a Date type
+   - Use direct date comparison: {{"createdAt": {{"$gte": new Date("{month_start}"), "$lt": new Date("{month_end}")}}}}
+   - IMPORTANT: createdAt is already a Date object, NOT a string - never use $dateFromString
+   - For "last month" or "{last_month:%B}" use appropriate date ranges
+"""
+
+CONVERSATION_FALLBACK = """
+If the user's request is not about data query, return:
+{"type": "conversation", "message": "Your helpful response here"}
+"""
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+STOPWORDS = {"a", "an", "the", "me", "show", "what", "was", "is", "of", "in", "for", "by", "all", "made", "get"}
+
+
+def schema_text() -> str:
+    blocks = []
+    for number, (name, schema) in enumerate(SCHEMAS.items(), start=1):
+        lines = [f"{number}. **{name}** ({schema['title']}):", "   {"]
+        fields = schema["fields"]
+        for index, (field, kind, comment) in enumerate(fields):
+            declaration = f"     {field}: {kind}{',' if index < len(fields) - 1 else ''}"
+            if comment:
+                first, *rest = comment.split("\n")
+                lines.append(f"{declaration:<31}// {first}")
+                lines.extend(f"{'':<31}// {line}" for line in rest)
+            else:
+                lines.append(declaration)
+        lines.append("   }")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + "\n"
+
+
+def schemas_summary() -> Dict[str, Dict[str, Any]]:
+    """The /schemas payload"""
+    return {
+        name: {
+            "fields": [field for field, _, _ in schema["fields"] if field != "_id"],
+            "description": schema["description"],
+        }
+        for name, schema in SCHEMAS.items()
+    }
+
+
+def rules_text(current: date) -> str:
+    month_start, month_end = month_range(current.year, current.month)
+    return RULES.format(today=current, month_start=month_start, month_end=month_end,
+                        last_month=month_start - timedelta(days=1))
+
+
+def current_pipeline(example: Dict[str, Any]) -> Any:
+    """The example's pipeline with its month moved to what the question means today"""
+    _, params = extract_parameters(example["question"])
+    text = json.dumps(example["pipeline"])
+    dates = sorted(set(DATE_PATTERN.findall(text)))
+    if "month" not in params or len(dates) != 2:
+        return example["pipeline"]
+    replacements = dict(zip(dates, (day.isoformat() for day in params["month"])))
+    return json.loads(DATE_PATTERN.sub(lambda m: replacements[m.group(0)], text))
+
+
+def example_text(example: Dict[str, Any]) -> str:
+    questions = " or ".join(f'"{q}"' for q in [example["question"]] + example.get("aliases", []))
+    answer = json.dumps({"collection": example["collection"], "pipeline": current_pipeline(example)})
+    return f"Q: {questions}\nA: {answer}"
+
+
+def tokenize(text: str) -> List[str]:
+    # Placeholders from extract_parameters ("{name_0}", "{month}") become tokens too
+    words = re.findall(r"[a-z0-9_]+", text.lower())
+    return [w.rstrip("s") if len(w) > 3 else w for w in words if w not in STOPWORDS]
+
+
+def question_terms(question: str) -> List[str]:
+    template, _ = extract_parameters(question)
+    return tokenize(template)
+
+
+class BM25Index:
+    """Okapi BM25 over short documents, small enough to rebuild at import"""
+
+    def __init__(self, documents: Sequence[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = [Counter(terms) for terms in documents]
+        self.lengths = [len(terms) for terms in documents]
+        self.average_length = sum(self.lengths) / max(len(self.lengths), 1)
+        frequencies = Counter(term for terms in documents for term in set(terms))
+        total = len(documents)
+        self.idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in frequencies.items()}
+
+    def scores(self, terms: Sequence[str]) -> List[float]:
+        results = []
+        for counts, length in zip(self.documents, self.lengths):
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * length / self.average_length)
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+    def top(self, terms: Sequence[str], k: int) -> List[Tuple[int, float]]:
+        ranked = sorted(enumerate(self.scores(terms)), key=lambda item: -item[1])
+        return [(index, score) for index, score in ranked[:k] if score > 0]
+
+
+def _example_terms(example: Dict[str, Any]) -> List[str]:
+    terms: List[str] = []
+    for question in [example["question"]] + example.get("aliases", []):
+        terms.extend(question_terms(question))
+    terms.append(example["collection"])
+    return terms
+
+
+class PromptLibrary:
+    def __init__(self, examples: Optional[List[Dict[str, Any]]] = None, k: int = 3):
+        self.examples = examples or EXAMPLES
+        self.k = k
+        self.index = BM25Index([_example_terms(example) for example in self.examples])
+        self.schemas = INTRO + "\n" + schema_text()
+
+    def select(self, question: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The `k` examples most relevant to `question`, best first"""
+        hits = self.index.top(question_terms(question), self.k if k is None else k)
+        return [self.examples[index] for index, _ in hits]
+
+    def render(self, examples: List[Dict[str, Any]], profile: str = "") -> str:
+        base = self.schemas + profile + rules_text(today())
+        if not examples:
+            return base + CONVERSATION_FALLBACK
+        shown = "\n\n".join(example_text(example) for example in examples)
+        return f"{base}\n**CORRECT Patterns for Common Queries:**\n\n{shown}\n{CONVERSATION_FALLBACK}"
+
+    def system_prompt(self, question: str, profile: str = "") -> str:
+        return self.render(self.select(question), profile)
+
+    def full_prompt(self, profile: str = "") -> str:
+        return self.render(self.examples, profile)
@@ -0,0 +1,75 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class InvalidContinuation(ValueError):
+    pass
+
+
+class QueryPolicy:
+    """Limits applied to every generated pipeline before it reaches MongoDB.
+
+    - Results are paged: `page_size + 1` rows are fetched so we know whether
+      another page exists, and the next page is described by an opaque,
+      HMAC-signed continuation token (collection, pipeline, offset).
+    - Each collection gets a maxTimeMS budget and an allowDiskUse setting.
+    """
+
+    def __init__(self, page_size: int = 100, max_time_ms: int = 5000,
+                 max_time_ms_by_collection: Optional[Dict[str, int]] = None,
+                 allow_disk_use: Optional[List[str]] = None, secret: Optional[bytes] = None):
+        self.page_size = page_size
+        self.max_time_ms = max_time_ms
+        self.max_time_ms_by_collection = max_time_ms_by_collection or {}
+        self.allow_disk_use = set(allow_disk_use or [])
+        # A per-process secret means tokens don't outlive a restart; set
+        # CONTINUATION_SECRET to share them across workers and restarts.
+        self.secret = secret or os.urandom(32)
+
+    def options(self, collection: str) -> Dict[str, Any]:
+        """Keyword arguments for `aggregate` on `collection`"""
+        return {
+            "maxTimeMS": self.max_time_ms_by_collection.get(collection, self.max_time_ms),
+            "allowDiskUse": collection in self.allow_disk_use,
+        }
+
+    def paginate(self, pipeline: List[Dict[str, Any]], offset: int = 0) -> List[Dict[str, Any]]:
+        """`pipeline` restricted to one page (plus one row to detect a next page)"""
+        paged = list(pipeline)
+        if offset:
+            paged.append({"$skip": offset})
+        paged.append({"$limit": self.page_size + 1})
+        return paged
+
+    def encode_continuation(self, collection: str, pipeline: List[Dict[str, Any]], offset: int) -> str:
+        payload = zlib.compress(json.dumps([collection, pipeline, offset], separators=(",", ":"), default=str).encode())
+        signature = hmac.new(self.secret, payload, hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(signature + payload).decode().rstrip("=")
+
+    def decode_continuation(self, token: str) -> Tuple[str, List[Dict[str, Any]], int]:
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (ValueError, TypeError):
+            raise InvalidContinuation("Malformed continuation token")
+        signature, payload = raw[:16], raw[16:]
+        expected = hmac.new(self.secret, payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            raise InvalidContinuation("Continuation token is invalid or has expired")
+        collection, pipeline, offset = json.loads(zlib.decompress(payload))
+        return collection, pipeline, offset
+
+
+def policy_from_env() -> QueryPolicy:
+    secret = os.getenv("CONTINUATION_SECRET")
+    return QueryPolicy(
+        page_size=int(os.getenv("QUERY_PAGE_SIZE", "100")),
+        max_time_ms=int(os.getenv("QUERY_MAX_TIME_MS", "5000")),
+        max_time_ms_by_collection=json.loads(os.getenv("QUERY_MAX_TIME_MS_BY_COLLECTION", "{}")),
+        allow_disk_use=[c for c in os.getenv("QUERY_ALLOW_DISK_USE", "").split(",") if c],
+        secret=secret.encode() if secret else None,
+    )
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from python_service.cache import TTLCache
+from python_service.shared_store import off_loop
+
+# Server error codes meaning change streams can never work on this deployment
+# (standalone mongod, or a storage engine without majority read concern).
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+
+
+def canonicalize(value: Any, keep_order: bool = False) -> Any:
+    """Key-sorted copy of a pipeline, keeping $sort specs in their given order"""
+    if isinstance(value, dict):
+        items = value.items() if keep_order else sorted(value.items())
+        return {k: canonicalize(v, keep_order=(k == "$sort")) for k, v in items}
+    if isinstance(value, list):
+        return [canonicalize(v) for v in value]
+    return value
+
+
+def pipeline_hash(collection: str, pipeline: List[Dict[str, Any]]) -> str:
+    canonical = json.dumps([collection, canonicalize(pipeline)], separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def referenced_collections(collection: str, pipeline: List[Dict[str, Any]]) -> Set[str]:
+    """Every collection whose writes can change the pipeline's output"""
+    names = {collection}
+    for stage in pipeline:
+        if not isinstance(stage, dict):
+            continue
+        for operator, spec in stage.items():
+            if operator in ("$lookup", "$graphLookup") and isinstance(spec, dict):
+                if spec.get("from"):
+                    names.add(spec["from"])
+                names |= referenced_collections(spec.get("from", collection), spec.get("pipeline", []))
+            elif operator == "$unionWith":
+                coll = spec if isinstance(spec, str) else spec.get("coll")
+                if coll:
+                    names |= referenced_collections(coll, [] if isinstance(spec, str) else spec.get("pipeline", []))
+            elif operator == "$facet" and isinstance(spec, dict):
+                for sub_pipeline in spec.values():
+                    names |= referenced_collections(collection, sub_pipeline)
+    return names
+
+
+class ResultCache:
+    """Aggregation results keyed by collection plus a canonical pipeline hash.
+
+    While a change stream is open, writes to any collection a cached pipeline
+    reads from drop that entry, so entries can live for `ttl` seconds. Without
+    change streams (e.g. a standalone mongod) entries expire after the much
+    shorter `fallback_ttl` instead.
+
+    Results must be stored with the generation() taken before the query
+    ran: an invalidation that arrives while the aggregation is running
+    bumps the generation, and set() then drops the (possibly stale) result
+    instead of caching it.
+
+    With a SharedStore, only one process (the leader) needs to watch():
+    its invalidations reach every worker through the store, and so does
+    whether its change stream is open. Store calls run off the event loop.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600, fallback_ttl: float = 30, shared=None):
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.live = False
+        self.invalidations = 0
+        # With a SharedStore, entries are shared by every worker process and
+        # tagged with the collections they read, so any worker can invalidate them
+        self.shared = shared is not None
+        if self.shared:
+            self._cache = shared.cache("results", maxsize=maxsize, ttl=fallback_ttl)
+            self._state = shared.cache("result_cache")
+        else:
+            self._cache = TTLCache(maxsize=maxsize, ttl=fallback_ttl)
+        self._keys_by_collection: Dict[str, Set[str]] = {}
+        # Invalidations per collection, and of everything; shared ones live in the store
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self.stale_skips = 0
+
+    async def get(self, collection: str, pipeline: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        return await off_loop(self.shared, self._cache.get, pipeline_hash(collection, pipeline))
+
+    async def generation(self, collection: str, pipeline: List[Dict[str, Any]]) -> Any:
+        """Snapshot of the invalidations so far of every collection `pipeline` reads, for set()"""
+        names = referenced_collections(collection, pipeline)
+        if self.shared:
+            return await off_loop(self.shared, self._cache.generations, names)
+        return self._local_generation(names)
+
+    def _local_generation(self, names: Set[str]) -> Any:
+        return self._epoch, {name: self._generations.get(name, 0) for name in names}
+
+    async def set(self, collection: str, pipeline: List[Dict[str, Any]], results: List[Dict[str, Any]],
+                  generation: Any) -> bool:
+        """Cache `results` unless a collection they came from was invalidated since `generation`"""
+        key = pipeline_hash(collection, pipeline)
+        names = referenced_collections(collection, pipeline)
+        if self.shared:
+            stored = await off_loop(self.shared, self._shared_set, key, results, names, generation)
+            self.stale_skips += not stored
+            return stored
+        ttl = self.ttl if self.live else self.fallback_ttl
+        if generation != self._local_generation(names):
+            self.stale_skips += 1
+            return False
+        self._cache.set(key, results, ttl=ttl)
+        for name in names:
+            keys = self._keys_by_collection.setdefault(name, set())
+            keys.add(key)
+            if len(keys) > 2 * self._cache.maxsize:
+                # Forget keys the LRU has already evicted
+                keys.intersection_update(k for k in keys if k in self._cache)
+        return True
+
+    def _shared_set(self, key: str, results: List[Dict[str, Any]], names: Set[str], generation: Any) -> bool:
+        # The leader's change stream may be in another process
+        self.live = bool(self._state.get("live"))
+        ttl = self.ttl if self.live else self.fallback_ttl
+        return self._cache.set(key, results, ttl=ttl, tags=names, generations=generation)
+
+    async def invalidate(self, collection: Optional[str] = None) -> None:
+        """Drop cached results that read from `collection` (all results if None)"""
+        self.invalidations += 1
+        if collection is None:
+            self._epoch += 1
+            self._keys_by_collection.clear()
+            await off_loop(self.shared, self._cache.clear)
+            return
+        self._generations[collection] = self._generations.get(collection, 0) + 1
+        if self.shared:
+            await off_loop(self.shared, self._cache.pop_tagged, collection)
+            return
+        for key in self._keys_by_collection.pop(collection, ()):
+            self._cache.pop(key)
+
+    async def _set_live(self, live: bool) -> None:
+        self.live = live
+        if self.shared:
+            await off_loop(self.shared, self._state.set, "live", live)
+
+    async def watch(self, db, retry_seconds: float = 5) -> None:
+        """Invalidate entries from a database-wide change stream until cancelled"""
+        try:
+            while True:
+                try:
+                    async with await db.watch([{"$project": {"ns": 1}}]) as stream:
+                        # Anything cached before the stream opened may have missed writes
+                        await self.invalidate()
+                        await self._set_live(True)
+                        print("Result cache: change stream open, invalidating on writes")
+                        async for change in stream:
+                            await self.invalidate(change.get("ns", {}).get("coll"))
+                except OperationFailure as e:
+                    await self._set_live(False)
+                    await self.invalidate()
+                    if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                        print(f"Result cache: change streams unavailable ({e}), using {self.fallback_ttl}s TTL")
+                        return
+                    print(f"Result cache: change stream failed ({e}), retrying in {retry_seconds}s")
+                except PyMongoError as e:
+                    await self._set_live(False)
+                    await self.invalidate()
+                    print(f"Result cache: change stream failed ({e}), retrying in {retry_seconds}s")
+                await asyncio.sleep(retry_seconds)
+        finally:
+            if self.live:
+                # Workers staying up (e.g. while this leader is replaced) fall back to the short TTL
+                await asyncio.shield(self._set_live(False))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "live": self.live, "invalidations": self.invalidations,
+                "stale_skips": self.stale_skips}
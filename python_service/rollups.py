@@ -0,0 +1,555 @@
+"""Pre-aggregated rollups of transactions, loans and EMI payments, and a planner that reads them.
+
+Each rollup holds one document per period (day or month) and key
+combination with the count, sums, minimums and maximums of the numeric
+fields. Periods are always recomputed whole from the source collection,
+so a rollup is exact once its period has been refreshed:
+
+- `catch_up` is a checkpointed batch job: it recomputes the periods that
+  received documents since the last checkpoint (by _id) plus the last
+  ROLLUP_LOOKBACK_DAYS, where status updates land. The first run builds
+  everything.
+- With change streams, the periods touched by each write are marked
+  dirty and recomputed every ROLLUP_REFRESH_SECONDS.
+
+`RollupPlanner` rewrites totals-style pipelines (a $match the rollup can
+express, then a $group) and the statistics of row queries to read the
+rollup instead of scanning the source.
+
+    python -m python_service.rollups refresh   # checkpointed catch-up, e.g. from cron
+    python -m python_service.rollups rebuild   # recompute every period
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, AsyncMongoClient, DeleteMany, IndexModel, ReplaceOne
+from pymongo.errors import OperationFailure
+
+from python_service.examples import DEPOSIT_FILTER, WITHDRAWAL_FILTER
+from python_service.pipeline_optimizer import _match_conditions, decode_extended_json
+from python_service.result_cache import CHANGE_STREAMS_UNSUPPORTED, canonicalize
+from python_service.summarizer import AMOUNT_FIELDS, BREAKDOWN_FIELDS
+
+STATE_COLLECTION = "rollup_state"
+# Written after every refresh; processes that only read the rollups check it
+HEARTBEAT_ID = "_heartbeat"
+
+# Transaction categories as the query patterns define them; a transaction can be in both
+CATEGORY_FILTERS = {"deposit": DEPOSIT_FILTER, "withdrawal": WITHDRAWAL_FILTER}
+
+# Stages after the $match that keep the matched rows (if they leave the summarized fields alone)
+ROW_PRESERVING_STAGES = {"$sort", "$project", "$addFields", "$set", "$unset"}
+
+
+class RollupSpec:
+    def __init__(self, name: str, source: str, date_field: str, granularity: str, keys: List[str],
+                 sums: List[str], flags: Optional[Dict[str, Dict[str, Any]]] = None, complete: bool = True):
+        self.name = name
+        self.source = source
+        self.date_field = date_field
+        self.granularity = granularity
+        self.keys = keys
+        self.sums = sums
+        self.flags = flags or {}
+        # Every source document has `date_field`, so all-time queries can use the rollup too
+        self.complete = complete
+
+    def period_start(self, value: datetime) -> datetime:
+        value = value.replace(tzinfo=None) if value.tzinfo is None else value.astimezone(timezone.utc).replace(tzinfo=None)
+        if self.granularity == "day":
+            return datetime(value.year, value.month, value.day)
+        return datetime(value.year, value.month, 1)
+
+    def period_end(self, start: datetime) -> datetime:
+        if self.granularity == "day":
+            return start + timedelta(days=1)
+        return datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+
+    def aligned(self, value: datetime) -> bool:
+        naive = value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+        return self.period_start(naive) == naive
+
+    @property
+    def period_format(self) -> str:
+        return "%Y-%m-%d" if self.granularity == "day" else "%Y-%m"
+
+
+ROLLUPS: List[RollupSpec] = [
+    # Daily totals stay small (days x types x statuses), so any date range is cheap
+    RollupSpec("rollup_transactions_daily", "transactions", "createdAt", "day",
+               keys=["type", "status"], sums=["amount"], flags=CATEGORY_FILTERS),
+    # Per-user totals only by month; per day they would be nearly as large as the source
+    RollupSpec("rollup_transactions_monthly", "transactions", "createdAt", "month",
+               keys=["type", "status", "userId"], sums=["amount"], flags=CATEGORY_FILTERS),
+    RollupSpec("rollup_loans_monthly", "loans", "createdAt", "month",
+               keys=["status", "loanType", "userId"], sums=["amount", "totalPayable", "amountPaid", "emiAmount"]),
+    RollupSpec("rollup_emipayments_monthly", "emipayments", "dueDate", "month",
+               keys=["status", "userId"], sums=["amount", "principalAmount", "interestAmount"], complete=False),
+]
+
+
+def _string(field: str) -> Dict[str, Any]:
+    # $regexMatch needs a string input; missing or unconvertible values count as ""
+    return {"$convert": {"input": f"${field}", "to": "string", "onError": "", "onNull": ""}}
+
+
+def filter_expression(query: Any) -> Any:
+    """Aggregation expression equivalent to a query filter of $or/$and, $regex and equality"""
+    if not isinstance(query, dict):
+        raise ValueError(f"Unsupported filter: {query!r}")
+    parts = []
+    for key, value in query.items():
+        if key in ("$or", "$and"):
+            parts.append({key: [filter_expression(item) for item in value]})
+        elif isinstance(value, dict) and "$regex" in value:
+            parts.append({"$regexMatch": {"input": _string(key), "regex": value["$regex"],
+                                          "options": value.get("$options", "")}})
+        elif not isinstance(value, dict):
+            parts.append({"$eq": [f"${key}", value]})
+        else:
+            raise ValueError(f"Unsupported filter: {query!r}")
+    return parts[0] if len(parts) == 1 else {"$and": parts}
+
+
+def _is_plain(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool, datetime))
+
+
+class RollupMaintainer:
+    """Builds the rollups and keeps them current"""
+
+    def __init__(self, db, specs: Optional[List[RollupSpec]] = None, interval: float = 10,
+                 lookback_days: int = 2, max_lag: float = 120):
+        self.db = db
+        self.specs = specs or ROLLUPS
+        self.interval = interval
+        self.lookback_days = lookback_days
+        self.max_lag = max_lag
+        self.ready = False
+        self.live = False
+        self.refreshed_at: Optional[float] = None
+        self.recomputed = 0
+        self.last_error: Optional[str] = None
+        self._dirty: Set[Tuple[str, datetime]] = set()
+        self._stale_sources: Set[str] = set()
+
+    def sources(self) -> List[str]:
+        return sorted({spec.source for spec in self.specs})
+
+    def specs_for(self, source: str) -> List[RollupSpec]:
+        return [spec for spec in self.specs if spec.source == source]
+
+    def fresh(self) -> bool:
+        """Whether reads may be routed to the rollups"""
+        return self.ready and self.refreshed_at is not None and time.time() - self.refreshed_at <= self.max_lag
+
+    async def ensure_indexes(self) -> None:
+        for spec in self.specs:
+            await self.db[spec.name].create_indexes([
+                IndexModel([(spec.date_field, ASCENDING)] + [(key, ASCENDING) for key in spec.keys],
+                           name=f"{spec.date_field}_keys"),
+            ])
+
+    async def recompute(self, spec: RollupSpec, start: datetime) -> None:
+        """Replace one period of a rollup with fresh totals from the source.
+
+        Each row is upserted under an _id made of the period and its keys,
+        then rows the refresh didn't write (keys no longer in the source)
+        are deleted. Readers never see the period empty or half written:
+        every key has its old or its new row throughout.
+        """
+        end = spec.period_end(start)
+        group: Dict[str, Any] = {
+            "_id": {**{key: f"${key}" for key in spec.keys},
+                    **{flag: filter_expression(query) for flag, query in spec.flags.items()}},
+            "count": {"$sum": 1},
+        }
+        for field in spec.sums:
+            group[field] = {"$sum": f"${field}"}
+            group[f"{field}__count"] = {"$sum": {"$cond": [{"$isNumber": f"${field}"}, 1, 0]}}
+            group[f"{field}__min"] = {"$min": {"$cond": [{"$isNumber": f"${field}"}, f"${field}", None]}}
+            group[f"{field}__max"] = {"$max": {"$cond": [{"$isNumber": f"${field}"}, f"${field}", None]}}
+            # $min/$max in a query compare across types, so keep those too
+            group[f"{field}__min_any"] = {"$min": f"${field}"}
+            group[f"{field}__max_any"] = {"$max": f"${field}"}
+        cursor = await self.db[spec.source].aggregate([
+            {"$match": {spec.date_field: {"$gte": start, "$lt": end}}},
+            {"$group": group},
+        ])
+        refresh = ObjectId()
+        operations: List[Any] = []
+        async for row in cursor:
+            key = {spec.date_field: start, **row.pop("_id")}
+            operations.append(ReplaceOne({"_id": key}, {**key, **row, "refreshId": refresh}, upsert=True))
+        operations.append(DeleteMany({spec.date_field: {"$gte": start, "$lt": end}, "refreshId": {"$ne": refresh}}))
+        await self.db[spec.name].bulk_write(operations, ordered=True)
+        self.recomputed += 1
+
+    async def _periods(self, spec: RollupSpec, match: Dict[str, Any]) -> Set[datetime]:
+        cursor = await self.db[spec.source].aggregate([
+            {"$match": {**match, spec.date_field: {"$type": "date"}}},
+            {"$group": {"_id": {"$dateToString": {"format": spec.period_format, "date": f"${spec.date_field}"}}}},
+        ])
+        return {datetime.strptime(row["_id"], spec.period_format) async for row in cursor}
+
+    def _lookback_periods(self, spec: RollupSpec) -> Set[datetime]:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return {spec.period_start(now - timedelta(days=days)) for days in range(self.lookback_days + 1)}
+
+    async def catch_up(self, full: bool = False) -> int:
+        """Recompute the periods changed since the checkpoint (everything if `full` or first run)"""
+        recomputed = 0
+        for source in self.sources():
+            state = await self.db[STATE_COLLECTION].find_one({"_id": source})
+            checkpoint = None if full or not state else state.get("checkpoint")
+            newest = await self.db[source].find_one({}, sort=[("_id", -1)], projection={"_id": 1})
+            match: Dict[str, Any] = {}
+            if newest:
+                match["_id"] = {"$lte": newest["_id"]}
+                if checkpoint is not None:
+                    match["_id"]["$gt"] = checkpoint
+            for spec in self.specs_for(source):
+                periods = await self._periods(spec, match) if newest else set()
+                if checkpoint is not None:
+                    periods |= self._lookback_periods(spec)
+                else:
+                    # Full build: periods the source no longer has must go too
+                    await self.db[spec.name].delete_many({spec.date_field: {"$nin": sorted(periods)}})
+                for start in sorted(periods):
+                    await self.recompute(spec, start)
+                recomputed += len(periods)
+            if newest:
+                await self.db[STATE_COLLECTION].update_one(
+                    {"_id": source},
+                    {"$set": {"checkpoint": newest["_id"], "updatedAt": datetime.now(timezone.utc)}},
+                    upsert=True,
+                )
+        await self._heartbeat()
+        return recomputed
+
+    def mark(self, change: Dict[str, Any]) -> None:
+        """Note which periods a change-stream event touched"""
+        source = change.get("ns", {}).get("coll")
+        document = change.get("fullDocument")
+        for spec in self.specs_for(source):
+            value = document.get(spec.date_field) if document else None
+            if isinstance(value, datetime):
+                self._dirty.add((spec.name, spec.period_start(value)))
+            else:
+                # Deletes (and documents gone by lookup time) don't say where they were
+                self._stale_sources.add(source)
+
+    async def flush(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        stale, self._stale_sources = self._stale_sources, set()
+        by_name = {spec.name: spec for spec in self.specs}
+        for source in stale:
+            for spec in self.specs_for(source):
+                dirty |= {(spec.name, start) for start in self._lookback_periods(spec)}
+        for name, start in sorted(dirty, key=lambda item: (item[0], item[1])):
+            await self.recompute(by_name[name], start)
+        await self._heartbeat()
+
+    async def _heartbeat(self) -> None:
+        """Record when the rollups were last brought up to date, for observe() in other processes"""
+        self.refreshed_at = time.time()
+        await self.db[STATE_COLLECTION].update_one(
+            {"_id": HEARTBEAT_ID},
+            {"$set": {"refreshedAt": datetime.fromtimestamp(self.refreshed_at, timezone.utc)}},
+            upsert=True,
+        )
+
+    async def observe(self) -> None:
+        """Track freshness of rollups another process maintains, until cancelled.
+
+        Worker processes that don't run the maintainer still route reads to
+        the rollups while its heartbeat is within max_lag.
+        """
+        while True:
+            try:
+                state = await self.db[STATE_COLLECTION].find_one({"_id": HEARTBEAT_ID})
+                if state and isinstance(state.get("refreshedAt"), datetime):
+                    refreshed = state["refreshedAt"]
+                    if refreshed.tzinfo is None:
+                        refreshed = refreshed.replace(tzinfo=timezone.utc)
+                    self.refreshed_at = refreshed.timestamp()
+                    self.ready = True
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Rollups: could not read the maintainer's heartbeat ({self.last_error})")
+            await asyncio.sleep(self.interval)
+
+    async def _follow(self) -> None:
+        pipeline = [{"$match": {"ns.coll": {"$in": self.sources()},
+                                "operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        async with await self.db.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000) as stream:
+            self.live = True
+            # Writes from here on are in the stream, so catching up now misses nothing
+            await self.catch_up()
+            self.ready = True
+            print("Rollups: change stream open, refreshing touched periods")
+            last_flush = time.monotonic()
+            while True:
+                change = await stream.try_next()
+                if change:
+                    self.mark(change)
+                if time.monotonic() - last_flush >= self.interval:
+                    await self.flush()
+                    last_flush = time.monotonic()
+
+    async def run(self, retry_seconds: float = 5) -> None:
+        """Keep the rollups current until cancelled"""
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Rollups: could not create indexes ({self.last_error})")
+        use_change_stream = True
+        while True:
+            try:
+                if use_change_stream:
+                    await self._follow()
+                await self.catch_up()
+                self.ready = True
+                self.last_error = None
+                await asyncio.sleep(self.interval)
+            except OperationFailure as e:
+                self.live = False
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    print(f"Rollups: change streams unavailable ({e}), catching up every {self.interval}s")
+                    use_change_stream = False
+                else:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    print(f"Rollups: refresh failed ({e}), retrying in {retry_seconds}s")
+                    await asyncio.sleep(retry_seconds)
+            except Exception as e:
+                # Not only database errors: anything that escaped would end the maintainer for good
+                self.live = False
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Rollups: refresh failed ({self.last_error}), retrying in {retry_seconds}s")
+                await asyncio.sleep(retry_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "live": self.live,
+            "fresh": self.fresh(),
+            "age_seconds": round(time.time() - self.refreshed_at, 3) if self.refreshed_at else None,
+            "periods_recomputed": self.recomputed,
+            "last_error": self.last_error,
+        }
+
+
+# Date operators that give the same answer on a period's start as on any date inside it
+MONTH_OPERATORS = {"$year", "$month"}
+DAY_OPERATORS = MONTH_OPERATORS | {"$dayOfMonth", "$dayOfWeek", "$dayOfYear"}
+DATE_FORMAT_PATTERN = re.compile(r"%[^Ymd]")
+
+
+class RollupPlanner:
+    """Rewrites pipelines whose answer the rollups already hold"""
+
+    def __init__(self, maintainer: RollupMaintainer):
+        self.maintainer = maintainer
+        self.routed = 0
+
+    def _split(self, pipeline: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        conditions: List[Dict[str, Any]] = []
+        index = 0
+        while index < len(pipeline) and isinstance(pipeline[index], dict) and "$match" in pipeline[index]:
+            conditions.extend(_match_conditions(pipeline[index]))
+            index += 1
+        return conditions, pipeline[index:]
+
+    def _condition(self, spec: RollupSpec, condition: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        canonical = canonicalize(condition)
+        for flag, query in spec.flags.items():
+            if canonical == canonicalize(query):
+                return {flag: True}
+        if len(condition) != 1:
+            return None
+        field, value = next(iter(condition.items()))
+        if field in spec.keys:
+            if _is_plain(value):
+                return condition
+            if isinstance(value, dict) and all(
+                op in ("$eq", "$ne", "$in", "$nin")
+                and (all(_is_plain(v) for v in arg) if isinstance(arg, list) else _is_plain(arg))
+                for op, arg in value.items()
+            ):
+                return condition
+            return None
+        if field == spec.date_field and isinstance(value, dict) and value and all(
+            op in ("$gte", "$lt") and isinstance(bound, datetime) and spec.aligned(bound)
+            for op, bound in value.items()
+        ):
+            return condition
+        return None
+
+    def _match(self, spec: RollupSpec, conditions: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        translated = []
+        for condition in conditions:
+            result = self._condition(spec, condition)
+            if result is None:
+                return None
+            translated.append(result)
+        if not spec.complete and not any(spec.date_field in c for c in translated):
+            return None
+        if not translated:
+            return []
+        return [{"$match": translated[0] if len(translated) == 1 else {"$and": translated}}]
+
+    def _group_key(self, spec: RollupSpec, key: Any) -> bool:
+        if _is_plain(key) and not (isinstance(key, str) and key.startswith("$")):
+            return True
+        if isinstance(key, str):
+            return key[1:] in spec.keys or key[1:] in spec.flags
+        if isinstance(key, dict) and len(key) == 1:
+            operator, argument = next(iter(key.items()))
+            operators = DAY_OPERATORS if spec.granularity == "day" else MONTH_OPERATORS
+            if operator in operators:
+                return argument == f"${spec.date_field}"
+            if operator == "$dateToString" and isinstance(argument, dict):
+                fmt = argument.get("format", "")
+                allowed = set(argument) <= {"format", "date"} and not DATE_FORMAT_PATTERN.search(fmt)
+                return (allowed and argument.get("date") == f"${spec.date_field}"
+                        and ("%d" not in fmt or spec.granularity == "day"))
+        if isinstance(key, dict) and not any(k.startswith("$") for k in key):
+            return all(self._group_key(spec, value) for value in key.values())
+        return False
+
+    def _group(self, spec: RollupSpec, group: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        if not self._group_key(spec, group.get("_id")):
+            return None
+        accumulators: Dict[str, Any] = {}
+        averages: Dict[str, Any] = {}
+        for name, accumulator in group.items():
+            if name == "_id":
+                continue
+            if not isinstance(accumulator, dict) or len(accumulator) != 1:
+                return None
+            operator, argument = next(iter(accumulator.items()))
+            field = argument[1:] if isinstance(argument, str) and argument.startswith("$") else None
+            if operator == "$count" or (operator == "$sum" and argument == 1):
+                accumulators[name] = {"$sum": "$count"}
+            elif field in spec.sums and operator == "$sum":
+                accumulators[name] = {"$sum": argument}
+            elif field in spec.sums and operator in ("$min", "$max"):
+                accumulators[name] = {operator: f"${field}__{operator[1:]}_any"}
+            elif field in spec.sums and operator == "$avg":
+                accumulators[f"__{name}_sum"] = {"$sum": argument}
+                accumulators[f"__{name}_count"] = {"$sum": f"${field}__count"}
+                averages[name] = {"$cond": [{"$gt": [f"$__{name}_count", 0]},
+                                            {"$divide": [f"$__{name}_sum", f"$__{name}_count"]}, None]}
+            else:
+                return None
+        stages = [{"$group": {"_id": group.get("_id"), **accumulators}}]
+        if averages:
+            stages.append({"$addFields": averages})
+            stages.append({"$project": {f"__{name}_{part}": 0 for name in averages for part in ("sum", "count")}})
+        return stages
+
+    def route(self, collection: str, pipeline: List[Dict[str, Any]]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """(rollup collection, rewritten pipeline) for a totals pipeline, or None"""
+        if not self.maintainer.fresh():
+            return None
+        conditions, rest = self._split(decode_extended_json(pipeline))
+        if not rest or not isinstance(rest[0], dict) or "$group" not in rest[0]:
+            return None
+        for spec in self.maintainer.specs_for(collection):
+            match = self._match(spec, conditions)
+            group = self._group(spec, rest[0]["$group"]) if match is not None else None
+            if group is not None:
+                self.routed += 1
+                return spec.name, match + group + rest[1:]
+        return None
+
+    def _keeps_fields(self, spec: RollupSpec, stage: Dict[str, Any]) -> bool:
+        """Whether a row-preserving stage leaves the fields summarize_rows reads as they are"""
+        fields = {f for f in AMOUNT_FIELDS if f in spec.sums} | {f for f in BREAKDOWN_FIELDS if f in spec.keys}
+        fields.add("createdAt")
+        operator, spec_value = next(iter(stage.items()))
+        if operator == "$sort":
+            return True
+        if operator == "$unset":
+            names = [spec_value] if isinstance(spec_value, str) else spec_value
+            return not fields & set(names)
+        if operator in ("$addFields", "$set"):
+            return not any(name.split(".")[0] in fields for name in spec_value)
+        included = {name for name, value in spec_value.items() if value in (1, True) and name != "_id"}
+        if included:
+            return len(included) + ("_id" in spec_value) == len(spec_value) and fields <= included
+        return all(value in (0, False) for value in spec_value.values()) and not fields & set(spec_value)
+
+    def statistics(self, collection: str, pipeline: List[Dict[str, Any]]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """(rollup collection, pipeline) producing the same $facet document as
+        summarizer.stats_pipeline(pipeline), for row queries that only filter"""
+        if not self.maintainer.fresh():
+            return None
+        conditions, rest = self._split(decode_extended_json(pipeline))
+        if any(not isinstance(stage, dict) or len(stage) != 1 or not set(stage) <= ROW_PRESERVING_STAGES
+               for stage in rest):
+            return None
+        for spec in self.maintainer.specs_for(collection):
+            match = self._match(spec, conditions)
+            if match is None or not all(self._keeps_fields(spec, stage) for stage in rest):
+                continue
+            totals: Dict[str, Any] = {"_id": None, "count": {"$sum": "$count"}}
+            for field in AMOUNT_FIELDS:
+                if field in spec.sums:
+                    totals[f"{field}__count"] = {"$sum": f"${field}__count"}
+                    totals[f"{field}__sum"] = {"$sum": f"${field}"}
+                    totals[f"{field}__min"] = {"$min": f"${field}__min"}
+                    totals[f"{field}__max"] = {"$max": f"${field}__max"}
+            amount = next((f"${field}" for field in AMOUNT_FIELDS if field in spec.sums), 0)
+            facets: Dict[str, Any] = {"totals": [{"$group": totals}]}
+            for field in BREAKDOWN_FIELDS:
+                if field in spec.keys:
+                    facets[field] = [{"$group": {"_id": f"${field}", "count": {"$sum": "$count"},
+                                                 "amount": {"$sum": amount}}}]
+            if spec.date_field == "createdAt":
+                facets["month"] = [{"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m", "date": "$createdAt"}},
+                    "count": {"$sum": "$count"}, "amount": {"$sum": amount},
+                }}]
+            self.routed += 1
+            return spec.name, match + [{"$facet": facets}]
+        return None
+
+
+async def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["refresh", "rebuild"])
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path="../.env")
+    load_dotenv()
+    uri = os.getenv("DATABASE_URL") or os.getenv("MONGODB_URI")
+    if not uri:
+        print("DATABASE_URL is not set in .env")
+        return 2
+
+    client = AsyncMongoClient(uri)
+    maintainer = RollupMaintainer(client.get_database(),
+                                  lookback_days=int(os.getenv("ROLLUP_LOOKBACK_DAYS", "2")))
+    try:
+        await maintainer.ensure_indexes()
+        started = time.perf_counter()
+        count = await maintainer.catch_up(full=args.command == "rebuild")
+        print(f"✓ Recomputed {count} rollup periods in {time.perf_counter() - started:.1f}s")
+        return 0
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
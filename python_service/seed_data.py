@@ -0,0 +1,240 @@
+"""Seeds a MongoDB database with synthetic banking data for benchmarks.
+
+Creates profiles, accounts, transactions, loans and EMI payments shaped
+like the app's models, with dates over the last 13 months so "this month"
+and "last month" questions match rows. The first users carry the names
+used in the benchmark workload (Lavanya Kumar, John Smith, ...).
+Deterministic for a given --seed. Never point this at a real database:
+--drop deletes the collections first.
+
+    python python_service/seed_data.py --uri mongodb://localhost:27017/nexbank_bench --drop
+    python python_service/seed_data.py --users 20000 --transactions 5000000 --drop
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import AsyncMongoClient, MongoClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service.indexes import ensure_indexes
+
+COLLECTIONS = ["profiles", "accounts", "transactions", "loans", "emipayments"]
+
+KNOWN_NAMES = ["Lavanya Kumar", "John Smith", "Sarah Johnson", "Michael Chen", "Emily Davis"]
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "David", "Jennifer", "Maria", "Daniel", "Lisa",
+               "Anil", "Priya", "Wei", "Fatima", "Carlos", "Aisha", "Kenji", "Olga", "Noah"]
+LAST_NAMES = ["Garcia", "Brown", "Wilson", "Taylor", "Lee", "Martinez", "Anderson", "Patel",
+              "Sharma", "Nguyen", "Kim", "Okafor", "Rossi", "Silva", "Novak", "Cohen"]
+
+# (type, description, weight) for ordinary account activity
+TRANSACTION_TYPES = [
+    ("deposit", "Deposit via Stripe", 30),
+    ("withdrawal", "ATM withdrawal", 20),
+    ("transfer_out", "Transfer to another account", 15),
+    ("transfer_in", "Transfer from another account", 15),
+    ("credit", "Salary credit", 10),
+    ("interest", "Monthly interest", 5),
+    ("emi_payment", "EMI payment", 3),
+    ("loan_disbursement", "Loan disbursement", 2),
+]
+LOAN_TYPES = [("personal", 5000, 50000, 12), ("home", 100000, 500000, 8), ("auto", 15000, 75000, 10),
+              ("business", 50000, 300000, 14), ("education", 10000, 100000, 9)]
+LOAN_STATUSES = ["pending", "approved", "active", "active", "active", "rejected", "completed"]
+
+
+def user_name(index: int) -> str:
+    if index < len(KNOWN_NAMES):
+        return KNOWN_NAMES[index]
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    return f"{first} {last} {index}"
+
+
+def emi(amount: float, rate: float, months: int) -> float:
+    monthly = rate / 12 / 100
+    return round(amount * monthly * (1 + monthly) ** months / ((1 + monthly) ** months - 1), 2)
+
+
+class Seeder:
+    def __init__(self, db, users: int, transactions: int, loan_ratio: float, batch_size: int, seed: int):
+        self.db = db
+        self.users = users
+        self.transactions = transactions
+        self.loan_ratio = loan_ratio
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.span = timedelta(days=395).total_seconds()
+        self.accounts = []
+
+    def recent(self) -> datetime:
+        return self.now - timedelta(seconds=self.random.random() * self.span)
+
+    def insert(self, name: str, docs) -> int:
+        total = 0
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                self.db[name].insert_many(batch, ordered=False)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.db[name].insert_many(batch, ordered=False)
+            total += len(batch)
+        return total
+
+    def profiles(self):
+        for index in range(self.users):
+            name = user_name(index)
+            created = self.recent()
+            yield {
+                "clerkId": f"user_bench{index:07d}",
+                "email": f"{name.lower().replace(' ', '.')}@example.com",
+                "fullName": name,
+                "phone": f"+1555{index:07d}",
+                "address": f"{index} Main Street",
+                "kycStatus": self.random.choice(["verified", "verified", "pending", "rejected"]),
+                "isAdmin": index == 0,
+                "createdAt": created,
+                "updatedAt": created,
+            }
+
+    def account_docs(self):
+        for index in range(self.users):
+            for number in range(self.random.choice([1, 1, 2])):
+                account = {
+                    "_id": ObjectId(),
+                    "userId": f"user_bench{index:07d}",
+                    "accountNumber": f"{index:08d}{number:02d}",
+                    "accountType": self.random.choice(["savings", "checking"]),
+                    "balance": round(self.random.uniform(100, 50000), 2),
+                    "currency": "USD",
+                    "status": self.random.choice(["active"] * 9 + ["frozen"]),
+                    "createdAt": self.recent(),
+                }
+                account["updatedAt"] = account["createdAt"]
+                self.accounts.append((account["_id"], account["userId"]))
+                yield account
+
+    def transaction_docs(self):
+        kinds = [(kind, description) for kind, description, _ in TRANSACTION_TYPES]
+        weights = [weight for _, _, weight in TRANSACTION_TYPES]
+        for index in range(self.transactions):
+            account_id, user_id = self.accounts[self.random.randrange(len(self.accounts))]
+            kind, description = self.random.choices(kinds, weights)[0]
+            yield {
+                "userId": user_id,
+                "accountId": account_id,
+                "amount": round(self.random.lognormvariate(5, 1.2), 2),
+                "type": kind,
+                "status": self.random.choice(["completed"] * 18 + ["pending", "failed"]),
+                "description": description,
+                "referenceId": f"REF{index:010d}",
+                "createdAt": self.recent(),
+            }
+
+    def loan_and_emi_docs(self):
+        loans, payments = [], []
+        for _ in range(int(self.users * self.loan_ratio)):
+            account_id, user_id = self.accounts[self.random.randrange(len(self.accounts))]
+            loan_type, low, high, rate = self.random.choice(LOAN_TYPES)
+            amount = self.random.randint(low, high)
+            tenure = self.random.choice([6, 12, 18, 24, 36, 48, 60])
+            monthly = emi(amount, rate, tenure)
+            status = self.random.choice(LOAN_STATUSES)
+            created = self.recent()
+            paid = 0
+            loan_id = ObjectId()
+            if status in ("active", "completed"):
+                due = created
+                count = tenure if status == "completed" else min(tenure, max(1, (self.now - created).days // 30))
+                for number in range(1, count + 1):
+                    due = created + timedelta(days=30 * number)
+                    is_paid = status == "completed" or due < self.now
+                    paid += monthly if is_paid else 0
+                    payments.append({
+                        "loanId": loan_id,
+                        "userId": user_id,
+                        "emiNumber": number,
+                        "amount": monthly,
+                        "principalAmount": round(monthly * 0.8, 2),
+                        "interestAmount": round(monthly * 0.2, 2),
+                        "dueDate": due,
+                        "paidDate": due if is_paid else None,
+                        "status": "paid" if is_paid else "pending",
+                        "createdAt": created,
+                    })
+            loans.append({
+                "_id": loan_id,
+                "userId": user_id,
+                "loanType": loan_type,
+                "amount": amount,
+                "interestRate": rate,
+                "tenureMonths": tenure,
+                "emiAmount": monthly,
+                "totalPayable": round(monthly * tenure, 2),
+                "amountPaid": round(paid, 2),
+                "remainingAmount": round(monthly * tenure - paid, 2),
+                "status": status,
+                "disbursementAccountId": account_id,
+                "createdAt": created,
+                "updatedAt": created,
+            })
+        return loans, payments
+
+    def run(self) -> None:
+        for name, docs in (("profiles", self.profiles()), ("accounts", self.account_docs())):
+            started = time.perf_counter()
+            print(f"{name}: {self.insert(name, docs):,} in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        count = self.insert("transactions", self.transaction_docs())
+        elapsed = time.perf_counter() - started
+        print(f"transactions: {count:,} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f}/s)")
+
+        started = time.perf_counter()
+        loans, payments = self.loan_and_emi_docs()
+        self.insert("loans", loans)
+        self.insert("emipayments", payments)
+        print(f"loans: {len(loans):,}, emipayments: {len(payments):,} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017/nexbank_bench"))
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--loan-ratio", type=float, default=0.3, help="loans per user")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="drop the collections before seeding")
+    parser.add_argument("--no-indexes", action="store_true", help="skip creating the service's indexes")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    db = client.get_database()
+    if args.drop:
+        for name in COLLECTIONS:
+            db.drop_collection(name)
+    print(f"Seeding {db.name}: {args.users:,} users, {args.transactions:,} transactions")
+    Seeder(db, args.users, args.transactions, args.loan_ratio, args.batch_size, args.seed).run()
+    client.close()
+
+    if not args.no_indexes:
+        async def create():
+            async_client = AsyncMongoClient(args.uri)
+            await ensure_indexes(async_client.get_database())
+            await async_client.close()
+        asyncio.run(create())
+
+
+if __name__ == "__main__":
+    main()
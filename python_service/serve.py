@@ -0,0 +1,137 @@
+"""Serves the chat API from several worker processes forked from one warmed-up parent.
+
+    python -m python_service.serve --workers 4 --port 8000
+
+`uvicorn --workers` starts every worker as a fresh interpreter, so each one
+repeats the imports and the Gemini model probe and keeps its own caches.
+Here the parent does the shared work once, before forking:
+
+- imports main, which builds the prompt library, intent tables and
+  clients (pymongo resets its connection pools in each child after fork);
+- creates the shared store (CHAT_SHARED_STORE, a SQLite file) holding
+  conversations and the pipeline and result caches, so a follow-up
+  question can land on any worker, and each worker's metrics, which
+  /metrics adds up;
+- selects the Gemini model in a short-lived child process, which writes the
+  choice to the model cache file the workers read. gRPC, which the Gemini
+  client uses, doesn't survive a fork, so the parent never opens it.
+
+Workers then run uvicorn on the socket the parent bound. The one holding
+the store's leader lock maintains the rollups, builds indexes and runs the
+change stream that invalidates cached results. Workers that die are
+replaced; SIGINT or SIGTERM stops them all.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict
+
+import uvicorn
+
+# Make the package importable when run directly as `python serve.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def warm_up(service) -> None:
+    if service.shared_store is not None:
+        # Counts from a previous run of the server would otherwise be added to this one's
+        service.worker_metrics.reset()
+        service.shared_store.initialize()
+    if service.GEMINI_API_KEY and not service.STUB_LLM:
+        pid = os.fork()
+        if pid == 0:
+            selected = asyncio.run(service.model_selector.get())
+            os._exit(0 if selected else 1)
+        _, status = os.waitpid(pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
+            print("Gemini model selection failed during warm-up; workers will retry on first use")
+
+
+def run_worker(service, sock: socket.socket, log_level: str) -> None:
+    # Until uvicorn installs its own handlers, don't run the parent's
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(service.app, log_level=log_level))
+    asyncio.run(server.serve(sockets=[sock]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--store", help="shared SQLite file (default: CHAT_SHARED_STORE, else one in the temp dir)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # main reads this at import, so it has to be set first
+    os.environ["CHAT_SHARED_STORE"] = args.store or os.getenv("CHAT_SHARED_STORE") or os.path.join(
+        tempfile.gettempdir(), f"nexbank-chat-{args.port}.sqlite3")
+    from python_service import main as service
+
+    started = time.perf_counter()
+    warm_up(service)
+    sock = bind(args.host, args.port, args.backlog)
+    print(f"Warmed up in {time.perf_counter() - started:.2f}s; starting {args.workers} workers "
+          f"on {args.host}:{args.port}, shared store {os.environ['CHAT_SHARED_STORE']}")
+
+    workers: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(service, sock, args.log_level)
+            except BaseException as e:
+                print(f"Worker {index} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = index
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(args.workers):
+        spawn(index)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            time.sleep(1)
+            spawn(index)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import json
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from python_service.cache import TTLCache
+from python_service.shared_store import off_loop
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token for English/JSON)"""
+    return len(text) // 4 + 1
+
+
+class Conversation:
+    """Question/answer turns for one admin conversation"""
+
+    def __init__(self, conversation_id: str, max_turns: int):
+        self.id = conversation_id
+        self.max_turns = max_turns
+        self.turns: List[Tuple[str, str]] = []
+
+    def add_turn(self, user_text: str, model_text: str) -> None:
+        """Record a turn; SessionStore.save() then shares it when conversations live outside this process"""
+        self.turns.append((user_text, model_text))
+        if len(self.turns) > self.max_turns:
+            del self.turns[: len(self.turns) - self.max_turns]
+
+    def last_query(self) -> Optional[Dict[str, Any]]:
+        """The most recent generated query ({"collection", "pipeline", ...}), if any turn has one"""
+        for _, model_text in reversed(self.turns):
+            try:
+                parsed = json.loads(model_text)
+            except ValueError:
+                continue
+            if isinstance(parsed, dict) and parsed.get("collection") and parsed.get("pipeline"):
+                return parsed
+        return None
+
+    def window(self, max_tokens: int) -> List[Dict[str, Any]]:
+        """Most recent turns that fit in `max_tokens`, as Gemini chat history"""
+        selected: List[Tuple[str, str]] = []
+        budget = max_tokens
+        for user_text, model_text in reversed(self.turns):
+            cost = estimate_tokens(user_text) + estimate_tokens(model_text)
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append((user_text, model_text))
+
+        history: List[Dict[str, Any]] = []
+        for user_text, model_text in reversed(selected):
+            history.append({"role": "user", "parts": [user_text]})
+            history.append({"role": "model", "parts": [model_text]})
+        return history
+
+
+class SessionStore:
+    """Conversations keyed by ID, evicted LRU-style once idle or over capacity.
+
+    Only the admin's question and the model's generated query are kept as
+    history; result summaries are produced outside the conversation so their
+    raw-row payloads never get replayed to Gemini.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_seconds: float = 1800,
+                 max_turns: int = 6, max_tokens: int = 4000, shared=None):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        # With a SharedStore, every worker process sees the same conversations
+        self.shared = shared is not None
+        if self.shared:
+            self._sessions = shared.cache("sessions", maxsize=max_sessions, ttl=idle_seconds, sliding=True)
+        else:
+            self._sessions = TTLCache(maxsize=max_sessions, ttl=idle_seconds, sliding=True)
+
+    async def get(self, conversation_id: Optional[str]) -> Conversation:
+        """Return the conversation for `conversation_id`, starting a new one if needed"""
+        conversation = await self.find(conversation_id)
+        if conversation is None:
+            conversation = Conversation(conversation_id or uuid.uuid4().hex, self.max_turns)
+            if self.shared:
+                await self.save(conversation)
+            else:
+                self._sessions.set(conversation.id, conversation)
+        return conversation
+
+    async def find(self, conversation_id: Optional[str]) -> Optional[Conversation]:
+        """The existing conversation for `conversation_id`, or None"""
+        if not conversation_id:
+            return None
+        conversation = await off_loop(self.shared, self._sessions.get, conversation_id)
+        if self.shared and conversation is not None:
+            conversation = self._load(conversation_id, conversation)
+        return conversation
+
+    async def save(self, conversation: Conversation) -> None:
+        """Share the conversation's turns with the other workers; in-process ones are already current"""
+        if self.shared:
+            await off_loop(self.shared, self._sessions.set, conversation.id, self._dump(conversation))
+
+    def _dump(self, conversation: Conversation) -> List[List[str]]:
+        return [list(turn) for turn in conversation.turns]
+
+    def _load(self, conversation_id: str, turns: List[List[str]]) -> Conversation:
+        conversation = Conversation(conversation_id, self.max_turns)
+        conversation.turns = [tuple(turn) for turn in turns]
+        return conversation
+
+    def history(self, conversation: Conversation) -> List[Dict[str, Any]]:
+        return conversation.window(self.max_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._sessions.stats()
@@ -0,0 +1,289 @@
+import asyncio
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import bson
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires REAL,
+    used REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_used ON entries (namespace, used);
+CREATE TABLE IF NOT EXISTS tags (
+    namespace TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (namespace, tag, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS generations (
+    namespace TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    PRIMARY KEY (namespace, tag)
+) WITHOUT ROWID;
+"""
+
+# Generation bumped by clear(), so it invalidates every tag at once
+ALL_TAGS = "*"
+
+
+def _encode_key(key: Hashable) -> str:
+    return json.dumps(key, separators=(",", ":"))
+
+
+async def off_loop(shared: bool, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """function(*args, **kwargs), in a worker thread when it uses a SharedStore.
+
+    Store calls are SQLite I/O that can wait up to busy_timeout for another
+    worker's write lock, which would stall every request on the event loop.
+    In-process caches aren't thread safe, so without a store it runs inline.
+    """
+    if shared:
+        return await asyncio.to_thread(function, *args, **kwargs)
+    return function(*args, **kwargs)
+
+
+class SharedStore:
+    """A SQLite file every worker process opens, for state they all need to see.
+
+    WAL mode lets readers run alongside a writer, and synchronous=NORMAL
+    skips the fsync on each commit (the store is a cache, so losing the
+    last writes in a power cut is fine). Connections are opened lazily, per
+    process so the store can be created before forking workers, and per
+    thread so calls made through off_loop() don't share a transaction.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        # This process's connections, one per thread that has used the store
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        # name -> (pid, fd); a forked child doesn't inherit the lock
+        self._locks: Dict[str, Tuple[int, int]] = {}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # A connection inherited across fork must not be used by the child
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection, self._local.pid = connection, os.getpid()
+            with self._connections_lock:
+                if self._pid != os.getpid():
+                    self._connections, self._pid = [], os.getpid()
+                self._connections.append(connection)
+        return connection
+
+    def initialize(self) -> None:
+        """Create the file and tables, then close, leaving nothing open to inherit"""
+        self.connection
+        self.close()
+
+    def close(self) -> None:
+        with self._connections_lock:
+            if self._pid == os.getpid():
+                for connection in self._connections:
+                    connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def cache(self, namespace: str, maxsize: int = 1024, ttl: Optional[float] = None,
+              sliding: bool = False) -> "SharedCache":
+        return SharedCache(self, namespace, maxsize=maxsize, ttl=ttl, sliding=sliding)
+
+    def lock(self, name: str) -> bool:
+        """Try to take a lock held for the life of this process. Only one process can hold it."""
+        if self._locks.get(name, (None, None))[0] == os.getpid():
+            return True
+        fd = os.open(f"{self.path}.{name}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._locks[name] = (os.getpid(), fd)
+        return True
+
+
+class SharedCache:
+    """TTLCache's interface over one namespace of a SharedStore.
+
+    Values are stored as BSON, so result rows keep their ObjectIds and
+    dates. Expiry uses wall-clock time since it is compared across
+    processes; least recently used entries beyond `maxsize` are evicted on
+    write. Reads don't write: the keys this process has read are marked used
+    by its next set(), except in a sliding namespace, where each read has to
+    push the expiry forward for every worker. Hit and miss counts, and the
+    size as of this process's last write, are for this process only.
+    """
+
+    def __init__(self, store: SharedStore, namespace: str, maxsize: int = 1024, ttl: Optional[float] = None,
+                 sliding: bool = False):
+        self.store = store
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size: Optional[int] = None
+        # encoded key -> when this process last read it, not yet written to `used`
+        self._reads: Dict[str, float] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        db, encoded, now = self.store.connection, _encode_key(key), time.time()
+        row = db.execute("SELECT value, expires FROM entries WHERE namespace = ? AND key = ?",
+                         (self.namespace, encoded)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            if row is not None:
+                self.pop(key)
+            self.misses += 1
+            return default
+        if self.sliding and self.ttl is not None:
+            db.execute("UPDATE entries SET used = ?, expires = ? WHERE namespace = ? AND key = ?",
+                       (now, now + self.ttl, self.namespace, encoded))
+        else:
+            self._reads[encoded] = now
+        self.hits += 1
+        return bson.decode(row[0])["v"]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, tags: Iterable[str] = (),
+            generations: Optional[Dict[str, int]] = None) -> bool:
+        """Store `value`, labelled with `tags` so pop_tagged can drop it.
+
+        With `generations` (from generations() before the value was
+        computed), nothing is stored if any of those tags was popped since,
+        and False is returned. The check, the entry and its tags are one
+        transaction, so a concurrent pop_tagged can't miss the entry.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        encoded = _encode_key(key)
+        db = self.store.connection
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if generations is not None and self.generations(generations) != generations:
+                db.execute("ROLLBACK")
+                return False
+            db.execute("INSERT OR REPLACE INTO entries (namespace, key, value, expires, used) VALUES (?, ?, ?, ?, ?)",
+                       (self.namespace, encoded, bson.encode({"v": value}),
+                        now + ttl if ttl is not None else None, now))
+            db.executemany("INSERT OR IGNORE INTO tags (namespace, tag, key) VALUES (?, ?, ?)",
+                           [(self.namespace, tag, encoded) for tag in tags])
+            reads, self._reads = self._reads, {}
+            db.executemany("UPDATE entries SET used = MAX(used, ?) WHERE namespace = ? AND key = ?",
+                           [(used, self.namespace, read) for read, used in reads.items() if read != encoded])
+            db.execute("COMMIT")
+        except sqlite3.Error:
+            db.execute("ROLLBACK")
+            raise
+        self._evict(now)
+        return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        db, encoded = self.store.connection, _encode_key(key)
+        row = db.execute("SELECT value FROM entries WHERE namespace = ? AND key = ?",
+                         (self.namespace, encoded)).fetchone()
+        db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, encoded))
+        db.execute("DELETE FROM tags WHERE namespace = ? AND key = ?", (self.namespace, encoded))
+        return default if row is None else bson.decode(row[0])["v"]
+
+    def clear(self) -> None:
+        db = self.store.connection
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+            db.execute("DELETE FROM tags WHERE namespace = ?", (self.namespace,))
+            self._bump(ALL_TAGS)
+            db.execute("COMMIT")
+        except sqlite3.Error:
+            db.execute("ROLLBACK")
+            raise
+        self._reads.clear()
+        self.size = 0
+
+    def generations(self, tags: Iterable[str]) -> Dict[str, int]:
+        """How many times each tag (and the whole namespace, as ALL_TAGS) has been popped"""
+        wanted = set(tags) | {ALL_TAGS}
+        current = dict.fromkeys(wanted, 0)
+        placeholders = ",".join("?" * len(wanted))
+        current.update(self.store.connection.execute(
+            f"SELECT tag, generation FROM generations WHERE namespace = ? AND tag IN ({placeholders})",
+            (self.namespace, *wanted)).fetchall())
+        return current
+
+    def pop_tagged(self, tag: str) -> None:
+        db = self.store.connection
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM entries WHERE namespace = ? AND key IN "
+                       "(SELECT key FROM tags WHERE namespace = ? AND tag = ?)", (self.namespace, self.namespace, tag))
+            db.execute("DELETE FROM tags WHERE namespace = ? AND tag = ?", (self.namespace, tag))
+            self._bump(tag)
+            db.execute("COMMIT")
+        except sqlite3.Error:
+            db.execute("ROLLBACK")
+            raise
+
+    def _bump(self, tag: str) -> None:
+        self.store.connection.execute(
+            "INSERT INTO generations (namespace, tag, generation) VALUES (?, ?, 1) "
+            "ON CONFLICT (namespace, tag) DO UPDATE SET generation = generation + 1", (self.namespace, tag))
+
+    def _evict(self, now: float) -> None:
+        db = self.store.connection
+        expired = db.execute("DELETE FROM entries WHERE namespace = ? AND expires <= ?", (self.namespace, now))
+        overflow = db.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key IN (SELECT key FROM entries WHERE namespace = ? "
+            "ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.namespace, self.namespace, self.maxsize))
+        removed = max(expired.rowcount, 0) + max(overflow.rowcount, 0)
+        if removed:
+            self.evictions += removed
+            db.execute("DELETE FROM tags WHERE namespace = ? AND key NOT IN "
+                       "(SELECT key FROM entries WHERE namespace = ?)", (self.namespace, self.namespace))
+        self.size = len(self)
+
+    def values(self) -> List[Any]:
+        """Every unexpired value, without counting as a use of them"""
+        rows = self.store.connection.execute(
+            "SELECT value FROM entries WHERE namespace = ? AND (expires IS NULL OR expires > ?)",
+            (self.namespace, time.time())).fetchall()
+        return [bson.decode(row[0])["v"] for row in rows]
+
+    def __contains__(self, key: Hashable) -> bool:
+        row = self.store.connection.execute(
+            "SELECT 1 FROM entries WHERE namespace = ? AND key = ? AND (expires IS NULL OR expires > ?)",
+            (self.namespace, _encode_key(key), time.time())).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self.store.connection.execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "shared": self.store.path,
+        }
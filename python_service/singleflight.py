@@ -0,0 +1,79 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs one execution per key at a time and shares its result with concurrent callers.
+
+    The first caller for a key runs `func`; callers arriving while it is in
+    flight wait for the same result (or exception) instead of repeating the
+    work. At most `max_waiters` callers share one flight, beyond that they
+    run on their own. Waiters give up after `timeout` seconds with a
+    TimeoutError. If the leading caller is cancelled (e.g. its client went
+    away) its waiters run the work themselves.
+    """
+
+    def __init__(self, max_waiters: int = 100, timeout: float = 60):
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.overflow = 0
+        self.timeouts = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is not None:
+            if flight.waiters >= self.max_waiters:
+                self.overflow += 1
+                return await func()
+            return await self._wait(flight, func)
+
+        flight = _Flight(asyncio.get_running_loop().create_future())
+        self._flights[key] = flight
+        self.leaders += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            flight.future.cancel()
+            raise
+        except Exception as e:
+            flight.future.set_exception(e)
+            # Mark it retrieved so an unshared failure doesn't log a warning
+            flight.future.exception()
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+
+    async def _wait(self, flight: _Flight, func: Callable[[], Awaitable[Any]]) -> Any:
+        flight.waiters += 1
+        self.shared += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"Timed out after {self.timeout}s waiting for an identical request")
+        except asyncio.CancelledError:
+            if not flight.future.cancelled():
+                raise
+            # The leader was cancelled, not us
+            return await func()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "overflow": self.overflow,
+            "timeouts": self.timeouts,
+        }
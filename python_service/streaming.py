@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict
+
+from python_service.encoding import dumps
+
+# An SSE comment line: ignored by clients, but the write notices one that has gone away
+SSE_KEEPALIVE = ": keepalive\n\n"
+
+
+def ndjson_line(payload: Dict[str, Any]) -> str:
+    return dumps(payload, separators=(",", ":")) + "\n"
+
+
+def sse_event(event: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {dumps(payload, separators=(',', ':'))}\n\n"
+
+
+async def with_keepalive(events: AsyncIterator[str], interval: float) -> AsyncIterator[str]:
+    """Relay `events`, writing SSE_KEEPALIVE whenever nothing was sent for `interval` seconds.
+
+    Each step of `events` runs as its own task, so when the consumer stops
+    (the client disconnected and the response was cancelled or closed) the
+    step in progress is cancelled too, along with whatever it was awaiting.
+    """
+    iterator = events.__aiter__()
+    step = None
+    try:
+        while True:
+            if step is None:
+                step = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({step}, timeout=interval)
+            if not done:
+                yield SSE_KEEPALIVE
+                continue
+            finished, step = step, None
+            try:
+                item = finished.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if step is not None:
+            step.cancel()
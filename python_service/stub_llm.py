@@ -0,0 +1,142 @@
+"""Deterministic stand-in for the Gemini models, for offline benchmarks.
+
+Questions are matched against the canonical examples (the same patterns
+the system prompt teaches) by their parameterised template, so names and
+months in the question are carried into the returned pipeline. Anything
+unrecognised gets a conversational reply. Enable with
+CHAT_LLM_BACKEND=stub; STUB_LLM_LATENCY_MS adds a fixed delay per call to
+stand in for the network round-trip. STUB_LLM_FAULTS gives individual
+models their own latency and error rate, e.g.
+{"gemini-2.5-flash": {"latency_ms": 4000, "error_rate": 0.2}}, to exercise
+hedging and failover.
+"""
+import asyncio
+import json
+import random
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from python_service.examples import EXAMPLES
+from python_service.pipeline_cache import extract_parameters, normalize_question
+from python_service.sessions import estimate_tokens
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Below this word overlap with every example, the question isn't a query
+MIN_SIMILARITY = 0.3
+
+
+class StubModelError(Exception):
+    pass
+
+
+def _substitute(value: Any, replacements: Dict[str, str]) -> Any:
+    """Replace whole strings and dates in one pass, so swapped values can't collide"""
+    if isinstance(value, str):
+        if value in replacements:
+            return replacements[value]
+        return DATE_PATTERN.sub(lambda m: replacements.get(m.group(0), m.group(0)), value)
+    if isinstance(value, dict):
+        return {k: _substitute(v, replacements) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute(v, replacements) for v in value]
+    return value
+
+
+def _example_dates(pipeline: Any) -> List[str]:
+    return sorted(set(DATE_PATTERN.findall(json.dumps(pipeline))))
+
+
+def _words(text: str) -> set:
+    return set(normalize_question(text).split())
+
+
+class _Response:
+    def __init__(self, prompt: str, text: str):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=estimate_tokens(prompt),
+            candidates_token_count=estimate_tokens(text),
+        )
+
+
+class _StreamResponse(_Response):
+    """Async-iterable like a streamed Gemini response, yielding the text a few words at a time"""
+
+    def __init__(self, prompt: str, text: str, token_delay: float):
+        super().__init__(prompt, text)
+        self.token_delay = token_delay
+
+    async def __aiter__(self):
+        words = self.text.split(" ")
+        for start in range(0, len(words), 3):
+            if start and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            chunk = " ".join(words[start:start + 3])
+            yield SimpleNamespace(text=chunk if start + 3 >= len(words) else chunk + " ")
+
+
+class StubChat:
+    def __init__(self, model: "StubModel", history: Optional[List[Dict[str, Any]]] = None):
+        self.model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, message: str, **kwargs):
+        await self.model.delay()
+        return _Response(message, self.model.reply(message))
+
+
+class StubModel:
+    """Implements the parts of genai.GenerativeModel the service calls"""
+
+    def __init__(self, latency: float = 0.0, examples: Optional[List[Dict[str, Any]]] = None,
+                 model_name: str = "stub", error_rate: float = 0.0):
+        self.latency = latency
+        self.model_name = model_name
+        self.error_rate = error_rate
+        self.examples = []
+        for example in examples or EXAMPLES:
+            template, params = extract_parameters(example["question"])
+            self.examples.append((template, params, example))
+
+    async def delay(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubModelError(f"{self.model_name}: injected failure")
+
+    def start_chat(self, history: Optional[List[Dict[str, Any]]] = None) -> StubChat:
+        return StubChat(self, history)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        await self.delay()
+        text = "Here is a summary of the results."
+        if stream:
+            return _StreamResponse(prompt, text, token_delay=self.latency / 10)
+        return _Response(prompt, text)
+
+    def reply(self, question: str) -> str:
+        template, params = extract_parameters(question)
+        match = next((entry for entry in self.examples if entry[0] == template), None)
+        if match is None:
+            words = _words(template)
+            scored = [(len(words & _words(t)) / len(words | _words(t)), (t, p, e))
+                      for t, p, e in self.examples if words | _words(t)]
+            score, match = max(scored, key=lambda item: item[0], default=(0, None))
+            if score < MIN_SIMILARITY:
+                return json.dumps({"type": "conversation",
+                                   "message": "I can help you query accounts, transactions, loans and EMIs."})
+
+        _, example_params, example = match
+        replacements: Dict[str, str] = {}
+        for key, value in example_params.items():
+            if key.startswith("name_") and key in params:
+                replacements[value] = params[key]
+        if "month" in params:
+            dates = _example_dates(example["pipeline"])
+            if len(dates) == 2:
+                replacements[dates[0]] = params["month"][0].isoformat()
+                replacements[dates[1]] = params["month"][1].isoformat()
+        pipeline = _substitute(example["pipeline"], replacements)
+        return json.dumps({"collection": example["collection"], "pipeline": pipeline})
@@ -0,0 +1,223 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bson import Decimal128
+
+# Low-cardinality fields worth a per-value breakdown
+BREAKDOWN_FIELDS = ("type", "status")
+# Fields the breakdowns total up, in order of preference
+AMOUNT_FIELDS = ("amount", "balance")
+
+# Field names ending in an amount word: totalBalance, amountPaid, emiAmount, total (not emiNumber or interestRate)
+MONEY_FIELD_PATTERN = re.compile(r"(?:amount|balance|total|payable|paid)$", re.IGNORECASE)
+
+# Questions that want interpretation rather than numbers
+PROSE_PATTERN = re.compile(
+    r"\b(why|explain|insights?|patterns?|trends?|compare|comparison|analy[sz]e|analysis|"
+    r"recommend|suggest|describe|unusual|anomal\w*|should|opinion|advice)\b",
+    re.IGNORECASE,
+)
+
+
+def needs_prose(question: str) -> bool:
+    return bool(PROSE_PATTERN.search(question))
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    return np.nan
+
+
+def _month(value: Any) -> str:
+    return f"{value.year:04d}-{value.month:02d}" if isinstance(value, datetime) else "unknown"
+
+
+class SummaryAccumulator:
+    """Exact result statistics built batch by batch over NumPy columns.
+
+    Tracks count, per numeric field count/sum/min/max, and counts plus
+    amount totals by `type`, `status` and `createdAt` month. Memory is
+    proportional to the number of distinct breakdown values, not rows.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.numeric: Dict[str, Dict[str, float]] = {}
+        self.breakdowns: Dict[str, Dict[str, List[float]]] = {}
+        self.currencies: set = set()
+
+    def add_batch(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        size = len(rows)
+        self.count += size
+        fields = set().union(*(row.keys() for row in rows))
+
+        amounts = None
+        for field in sorted(fields):
+            values = np.fromiter((_number(row.get(field)) for row in rows), dtype=float, count=size)
+            present = values[~np.isnan(values)]
+            if present.size == 0:
+                continue
+            stats = self.numeric.setdefault(field, {"count": 0, "sum": 0.0, "min": np.inf, "max": -np.inf})
+            stats["count"] += int(present.size)
+            stats["sum"] += float(present.sum())
+            stats["min"] = min(stats["min"], float(present.min()))
+            stats["max"] = max(stats["max"], float(present.max()))
+            if amounts is None and field in AMOUNT_FIELDS:
+                amounts = np.nan_to_num(values)
+        if amounts is None:
+            amounts = np.zeros(size)
+
+        keyed = {field: [str(row.get(field)) if row.get(field) is not None else "unknown" for row in rows]
+                 for field in BREAKDOWN_FIELDS if field in fields}
+        if "createdAt" in fields:
+            keyed["month"] = [_month(row.get("createdAt")) for row in rows]
+        for field, keys in keyed.items():
+            uniques, inverse = np.unique(np.array(keys, dtype=str), return_inverse=True)
+            counts = np.bincount(inverse, minlength=uniques.size)
+            sums = np.bincount(inverse, weights=amounts, minlength=uniques.size)
+            breakdown = self.breakdowns.setdefault(field, {})
+            for key, count, total in zip(uniques.tolist(), counts.tolist(), sums.tolist()):
+                entry = breakdown.setdefault(key, [0, 0.0])
+                entry[0] += count
+                entry[1] += total
+
+        self.currencies.update(row["currency"] for row in rows if isinstance(row.get("currency"), str))
+
+    def result(self, partial: bool = False) -> Dict[str, Any]:
+        numeric = {
+            field: {**stats, "mean": stats["sum"] / stats["count"]}
+            for field, stats in self.numeric.items()
+        }
+        return {
+            "count": self.count,
+            "partial": partial,
+            "numeric": numeric,
+            "breakdowns": {
+                field: {key: {"count": entry[0], "amount": entry[1]} for key, entry in sorted(values.items())}
+                for field, values in self.breakdowns.items()
+            },
+            "currency": next(iter(self.currencies)) if len(self.currencies) == 1 else None,
+        }
+
+
+def summarize_rows(rows: List[Dict[str, Any]], partial: bool = False) -> Dict[str, Any]:
+    accumulator = SummaryAccumulator()
+    accumulator.add_batch(rows)
+    return accumulator.result(partial)
+
+
+def stats_pipeline(pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """`pipeline` followed by a $facet computing the same statistics server-side.
+
+    Used when the rows span several pages, so totals still cover every row.
+    """
+    totals: Dict[str, Any] = {"_id": None, "count": {"$sum": 1}}
+    for field in AMOUNT_FIELDS:
+        is_number = {"$isNumber": f"${field}"}
+        totals[f"{field}__count"] = {"$sum": {"$cond": [is_number, 1, 0]}}
+        totals[f"{field}__sum"] = {"$sum": f"${field}"}
+        totals[f"{field}__min"] = {"$min": {"$cond": [is_number, f"${field}", None]}}
+        totals[f"{field}__max"] = {"$max": {"$cond": [is_number, f"${field}", None]}}
+    amount = {"$ifNull": ["$amount", {"$ifNull": ["$balance", 0]}]}
+    facets: Dict[str, Any] = {"totals": [{"$group": totals}]}
+    for field in BREAKDOWN_FIELDS:
+        facets[field] = [{"$group": {"_id": f"${field}", "count": {"$sum": 1}, "amount": {"$sum": amount}}}]
+    facets["month"] = [
+        {"$match": {"createdAt": {"$type": "date"}}},
+        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m", "date": "$createdAt"}},
+                    "count": {"$sum": 1}, "amount": {"$sum": amount}}},
+    ]
+    return list(pipeline) + [{"$facet": facets}]
+
+
+def stats_from_facet(doc: Dict[str, Any], partial: bool = False) -> Dict[str, Any]:
+    totals = (doc.get("totals") or [{}])[0]
+    numeric = {}
+    for field in AMOUNT_FIELDS:
+        count = totals.get(f"{field}__count", 0)
+        if count:
+            total = _number(totals[f"{field}__sum"])
+            numeric[field] = {
+                "count": count,
+                "sum": total,
+                "min": _number(totals[f"{field}__min"]),
+                "max": _number(totals[f"{field}__max"]),
+                "mean": total / count,
+            }
+    breakdowns = {}
+    for field in BREAKDOWN_FIELDS + ("month",):
+        groups = doc.get(field) or []
+        if any(g["_id"] is not None for g in groups):
+            breakdowns[field] = {
+                str(g["_id"]) if g["_id"] is not None else "unknown": {"count": g["count"], "amount": _number(g["amount"])}
+                for g in sorted(groups, key=lambda g: str(g["_id"]))
+            }
+    return {"count": totals.get("count", 0), "partial": partial, "numeric": numeric,
+            "breakdowns": breakdowns, "currency": None}
+
+
+def _money(value: float, currency: Optional[str]) -> str:
+    text = f"{value:,.2f}"
+    return f"{currency} {text}" if currency else text
+
+
+def render_summary(stats: Dict[str, Any], rows: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Plain-text answer built only from computed statistics"""
+    count = stats["count"]
+    currency = stats.get("currency")
+    qualifier = "at least " if stats.get("partial") else ""
+    lines = [f"Found {qualifier}{count:,} record{'s' if count != 1 else ''}."]
+
+    # A single row (e.g. a $group total or a profile lookup) reads better field by field
+    if count == 1 and rows:
+        row = rows[0]
+        details = []
+        for key, value in row.items():
+            if key == "_id" and (value is None or not isinstance(value, (str, int, float))):
+                continue
+            number = _number(value)
+            if not np.isnan(number):
+                if MONEY_FIELD_PATTERN.search(key):
+                    text = _money(number, currency)
+                elif float(number).is_integer():
+                    # Counts, years, months and EMI numbers: no thousands separator ("year: 2025")
+                    text = str(int(number))
+                else:
+                    text = f"{number:,.10g}"
+                details.append(f"{key}: {text}")
+            elif isinstance(value, datetime):
+                details.append(f"{key}: {value:%B %d, %Y}")
+            else:
+                details.append(f"{key}: {value}")
+        if details:
+            lines.append("; ".join(details) + ".")
+        return "\n".join(lines)
+
+    for field in AMOUNT_FIELDS:
+        numbers = stats["numeric"].get(field)
+        if numbers:
+            lines.append(
+                f"Total {field}: {_money(numbers['sum'], currency)} "
+                f"(min {_money(numbers['min'], currency)}, max {_money(numbers['max'], currency)}, "
+                f"average {_money(numbers['mean'], currency)})."
+            )
+    for field, title in (("type", "By type"), ("status", "By status"), ("month", "By month")):
+        groups = stats["breakdowns"].get(field)
+        if groups:
+            parts = []
+            for key, group in groups.items():
+                part = f"{key} {group['count']:,}"
+                if group["amount"]:
+                    part += f" ({_money(group['amount'], currency)})"
+                parts.append(part)
+            lines.append(f"{title}: " + ", ".join(parts) + ".")
+    return "\n".join(lines)
@@ -0,0 +1,71 @@
+"""Checks the audit log: records written in batches, dropped instead of queued without bound, files rotated.
+
+Needs no database: run python test_audit.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service.audit import AuditLog, FileSink, note
+from python_service.metrics import STAGE_SECONDS
+
+PIPELINE = [{"$match": {"type": "deposit"}}]
+
+
+class SlowSink:
+    def __init__(self):
+        self.batches = []
+
+    async def write(self, records):
+        await asyncio.sleep(0.05)
+        self.batches.append(records)
+
+    def describe(self):
+        return "slow"
+
+
+async def main():
+    sink = SlowSink()
+    log = AuditLog(sink, maxsize=5, batch_size=3, linger=0.01)
+    writer = asyncio.create_task(log.run())
+
+    record = log.start("chat", "Show deposits", "c1")
+    with STAGE_SECONDS.time(stage="aggregate"):
+        await asyncio.sleep(0.01)
+    record.query("transactions", PIPELINE, "intent")
+    note("route", "transactions totals -> rollup_transactions_daily")
+    record.finish("ok", rows=4)
+    await asyncio.sleep(0.1)
+    entry = sink.batches[0][0]
+    assert entry["status"] == "ok" and entry["rows"] == 4 and entry["stages_ms"]["aggregate"] >= 10
+    assert "pipeline" in entry and entry["route"] == ["transactions totals -> rollup_transactions_daily"]
+    again = log.start("chat", "Show deposits", "c1")
+    again.query("transactions", PIPELINE, "intent")
+    assert again.fields["pipeline"] == entry["pipeline"] and again.fields["pipeline_hash"] == entry["pipeline_hash"]
+    print("✓ One record per request with stage timings and notes; every one spells out its pipeline")
+
+    for i in range(20):
+        log.record({"n": i})
+    assert log.dropped == 15
+    writer.cancel()
+    await asyncio.gather(writer, return_exceptions=True)
+    assert log.written == 6 and max(len(batch) for batch in sink.batches) == 3
+    print("✓ A full queue drops records instead of blocking; what was queued is flushed on shutdown")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "audit.jsonl")
+        files = FileSink(path, max_bytes=200, backups=2)
+        for i in range(6):
+            await files.write([{"n": i, "padding": "x" * 60}])
+        assert sorted(os.listdir(directory)) == ["audit.jsonl", "audit.jsonl.1", "audit.jsonl.2", "audit.jsonl.lock"]
+        with open(path) as f:
+            assert json.loads(f.readlines()[-1])["n"] == 5
+    print("✓ Files rotate past max_bytes, keeping `backups` old ones")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""Checks when batching.fuse combines pipelines into one $facet, and how.
+
+Needs no database: run python test_batching.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service.batching import fuse, split
+
+DEPOSITS = [{"$match": {"type": "deposit"}}, {"$limit": 101}]
+WITHDRAWALS = [{"$match": {"type": "withdrawal"}}, {"$sort": {"createdAt": -1}}, {"$limit": 101}]
+RECENT = [{"$sort": {"createdAt": -1}}, {"$limit": 101}]
+
+
+def main():
+    # Different filters: an $or of them narrows the shared read, each branch keeps its own
+    fused = fuse([DEPOSITS, WITHDRAWALS])
+    assert fused[0] == {"$match": {"$or": [DEPOSITS[0]["$match"], WITHDRAWALS[0]["$match"]]}}
+    assert fused[1]["$facet"] == {"q0": DEPOSITS, "q1": WITHDRAWALS}
+    print("✓ Leading $match stages combined into an $or in front of the $facet")
+
+    # A shared first stage is hoisted out of the branches
+    counted = [DEPOSITS[0], {"$count": "total"}]
+    fused = fuse([DEPOSITS, counted])
+    assert fused == [DEPOSITS[0], {"$facet": {"q0": [{"$limit": 101}], "q1": [{"$count": "total"}]}}]
+    print("✓ Common prefix runs once before the $facet")
+
+    # A shared $sort is hoisted but doesn't narrow the read: still a full scan
+    last_5 = [{"$sort": {"createdAt": -1}}, {"$limit": 5}]
+    last_10 = [{"$sort": {"createdAt": -1}}, {"$limit": 10}]
+    assert fuse([last_5, last_10]) is None
+    assert fuse([last_5, last_10], allow_scan=True) == [
+        {"$sort": {"createdAt": -1}}, {"$facet": {"q0": [{"$limit": 5}], "q1": [{"$limit": 10}]}}]
+    limited = [{"$sort": {"createdAt": -1}}, {"$limit": 50}]
+    assert fuse([limited + [{"$count": "n"}], limited + [{"$skip": 10}]]) is not None
+    print("✓ A hoisted prefix skips the scan check only when it starts with $match or has a $limit")
+
+    # Nothing to narrow the read with: only fused when a full scan is acceptable
+    assert fuse([RECENT, DEPOSITS]) is None
+    assert fuse([RECENT, DEPOSITS], allow_scan=True) == [{"$facet": {"q0": RECENT, "q1": DEPOSITS}}]
+    print("✓ Unfiltered pipelines fused only when the collection may be scanned")
+
+    # Stages not allowed inside $facet
+    assert fuse([DEPOSITS, [{"$match": {}}, {"$out": "copy"}]], allow_scan=True) is None
+    assert fuse([DEPOSITS], allow_scan=True) is None
+    print("✓ $out and single pipelines left alone")
+
+    assert split([{"q0": [{"n": 1}], "q1": []}], 3) == [[{"n": 1}], [], []]
+    assert split([], 2) == [[], []]
+    print("✓ Fused output split back per pipeline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Checks how export writes documents as CSV and, when pyarrow is installed, Arrow and Parquet.
+
+Needs no database: run python test_export.py
+"""
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import Decimal128, ObjectId
+
+from python_service import export
+
+ROWS = [
+    {"_id": ObjectId(), "amount": Decimal128("12.50"), "createdAt": datetime(2024, 5, 1, 9, 30), "type": "deposit"},
+    {"_id": ObjectId(), "amount": 7, "createdAt": datetime(2024, 5, 2), "type": 'fee, "monthly"'},
+    # Only in the second batch: a new field, and an amount that isn't a number
+    {"_id": ObjectId(), "amount": "n/a", "createdAt": datetime(2024, 5, 3), "type": "fee", "meta": {"a": 1}},
+]
+
+
+def write(fmt: str) -> bytes:
+    writer = export.exporter(fmt, ROWS[:1])
+    return writer.start() + writer.write(ROWS[:1]) + writer.write(ROWS[1:]) + writer.finish()
+
+
+def main():
+    lines = list(csv.reader(io.StringIO(write("csv").decode())))
+    assert lines[0] == ["_id", "amount", "createdAt", "type", "_extra"]
+    assert lines[1] == [str(ROWS[0]["_id"]), "12.50", "2024-05-01T09:30:00Z", "deposit", ""]
+    assert lines[2][3] == 'fee, "monthly"'
+    print("✓ CSV columns come from the first batch; ids, decimals and dates written as text")
+    assert lines[3][1] == "n/a" and json.loads(lines[3][4]) == {"meta": {"a": 1}}
+    print("✓ CSV fields first seen in a later batch kept as JSON in _extra")
+
+    if not export.available("parquet"):
+        print("- pyarrow not installed, skipping Arrow and Parquet")
+        return
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    writer = export.exporter("arrow", ROWS[:1])
+    table = pa.ipc.open_stream(writer.start() + writer.write(ROWS[:1]) + writer.write(ROWS[1:]) + writer.finish()).read_all()
+    assert [str(t) for t in table.schema.types] == ["string", "double", "timestamp[ms, tz=UTC]", "string", "string"]
+    assert table.column("amount").to_pylist() == [12.5, 7.0, None]
+    print("✓ Arrow columns typed: ids as strings, amounts as doubles, dates as UTC timestamps")
+    assert json.loads(table.column("_extra")[2].as_py()) == {"amount": "n/a", "meta": {"a": 1}}
+    assert writer.overflow.stats() == {"overflow_rows": 1, "new_fields": ["meta"], "type_mismatches": 1}
+    print("✓ New fields and values that don't fit their column kept in _extra and counted")
+
+    table = pa.parquet.read_table(io.BytesIO(write("parquet")))
+    assert table.num_rows == 3 and table.column("_id")[1].as_py() == str(ROWS[1]["_id"])
+    print("✓ Parquet written in pieces still reads back whole")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Checks ModelPool hedging, failover and circuit breaking against fake model backends.
+
+Needs no network or API key: run python test_model_pool.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service.model_pool import CLOSED, OPEN, CircuitBreaker, ModelPool, ModelUnavailable
+
+
+class FakeBackend:
+    """Answers after `latency` seconds, or raises while `failing`"""
+
+    def __init__(self, latency: float = 0.01, failing: bool = False):
+        self.latency = latency
+        self.failing = failing
+        self.calls = 0
+
+    async def __call__(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.failing:
+            raise ConnectionError("backend unavailable")
+        return prompt
+
+
+def pool_for(backends, **kwargs):
+    pool = ModelPool(list(backends), **kwargs)
+    return pool, lambda prompt: pool.run(lambda name: backends[name](prompt))
+
+
+async def main():
+    # A slow preferred model is hedged to the backup after hedge_max
+    backends = {"primary": FakeBackend(latency=1.0), "backup": FakeBackend(latency=0.01)}
+    pool, ask = pool_for(backends, hedge_min=0.05, hedge_max=0.1)
+    started = time.perf_counter()
+    assert await ask("hi") == "hi"
+    elapsed = time.perf_counter() - started
+    assert elapsed < 0.5, f"hedged call took {elapsed:.2f}s"
+    assert pool.hedged == 1 and pool.backup_answers == 1
+    print(f"✓ Slow model hedged to the backup, answered in {elapsed * 1000:.0f} ms")
+
+    # Once there are enough samples the hedge delay follows the rolling p95
+    backends = {"primary": FakeBackend(latency=0.02), "backup": FakeBackend(latency=0.02)}
+    pool, ask = pool_for(backends, hedge_min=0.01, hedge_max=5)
+    for _ in range(25):
+        await ask("hi")
+    delay = pool.hedge_delay("primary")
+    assert 0.01 <= delay < 0.5, delay
+    print(f"✓ Hedge delay adapts to rolling latency ({delay * 1000:.0f} ms)")
+
+    # A failing model fails over at once and its breaker opens after repeated failures
+    backends = {"primary": FakeBackend(failing=True), "backup": FakeBackend()}
+    pool, ask = pool_for(backends, breaker=lambda: CircuitBreaker(consecutive_failures=3, open_seconds=0.3))
+    for _ in range(3):
+        assert await ask("hi") == "hi"
+    assert pool.breakers["primary"].state == OPEN
+    for _ in range(5):
+        await ask("hi")
+    assert backends["primary"].calls == 3, "open breaker should keep calls away"
+    print("✓ Failing model skipped once its circuit breaker opened")
+
+    # After open_seconds one trial call goes through; success closes the breaker
+    backends["primary"].failing = False
+    await asyncio.sleep(0.35)
+    assert await ask("hi") == "hi"
+    assert pool.breakers["primary"].state == CLOSED and backends["primary"].calls == 4
+    print("✓ Breaker closed again after a successful trial call")
+
+    # Every breaker open: fail fast instead of waiting
+    backends = {"a": FakeBackend(failing=True), "b": FakeBackend(failing=True)}
+    pool, ask = pool_for(backends, breaker=lambda: CircuitBreaker(consecutive_failures=1, open_seconds=60))
+    try:
+        await ask("hi")
+    except ConnectionError:
+        pass
+    try:
+        await ask("hi")
+        raise AssertionError("expected ModelUnavailable")
+    except ModelUnavailable:
+        pass
+    print("✓ Calls fail fast while every model's breaker is open")
+
+    # No answer at all within the timeout
+    backends = {"a": FakeBackend(latency=5), "b": FakeBackend(latency=5)}
+    pool, ask = pool_for(backends, timeout=0.2, hedge_max=0.05)
+    started = time.perf_counter()
+    try:
+        await ask("hi")
+        raise AssertionError("expected TimeoutError")
+    except TimeoutError:
+        pass
+    assert time.perf_counter() - started < 0.5
+    print("✓ Calls give up at the pool timeout")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+"""Checks which questions share a PipelineCache entry.
+
+Needs no database: run python test_pipeline_cache.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from python_service.pipeline_cache import PipelineCache, normalize_question
+
+ABOVE = {"collection": "transactions", "pipeline": [{"$match": {"amount": {"$gt": 500}}}]}
+
+
+def by_customer(name):
+    return {"collection": "transactions", "pipeline": [
+        {"$match": {"userProfile.fullName": {"$regex": f"^{name}$", "$options": "i"},
+                    "type": {"$regex": "deposit|withdrawal"}}},
+    ]}
+
+
+async def main():
+    cache = PipelineCache()
+    await cache.store("Transactions with amount > 500", ABOVE)
+    assert await cache.lookup("transactions with amount > 500?") == ABOVE
+    assert await cache.lookup("Transactions with amount < 500") is None
+    assert await cache.lookup("Transactions with amount >= 500") is None
+    print("✓ Comparison symbols are part of the key: > and < questions don't share a query")
+
+    await cache.store("Transactions by Alice", by_customer("alice"))
+    assert await cache.lookup("Transactions by Bob") == by_customer("Bob")
+    cache = PipelineCache()
+    await cache.store("Transactions by Al", by_customer("Al"))
+    assert await cache.lookup("Transactions by Al") == by_customer("Al")
+    assert await cache.lookup("Transactions by Ed") is None
+    print("✓ Names templated as whole words only: a customer called Al doesn't rewrite \"withdrawal\"")
+
+    assert normalize_question("Balance -20") != normalize_question("Balance 20")
+    assert normalize_question("fees over 5%") != normalize_question("fees over 5")
+    print("✓ Negative numbers and percentages kept distinct")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Checks ResultCache invalidation against a local single-node replica set.
+
+Start one with:
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval "rs.initiate()"
+Then run: python test_result_cache.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import AsyncMongoClient
+
+from python_service.result_cache import ResultCache
+
+MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017/?replicaSet=rs0&directConnection=true")
+
+
+async def main():
+    client = AsyncMongoClient(MONGO_URI)
+    db = client["nexbank_result_cache_test"]
+    await db.accounts.delete_many({})
+    await db.accounts.insert_many([{"balance": 100}, {"balance": 250}])
+
+    cache = ResultCache(ttl=600, fallback_ttl=600)
+    watcher = asyncio.create_task(cache.watch(db))
+    for _ in range(50):
+        if cache.live:
+            break
+        await asyncio.sleep(0.1)
+    if not cache.live:
+        print("✗ Change stream did not open; is mongod running as a replica set?")
+        return
+
+    pipeline = [{"$group": {"_id": None, "totalBalance": {"$sum": "$balance"}}}]
+    lookup = [{"$lookup": {"from": "profiles", "localField": "userId", "foreignField": "clerkId", "as": "p"}}]
+    generation = await cache.generation("accounts", pipeline)
+    results = await (await db.accounts.aggregate(pipeline)).to_list()
+    await cache.set("accounts", pipeline, results, generation)
+    await cache.set("accounts", lookup, [], await cache.generation("accounts", lookup))
+    assert await cache.get("accounts", pipeline) == results
+
+    # A write to the joined collection drops only the $lookup pipeline
+    await db.profiles.insert_one({"clerkId": "user_1"})
+    await asyncio.sleep(1)
+    assert await cache.get("accounts", lookup) is None, "lookup result should be invalidated"
+    assert await cache.get("accounts", pipeline) == results, "unrelated result should survive"
+
+    await db.accounts.insert_one({"balance": 50})
+    await asyncio.sleep(1)
+    assert await cache.get("accounts", pipeline) is None, "cached total should be invalidated"
+    print("✓ Result cache invalidated by change stream")
+
+    generation = await cache.generation("accounts", pipeline)
+    await db.accounts.insert_one({"balance": 5})  # Lands while the total is being computed
+    await asyncio.sleep(1)
+    assert not await cache.set("accounts", pipeline, results, generation)
+    assert await cache.get("accounts", pipeline) is None
+    print("✓ A result computed across an invalidation isn't cached")
+
+    watcher.cancel()
+    await client.drop_database("nexbank_result_cache_test")
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Checks that pipelines routed to the rollups give the same answers as scanning the source.
+
+Needs a mongod (a replica set also exercises the change-stream path):
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval "rs.initiate()"
+Then run: python test_rollups.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import AsyncMongoClient
+
+from python_service.examples import DEPOSIT_FILTER, WITHDRAWAL_FILTER
+from python_service.rollups import RollupMaintainer, RollupPlanner
+
+MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017/?replicaSet=rs0&directConnection=true")
+
+DECEMBER = {"createdAt": {"$gte": datetime(2025, 12, 1), "$lt": datetime(2026, 1, 1)}}
+PIPELINES = [
+    [{"$match": {"$and": [DEPOSIT_FILTER, DECEMBER]}}, {"$group": {"_id": None, "total": {"$sum": "$amount"}}}],
+    [{"$match": WITHDRAWAL_FILTER},
+     {"$group": {"_id": {"$dateToString": {"format": "%Y-%m", "date": "$createdAt"}},
+                 "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}, {"$sort": {"_id": 1}}],
+    [{"$match": {"status": {"$in": ["completed", "pending"]}, "userId": "user_3"}},
+     {"$group": {"_id": "$type", "average": {"$avg": "$amount"}, "largest": {"$max": "$amount"}}}],
+]
+
+
+def same(a, b) -> bool:
+    key = lambda row: str(row.get("_id"))
+    round_row = lambda row: {k: round(v, 6) if isinstance(v, float) else v for k, v in row.items()}
+    return [round_row(r) for r in sorted(a, key=key)] == [round_row(r) for r in sorted(b, key=key)]
+
+
+async def main():
+    client = AsyncMongoClient(MONGO_URI)
+    db = client["nexbank_rollups_test"]
+    await db.transactions.delete_many({})
+    rng = random.Random(7)
+    now = datetime(2025, 12, 20)
+    await db.transactions.insert_many([
+        {"userId": f"user_{i % 10}", "amount": round(rng.uniform(1, 500), 2),
+         "type": rng.choice(["deposit", "credit", "debit", "withdrawal", "transfer"]),
+         "status": rng.choice(["completed", "pending", "failed"]),
+         "description": rng.choice(["Stripe deposit", "ATM", "rent"]),
+         "createdAt": now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))}
+        for i in range(20000)
+    ])
+
+    maintainer = RollupMaintainer(db, interval=0.5)
+    planner = RollupPlanner(maintainer)
+    runner = asyncio.create_task(maintainer.run())
+    for _ in range(100):
+        if maintainer.ready:
+            break
+        await asyncio.sleep(0.1)
+
+    for pipeline in PIPELINES:
+        started = time.perf_counter()
+        direct = await (await db.transactions.aggregate(pipeline)).to_list()
+        scanned = time.perf_counter() - started
+        name, routed_pipeline = planner.route("transactions", pipeline)
+        started = time.perf_counter()
+        routed = await (await db[name].aggregate(routed_pipeline)).to_list()
+        read = time.perf_counter() - started
+        assert same(direct, routed), f"{name} differs:\n{direct}\n{routed}"
+        print(f"✓ {name}: {scanned * 1000:.1f} ms scan, {read * 1000:.1f} ms rollup")
+
+    if maintainer.live:
+        await db.transactions.insert_one({"userId": "user_1", "amount": 1000, "type": "deposit",
+                                          "status": "completed", "createdAt": datetime(2025, 12, 5)})
+        await asyncio.sleep(1.5)
+        direct = await (await db.transactions.aggregate(PIPELINES[0])).to_list()
+        name, routed_pipeline = planner.route("transactions", PIPELINES[0])
+        assert same(direct, await (await db[name].aggregate(routed_pipeline)).to_list()), "insert not rolled up"
+        print("✓ Rollups refreshed from the change stream")
+
+    runner.cancel()
+    await client.drop_database("nexbank_rollups_test")
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
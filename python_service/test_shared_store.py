@@ -0,0 +1,111 @@
+"""Checks the SQLite store that serve.py workers share: expiry, eviction, tags, forks and the leader lock.
+
+Needs no database: run python test_shared_store.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+from python_service.metrics import Registry, WorkerMetrics
+from python_service.result_cache import ResultCache
+from python_service.shared_store import SharedStore
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        store = SharedStore(os.path.join(directory, "shared.sqlite3"))
+        store.initialize()
+
+        cache = store.cache("results", maxsize=2, ttl=60)
+        row = {"_id": ObjectId(), "createdAt": datetime(2024, 5, 1), "amount": 12.5}
+        cache.set(("transactions", "[]"), [row])
+        assert cache.get(("transactions", "[]")) == [row]
+        print("✓ Values keep their ObjectIds and dates")
+
+        cache.set("a", 1)
+        changes = store.connection.total_changes
+        cache.get(("transactions", "[]"))
+        assert store.connection.total_changes == changes
+        cache.set("b", 2)
+        assert "a" not in cache and len(cache) == 2
+        print("✓ Reads don't write; the next set() marks them used, evicting the least recently used")
+
+        cache.set("short", 1, ttl=0.05)
+        time.sleep(0.1)
+        assert cache.get("short") is None
+        print("✓ Entries expire after their TTL")
+
+        cache.clear()
+        cache.set("q1", 1, tags=["accounts", "users"])
+        cache.set("q2", 2, tags=["transactions"])
+        cache.pop_tagged("users")
+        assert "q1" not in cache and cache.get("q2") == 2
+        print("✓ pop_tagged drops only entries with that tag")
+
+        before = cache.generations(["users"])
+        cache.pop_tagged("users")  # Invalidated while the value was being computed
+        assert not cache.set("q3", 3, tags=["users"], generations=before) and "q3" not in cache
+        assert cache.set("q3", 3, tags=["users"], generations=cache.generations(["users"]))
+        before = cache.generations(["transactions"])
+        cache.clear()
+        assert not cache.set("q4", 4, tags=["transactions"], generations=before)
+        print("✓ Values computed across a pop_tagged or clear aren't stored")
+
+        results = ResultCache(maxsize=100, shared=store)
+
+        async def concurrently():
+            pipelines = [[{"$match": {"n": n}}] for n in range(20)]
+            generations = await asyncio.gather(*(results.generation("accounts", p) for p in pipelines))
+            await asyncio.gather(*(results.set("accounts", p, [{"n": n}], generation)
+                                   for n, (p, generation) in enumerate(zip(pipelines, generations))))
+            return await asyncio.gather(*(results.get("accounts", p) for p in pipelines))
+
+        assert asyncio.run(concurrently()) == [[{"n": n}] for n in range(20)]
+        print("✓ Store calls run concurrently off the event loop, each thread with its own connection")
+
+        sessions = store.cache("sessions", ttl=60, sliding=True)
+        pid = os.fork()
+        if pid == 0:
+            sessions.set("s1", {"turns": [["hi", "hello"]]})
+            os._exit(0 if store.lock("leader") else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        assert sessions.get("s1") == {"turns": [["hi", "hello"]]}
+        print("✓ Writes from a forked worker are visible to the others")
+
+        registry = Registry()
+        requests = registry.counter("requests_total", "Requests", ["mode"])
+        seconds = registry.histogram("request_seconds", "Seconds", buckets=(0.1, 1))
+        workers = WorkerMetrics(registry, store)
+        pid = os.fork()
+        if pid == 0:
+            requests.inc(2, mode="chat")
+            seconds.observe(0.5)
+            workers.publish()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        requests.inc(mode="chat")
+        seconds.observe(0.05)
+        text = asyncio.run(workers.render())
+        assert 'requests_total{mode="chat"} 3' in text and 'request_seconds_bucket{le="1"} 2' in text
+        print("✓ /metrics adds up the counts of every worker, exited ones included")
+
+        assert store.lock("leader")
+        pid = os.fork()
+        if pid == 0:
+            os._exit(1 if store.lock("leader") else 0)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        print("✓ Only one process holds the leader lock")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()